@@ -1,15 +1,107 @@
 import requests
-import json
+import asyncio
+import time
+import weakref
 from datetime import datetime
+from model_registry import SUPPORTED_MODELS, ModelRegistry
+from gmail_fetcher import email_body
+from ollama_client import AsyncOllamaClient, OllamaError, get_client
+from prompt_budget import PromptBudget, estimate_tokens, strip_quoted, truncate_tokens
+from response_cache import ResponseCache
+
+
+class TokenStream:
+    """Iterable of generated tokens; ``stats`` is filled in once the stream ends
+
+    Stats hold ``time_to_first_token`` and ``total_time`` in seconds, the
+    number of ``tokens`` and ``tokens_per_second``, plus Ollama's own
+    ``eval_count``/``eval_duration``/``prompt_eval_*`` counters when present.
+    Responses replayed from the cache set ``cached`` instead. A failed
+    generation sets ``error``; if it failed before its first token the stream
+    yields the fallback text, otherwise it ends early with ``partial`` set.
+    """
+
+    def __init__(self, produce):
+        self.stats = {}
+        self._tokens = produce(self.stats)
+
+    def __iter__(self):
+        return self._tokens
+
+    def text(self):
+        """Drain the stream and return the joined text"""
+        return "".join(self).strip()
+
 
 class AIAgent:
     DEFAULT_MODEL = "llama2:7b"
+    SUPPORTED_MODELS = SUPPORTED_MODELS
+    
+    # Generation options per task; num_predict caps the generated tokens
+    REPLY_OPTIONS = {"temperature": 0.7, "top_p": 0.9, "num_predict": 500}
+    SUMMARY_OPTIONS = {"temperature": 0.3, "num_predict": 200}
+    ACTION_OPTIONS = {"temperature": 0.1, "num_predict": 50}
+    # Tokens of the email body shown when suggesting an action
+    ACTION_BODY_TOKENS = 100
+    
+    # Style guidelines
+    STYLE_GUIDE = {
+        "Professional": "Use professional, formal language. Be concise and respectful.",
+        "Casual": "Use friendly, conversational tone. Be approachable and warm.",
+        "Formal": "Use very formal language. Be extremely respectful and traditional.",
+        "Friendly": "Use warm, enthusiastic tone. Be personal and engaging."
+    }
+    
+    # Fixed instructions sent as the system prompt, so Ollama reuses their KV cache between calls
+    SUMMARY_SYSTEM = """Provide a brief summary of the unread emails you are given.
+
+Provide a concise summary highlighting:
+1. Most important/urgent emails
+2. Common topics or themes
+3. Any action items needed"""
+    ACTION_SYSTEM = """Based on the email you are given, suggest the most appropriate action.
+
+Choose from: Reply, Schedule Meeting, Forward, Archive, Flag for Follow-up, Mark as Important"""
+    
+    # Text returned instead of a generation when it fails, keyed by failure kind
+    REPLY_ERRORS = {
+        'status': "❌ AI Error: {status_code} - {text}",
+        'connection': "❌ Could not connect to Ollama server. Please ensure it's running.",
+        'timeout': "❌ Request timed out. Please try again.",
+        'unexpected': "❌ Unexpected error: {error}"
+    }
+    EMAIL_ERRORS = {
+        'status': " AI Error: {status_code} - {text}",
+        'connection': " Could not connect to Ollama server. Please ensure it's running.",
+        'timeout': " Request timed out. Please try again.",
+        'unexpected': " Unexpected error: {error}"
+    }
+    SUMMARY_ERRORS = {
+        'status': "Could not generate summary.",
+        'connection': "Error generating summary: {error}",
+        'timeout': "Error generating summary: {error}",
+        'unexpected': "Error generating summary: {error}"
+    }
+    ACTION_ERRORS = {'status': "Reply", 'connection': "Reply", 'timeout': "Reply", 'unexpected': "Reply"}
     
-    def __init__(self, model=DEFAULT_MODEL, base_url="http://localhost:11434"):
+    def __init__(self, model=DEFAULT_MODEL, base_url="http://localhost:11434", pool_size=16, retries=2, cache=None,
+                 model_ttl=30, num_ctx=4096, tokenizer=estimate_tokens, keep_alive="30m"):
         self.model = model
         self.base_url = base_url
         self.api_url = f"{base_url}/api/generate"
         self.api_model_url = f"{base_url}/api/tags"
+        self.pool_size = pool_size
+        self.retries = retries
+        self.client = get_client(base_url, pool_maxsize=pool_size, retries=retries)
+        self.registry = ModelRegistry(self.client, ttl=model_ttl)
+        self._async_clients = weakref.WeakKeyDictionary()
+        # In-memory response cache by default; pass cache=False to disable
+        self.cache = ResponseCache() if cache is None else (cache or None)
+        self.last_stream_stats = {}
+        # Prompts are trimmed to fit num_ctx, which is also sent to Ollama
+        self.budget = PromptBudget(num_ctx, tokenizer)
+        # How long Ollama keeps the model, and with it the cached prompt prefix, loaded between calls
+        self.keep_alive = keep_alive
         self._initialize_model()
 
     def set_model(self, model):
@@ -19,102 +111,216 @@ class AIAgent:
         self.model = model
         self._initialize_model()
 
-
-
     def get_supported_models(self):
         """Get list of supported models with their properties"""
         return self.SUPPORTED_MODELS
 
-    def pull_model(self, model_name):
-        """Pull a model from Ollama"""
+    def pull_model(self, model_name, on_progress=None):
+        """Pull a model from Ollama, calling ``on_progress(job)`` per progress update"""
         if model_name not in self.SUPPORTED_MODELS:
             raise ValueError(f"Unsupported model: {model_name}")
-            
+        
         try:
-            # First check if model exists
-            response = requests.get(self.api_model_url, timeout=10)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                if any(m['name'] == model_name for m in models):
-                    return f"Model {model_name} already exists"
-            
-            # Pull the model
-            pull_url = f"{self.base_url}/api/pull"
-            response = requests.post(pull_url, json={"name": model_name}, timeout=120)
-            
-            if response.status_code == 200:
-                return f"Successfully pulled model: {model_name}"
-            else:
-                return f"Failed to pull model: {model_name}. Error: {response.text}"
-                
+            if self.registry.has(model_name):
+                return f"Model {model_name} already exists"
         except Exception as e:
             return f"Error pulling model: {str(e)}"
+        
+        job = self.registry.pull(model_name, on_progress)
+        if job.error:
+            return f"Failed to pull model: {model_name}. Error: {job.error}"
+        return f"Successfully pulled model: {model_name}"
+
+    def pull_model_in_background(self, model_name, on_progress=None):
+        """Start pulling a model without blocking; returns a PullJob to poll"""
+        if model_name not in self.SUPPORTED_MODELS:
+            raise ValueError(f"Unsupported model: {model_name}")
+        return self.registry.pull_in_background(model_name, on_progress)
 
     def _initialize_model(self):
-        """Initialize the selected model"""
-        try:
-            # Check if model exists
-            response = requests.get(self.api_model_url, timeout=10)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                if not any(m['name'] == self.model for m in models):
-                    # Model doesn't exist, try to pull it
-                    self.pull_model(self.model)
-        except Exception as e:
-            print(f"Warning: Could not initialize model: {str(e)}")
+        """Make sure the selected model is installed, pulling it in the background"""
+        return self.registry.ensure(self.model)
 
     def check_model_status(self, model_name):
         """Check if a model exists and its status"""
         try:
-            response = requests.get(self.api_model_url, timeout=10)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                model_info = next((m for m in models if m['name'] == model_name), None)
-                if model_info:
-                    return {
-                        'exists': True,
-                        'status': model_info.get('status', 'unknown'),
-                        'size': model_info.get('size', 'unknown')
-                    }
-                return {'exists': False}
-            return {'error': 'Failed to get model status'}
+            model_info = self.registry.info(model_name)
         except Exception as e:
             return {'error': str(e)}
+        if model_info:
+            return {
+                'exists': True,
+                'status': model_info.get('status', 'unknown'),
+                'size': model_info.get('size', 'unknown')
+            }
+        job = self.registry.pull_job(model_name)
+        if job is not None and not job.done.is_set():
+            return {'exists': False, 'pull': job.as_dict()}
+        return {'exists': False}
     
-    def generate_reply(self, email, user_profile, custom_instruction="", context="", style="Professional"):
-        """Generate an AI reply to an email"""
-        prompt = self._build_prompt(email, user_profile, custom_instruction, context, style)
+    def _payload(self, prompt, options, system=None):
+        """``/api/generate`` request body
         
-        try:
-            response = requests.post(self.api_url, json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 500
-                }
-            }, timeout=60)
+        ``system`` goes ahead of the prompt in the model's template, so when it
+        is the same from call to call Ollama reuses its evaluated KV cache and
+        only the prompt is prefilled.
+        """
+        payload = {"model": self.model, "prompt": prompt, "options": self._options(options),
+                   "keep_alive": self.keep_alive}
+        if system:
+            payload["system"] = system
+        return payload
+    
+    def _stream_generate(self, prompt, options, timeout, stats, system=None):
+        """Yield tokens from Ollama's NDJSON stream, recording timing into ``stats``"""
+        start = time.perf_counter()
+        first_token_at = None
+        n_tokens = 0
+        
+        payload = self._payload(prompt, options, system)
+        for chunk in self.client.stream('/api/generate', payload, timeout=timeout):
+            token = chunk.get('response', '')
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                n_tokens += 1
+                yield token
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                return f"❌ AI Error: {response.status_code} - {response.text}"
-                
-        except requests.exceptions.ConnectionError:
-            return "❌ Could not connect to Ollama server. Please ensure it's running."
-        except requests.exceptions.Timeout:
-            return "❌ Request timed out. Please try again."
-        except Exception as e:
-            return f"❌ Unexpected error: {str(e)}"
+            if chunk.get('done'):
+                for key in ('eval_count', 'eval_duration', 'prompt_eval_count', 'prompt_eval_duration',
+                            'load_duration', 'total_duration'):
+                    if key in chunk:
+                        stats[key] = chunk[key]
+        
+        end = time.perf_counter()
+        generation_time = end - (first_token_at or end)
+        stats.update({
+            'time_to_first_token': (first_token_at - start) if first_token_at else None,
+            'total_time': end - start,
+            'tokens': n_tokens,
+            'tokens_per_second': n_tokens / generation_time if generation_time > 0 else None
+        })
+        # Ollama's own counters are more precise when the server reports them
+        if stats.get('eval_duration'):
+            stats['tokens_per_second'] = stats['eval_count'] / (stats['eval_duration'] / 1e9)
+        self.last_stream_stats = stats
     
-    def _build_prompt(self, email, user_profile, custom_instruction, context, style):
-        """Build the prompt for AI generation"""
+    def _options(self, options):
+        """Ollama options for a request, with the context window the prompt was budgeted for"""
+        return dict(options, num_ctx=self.budget.num_ctx)
+    
+    @staticmethod
+    def _fallback(errors, error):
+        """Pick the text returned in place of a failed generation"""
+        if isinstance(error, OllamaError):
+            kind = 'status'
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            kind = 'connection'
+        elif isinstance(error, requests.exceptions.Timeout):
+            kind = 'timeout'
+        else:
+            kind = 'unexpected'
+        return errors[kind].format(
+            status_code=getattr(error, 'status_code', None),
+            text=getattr(error, 'text', None),
+            error=str(error)
+        )
+    
+    @staticmethod
+    def _cache_key(prompt, system):
+        return [system, prompt] if system else prompt
+    
+    def _cached(self, prompt, options, use_cache, system=None):
+        """Cached response for this prompt, or None when missing or bypassed"""
+        if self.cache is None or not use_cache:
+            return None
+        return self.cache.get(self.model, self._cache_key(prompt, system), options)
+    
+    def _fallback_stream(self, prompt, options, timeout, errors, use_cache=True, system=None):
+        """TokenStream that ends with the fallback text if generation fails
         
-        # Get current date
-        current_date = datetime.now().strftime("%B %d, %Y")
+        Completed, non-empty generations are cached; ``use_cache=False`` skips
+        the lookup but still replaces the cached entry with the fresh sample.
+        """
+        start = time.perf_counter()
+        cached = self._cached(prompt, options, use_cache, system)
+        if cached is not None:
+            def replay(stats):
+                elapsed = time.perf_counter() - start
+                stats.update({'cached': True, 'time_to_first_token': elapsed, 'total_time': elapsed,
+                              'tokens': 0, 'tokens_per_second': None})
+                yield cached
+            return TokenStream(replay)
+        
+        def tokens(stats):
+            generated = []
+            try:
+                for token in self._stream_generate(prompt, options, timeout, stats, system):
+                    generated.append(token)
+                    yield token
+            except Exception as e:
+                stats['error'] = str(e)
+                if generated:
+                    # Never glue the error text onto a reply that is already on screen
+                    stats['partial'] = True
+                else:
+                    yield self._fallback(errors, e)
+                return
+            text = "".join(generated)
+            if self.cache is not None and text.strip():
+                self.cache.put(self.model, self._cache_key(prompt, system), options, text)
+        
+        return TokenStream(tokens)
+    
+    def _async_client(self):
+        """AsyncOllamaClient bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOllamaClient(self.base_url, pool_maxsize=self.pool_size, retries=self.retries)
+            self._async_clients[loop] = client
+        return client
+    
+    async def _agenerate(self, prompt, options, timeout, errors, use_cache=True, system=None):
+        """Non-streaming generation on the event loop's pooled async client"""
+        cached = self._cached(prompt, options, use_cache, system)
+        if cached is not None:
+            return cached.strip()
+        try:
+            result = await self._async_client().generate(self._payload(prompt, options, system), timeout=timeout)
+        except Exception as e:
+            return self._fallback(errors, e)
+        text = result.get('response', '')
+        if self.cache is not None and text.strip():
+            self.cache.put(self.model, self._cache_key(prompt, system), options, text)
+        return text.strip()
+    
+    def cache_stats(self):
+        """Response cache hit/miss counters, empty when caching is disabled"""
+        return self.cache.stats() if self.cache is not None else {}
+    
+    async def aclose(self):
+        """Close the async client of the running event loop"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def stream_reply(self, email, user_profile, custom_instruction="", context="", style="Professional", use_cache=True):
+        """Stream an AI reply to an email token by token"""
+        system, prompt = self._build_prompt(email, user_profile, custom_instruction, context, style)
+        return self._fallback_stream(prompt, self.REPLY_OPTIONS, 60, self.REPLY_ERRORS, use_cache, system)
+    
+    def generate_reply(self, email, user_profile, custom_instruction="", context="", style="Professional", use_cache=True):
+        """Generate an AI reply to an email"""
+        return self.stream_reply(email, user_profile, custom_instruction, context, style, use_cache).text()
+    
+    async def agenerate_reply(self, email, user_profile, custom_instruction="", context="", style="Professional", use_cache=True):
+        """Generate an AI reply to an email without blocking the event loop"""
+        system, prompt = self._build_prompt(email, user_profile, custom_instruction, context, style)
+        return await self._agenerate(prompt, self.REPLY_OPTIONS, 60, self.REPLY_ERRORS, use_cache, system)
+    
+    def _system_prompt(self, user_profile, style):
+        """Instructions and profile shared by every reply for this user and style"""
         
         # Build user context
         user_context = ""
@@ -129,155 +335,134 @@ My Profile:
 - Preferences: {user_profile.get('preferences', 'Professional and courteous')}
 """
         
-        # Build context from RAG
-        rag_context = ""
-        if context:
-            rag_context = f"""
-Relevant Context from Knowledge Base:
-{context}
-"""
-        
-        # Style guidelines
-        style_guide = {
-            "Professional": "Use professional, formal language. Be concise and respectful.",
-            "Casual": "Use friendly, conversational tone. Be approachable and warm.",
-            "Formal": "Use very formal language. Be extremely respectful and traditional.",
-            "Friendly": "Use warm, enthusiastic tone. Be personal and engaging."
-        }
-        
-        prompt = f"""You are an intelligent email assistant helping to compose professional email replies.
-
+        return f"""You are an intelligent email assistant helping to compose professional email replies.
 {user_context}
-
-Email to Reply To:
-From: {email['sender']}
-Subject: {email['subject']}
-Date: {email['date']}
-Body: {email['body']}
-
-{rag_context}
-
 Instructions:
-- Current date: {current_date}
-- Response style: {style} - {style_guide.get(style, '')}
-- Custom instruction: {custom_instruction if custom_instruction else 'Reply appropriately to the email'}
+- Response style: {style} - {self.STYLE_GUIDE.get(style, '')}
 - Use the sender's name if available
 - Include my name ({user_profile.get('name', 'User')}) in the signature
 - Keep the reply concise but complete
 - Be helpful and professional
 - Address the main points in the original email
+- Follow the custom instruction given with the email
+- Generate only the email reply content (no subject line needed)"""
+    
+    def _build_prompt(self, email, user_profile, custom_instruction, context, style):
+        """Build the ``(system, prompt)`` pair for a reply, trimmed to the context window
+        
+        The system part depends only on the profile and style, so Ollama can
+        reuse it from one reply to the next; everything about this email
+        follows it in the prompt. ``context`` is either text or a list of
+        passages (dicts with ``title``, ``content`` and ``similarity``) of
+        which the best that fit are kept. Quoted history and the signature
+        are stripped from the body.
+        """
+        system = self._system_prompt(user_profile, style)
+        
+        # Get current date
+        current_date = datetime.now().strftime("%B %d, %Y")
+        
+        def render(body, context):
+            # Build context from RAG
+            rag_context = ""
+            if context:
+                rag_context = f"""
+Relevant Context from Knowledge Base:
+{context}
+"""
+            return f"""Email to Reply To:
+From: {email['sender']}
+Subject: {email['subject']}
+Date: {email['date']}
+Body: {body}
+{rag_context}
+Current date: {current_date}
+Custom instruction: {custom_instruction if custom_instruction else 'Reply appropriately to the email'}
 
-Generate only the email reply content (no subject line needed):"""
-
-        return prompt
+Reply:"""
+        
+        # Everything but the body and the retrieved context is fixed; those two share what is left
+        fixed = system + render("", " " if context else "")
+        body, context = self.budget.fit(email_body(email), context, self.REPLY_OPTIONS['num_predict'], fixed)
+        return system, render(body, context)
+    
+    def stream_email(self, prompt, use_cache=True):
+        """Stream an email generated from the given prompt"""
+        return self._fallback_stream(prompt, self.REPLY_OPTIONS, 60, self.EMAIL_ERRORS, use_cache)
     
-    def generate_email(self, prompt):
+    def generate_email(self, prompt, use_cache=True):
         """Generate an email based on the given prompt"""
-        try:
-            response = requests.post(self.api_url, json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 500
-                }
-            }, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                return f" AI Error: {response.status_code} - {response.text}"
-                
-        except requests.exceptions.ConnectionError:
-            return " Could not connect to Ollama server. Please ensure it's running."
-        except requests.exceptions.Timeout:
-            return " Request timed out. Please try again."
-        except Exception as e:
-            return f" Unexpected error: {str(e)}"
+        return self.stream_email(prompt, use_cache).text()
+    
+    async def agenerate_email(self, prompt, use_cache=True):
+        """Generate an email without blocking the event loop"""
+        return await self._agenerate(prompt, self.REPLY_OPTIONS, 60, self.EMAIL_ERRORS, use_cache)
 
     def check_connection(self):
         """Check if Ollama server is running"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+        return self.registry.is_reachable()
     
     def get_available_models(self):
         """Get list of available models from Ollama"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                return [model['name'] for model in data.get('models', [])]
-            return []
-        except:
-            return []
-    
-    def generate_summary(self, emails):
-        """Generate a summary of multiple emails"""
-        if not emails:
-            return "No emails to summarize."
-        
+        return self.registry.names()
+    
+    def _summary_prompt(self, emails):
+        """Build the prompt summarising a batch of emails"""
         email_summaries = []
         for email in emails[:5]:  # Limit to 5 emails
             summary = f"- From {email['sender']}: {email['subject'][:50]}..."
             email_summaries.append(summary)
         
-        prompt = f"""Provide a brief summary of these unread emails:
+        prompt = f"""Unread emails:
 
 {chr(10).join(email_summaries)}
 
 Total unread emails: {len(emails)}
 
-Provide a concise summary highlighting:
-1. Most important/urgent emails
-2. Common topics or themes
-3. Any action items needed
-
 Summary:"""
-
-        try:
-            response = requests.post(self.api_url, json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": 0.3, "max_tokens": 200}
-            }, timeout=30)
-            
-            if response.status_code == 200:
-                return response.json().get('response', '').strip()
-            return "Could not generate summary."
-            
-        except Exception as e:
-            return f"Error generating summary: {str(e)}"
+        return prompt
     
-    def suggest_action(self, email):
-        """Suggest an appropriate action for an email"""
-        prompt = f"""Based on this email, suggest the most appropriate action:
-
-From: {email['sender']}
+    def stream_summary(self, emails, use_cache=True):
+        """Stream a summary of multiple emails"""
+        if not emails:
+            return TokenStream(lambda stats: iter(["No emails to summarize."]))
+        prompt = self._summary_prompt(emails)
+        return self._fallback_stream(prompt, self.SUMMARY_OPTIONS, 30, self.SUMMARY_ERRORS, use_cache,
+                                     self.SUMMARY_SYSTEM)
+    
+    def generate_summary(self, emails, use_cache=True):
+        """Generate a summary of multiple emails"""
+        return self.stream_summary(emails, use_cache).text()
+    
+    async def agenerate_summary(self, emails, use_cache=True):
+        """Generate a summary of multiple emails without blocking the event loop"""
+        if not emails:
+            return "No emails to summarize."
+        prompt = self._summary_prompt(emails)
+        return await self._agenerate(prompt, self.SUMMARY_OPTIONS, 30, self.SUMMARY_ERRORS, use_cache,
+                                     self.SUMMARY_SYSTEM)
+    
+    def _action_prompt(self, email):
+        """Build the prompt asking for a suggested action"""
+        prompt = f"""From: {email['sender']}
 Subject: {email['subject']}
-Body: {email['body'][:300]}...
-
-Choose from: Reply, Schedule Meeting, Forward, Archive, Flag for Follow-up, Mark as Important
+Body: {truncate_tokens(strip_quoted(email_body(email)), self.ACTION_BODY_TOKENS, self.budget.tokenizer)}
 
 Suggested Action:"""
-
-        try:
-            response = requests.post(self.api_url, json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": 0.1, "max_tokens": 50}
-            }, timeout=15)
-            
-            if response.status_code == 200:
-                return response.json().get('response', '').strip()
-            return "Reply"
-            
-        except:
-            return "Reply"
\ No newline at end of file
+        return prompt
+    
+    def stream_action(self, email, use_cache=True):
+        """Stream a suggested action for an email"""
+        prompt = self._action_prompt(email)
+        return self._fallback_stream(prompt, self.ACTION_OPTIONS, 15, self.ACTION_ERRORS, use_cache,
+                                     self.ACTION_SYSTEM)
+    
+    def suggest_action(self, email, use_cache=True):
+        """Suggest an appropriate action for an email"""
+        return self.stream_action(email, use_cache).text()
+    
+    async def asuggest_action(self, email, use_cache=True):
+        """Suggest an appropriate action for an email without blocking the event loop"""
+        prompt = self._action_prompt(email)
+        return await self._agenerate(prompt, self.ACTION_OPTIONS, 15, self.ACTION_ERRORS, use_cache,
+                                     self.ACTION_SYSTEM)
\ No newline at end of file
@@ -2,9 +2,17 @@ import streamlit as st
 import json
 import os
 from datetime import datetime
+from gmail_fetcher import FetchError
 from gmail_handler import GmailHandler
+from inbox_watcher import AutoReplier, InboxWatcher, PubSubNotificationSource
+from message_store import SQLiteMessageStore
+from near_duplicates import email_index
+from outbox import Outbox
 from ai_agent import AIAgent
+from kb_ingest import ingest
 from rag_system import RAGSystem
+from response_cache import LRUCache, ResponseCache
+from triage import triage_inbox
 
 # Page config
 st.set_page_config(
@@ -17,13 +25,22 @@ st.set_page_config(
 if 'gmail_handler' not in st.session_state:
     st.session_state.gmail_handler = None
 if 'ai_agent' not in st.session_state:
-    st.session_state.ai_agent = AIAgent()
+    st.session_state.ai_agent = AIAgent(cache=ResponseCache(path=os.path.join('cache', 'responses.sqlite')))
 if 'rag_system' not in st.session_state:
     st.session_state.rag_system = RAGSystem()
 if 'user_profile' not in st.session_state:
     st.session_state.user_profile = {}
 if 'emails' not in st.session_state:
     st.session_state.emails = []
+if 'message_store' not in st.session_state:
+    st.session_state.message_store = SQLiteMessageStore()
+if 'outbox' not in st.session_state:
+    st.session_state.outbox = Outbox()
+if 'mail_duplicates' not in st.session_state:
+    st.session_state.mail_duplicates = email_index()
+if 'triage_clusters' not in st.session_state:
+    # Triage results per mail cluster, kept across batches like the index itself
+    st.session_state.triage_clusters = LRUCache(1024)
 
 def load_user_profile():
     """Load user profile from file"""
@@ -32,6 +49,28 @@ def load_user_profile():
             return json.load(f)
     return {}
 
+def render_stream(stream):
+    """Render a token stream incrementally and return the final text"""
+    placeholder = st.empty()
+    tokens = []
+    for token in stream:
+        tokens.append(token)
+        placeholder.markdown("".join(tokens) + "▌")
+    text = "".join(tokens).strip()
+    placeholder.markdown(text)
+    
+    stats = stream.stats
+    if stats.get('partial'):
+        st.warning(f"⚠️ Generation stopped early: {stats['error']}")
+    if stats.get('cached'):
+        st.caption("⚡ Cached response · use Regenerate for a fresh one")
+    elif stats.get('time_to_first_token') is not None:
+        st.caption(
+            f"⏱ First token after {stats['time_to_first_token']:.2f}s · "
+            f"{stats.get('tokens_per_second') or 0:.1f} tokens/s · {stats['total_time']:.1f}s total"
+        )
+    return text
+
 def save_user_profile(profile):
     """Save user profile to file"""
     with open('user_profile.json', 'w') as f:
@@ -78,22 +117,51 @@ with st.sidebar:
     
     st.markdown("---")
     st.header("⚙️ Settings")
-    
+
+    # Model section; pull progress comes from the background job, never the network
+    st.subheader("🧠 Model")
+    agent = st.session_state.ai_agent
+    supported = list(agent.get_supported_models())
+    selected_model = st.selectbox(
+        "Ollama model", supported,
+        index=supported.index(agent.model) if agent.model in supported else 0,
+        format_func=lambda name: f"{agent.SUPPORTED_MODELS[name]['name']} ({agent.SUPPORTED_MODELS[name]['size']})",
+        key="model_select"
+    )
+    if selected_model != agent.model:
+        agent.set_model(selected_model)
+
+    pull_job = agent.registry.pull_job(agent.model)
+    if pull_job is not None:
+        if not pull_job.done.is_set():
+            st.progress(pull_job.progress or 0.0, text=f"⬇️ {agent.model}: {pull_job.status}")
+        elif pull_job.error:
+            st.warning(f"⚠️ Could not prepare {agent.model}: {pull_job.error}")
+
     # Knowledge Base section
     st.subheader("📚 Knowledge Base")
     
     # Add documents
-    uploaded_file = st.file_uploader("Upload documents for context", 
-                                     type=['txt', 'pdf', 'docx'],
-                                     help="Upload documents to improve AI responses",
-                                     key="kb_file_uploader")
+    uploaded_files = st.file_uploader("Upload documents for context", 
+                                      type=['txt', 'pdf', 'docx'],
+                                      help="Upload documents to improve AI responses",
+                                      accept_multiple_files=True,
+                                      key="kb_file_uploader")
     
-    if uploaded_file:
+    if uploaded_files:
         with st.form("kb_form"):
             if st.form_submit_button("📤 Add to Knowledge Base"):
                 try:
-                    st.session_state.rag_system.add_document(uploaded_file)
-                    st.success("✅ Document added to knowledge base!")
+                    # Extracted in worker processes and indexed in one batch
+                    report = ingest(st.session_state.rag_system,
+                                    [(file.name, file.getvalue()) for file in uploaded_files])
+                    for error in report['errors']:
+                        st.error(f"❌ Error: {error}")
+                    if report['added']:
+                        st.success(f"✅ Added {report['added']} documents to knowledge base "
+                                   f"({report['pages_per_second']:.0f} pages/s)")
+                    if report['duplicates'] or report['skipped']:
+                        st.info(f"{report['duplicates'] + report['skipped']} documents were already there, near duplicates or empty")
                 except Exception as e:
                     st.error(f"❌ Error: {e}")
     
@@ -109,7 +177,7 @@ with st.sidebar:
             
         # Clear documents option
         if st.button("🗑 Clear Knowledge Base", key="clear_kb_btn"):
-            st.session_state.rag_system.clear_documents()
+            st.session_state.rag_system.clear_knowledge_base()
             st.success("Knowledge base cleared!")
             st.rerun()
 
@@ -134,7 +202,8 @@ with st.sidebar:
     
     if st.button("🔐 Authenticate Gmail", type="primary", key="auth_btn"):
         try:
-            gmail_handler = GmailHandler()
+            # Synced mail persists across sessions, so later fetches are incremental
+            gmail_handler = GmailHandler(store=st.session_state.message_store, outbox=st.session_state.outbox)
             service = gmail_handler.authenticate()
             st.session_state.gmail_handler = gmail_handler
             st.success("✅ Gmail authenticated successfully!")
@@ -148,15 +217,84 @@ with st.sidebar:
             try:
                 emails = st.session_state.gmail_handler.get_unread_emails(limit=10)
                 st.session_state.emails = emails
+                report = st.session_state.gmail_handler.last_sync
                 st.success(f"✅ Found {len(emails)} unread emails")
+                st.caption(f"🔄 {report['mode'].title()} sync: {report['added']} new, "
+                           f"{report['deleted']} removed, {report['relabelled']} updated")
             except Exception as e:
                 st.error(f"❌ Error fetching emails: {e}")
+        
+        service = st.session_state.gmail_handler.service
+        if hasattr(service, 'stats'):
+            quota = service.stats()
+            st.caption(f"📊 Gmail quota: {quota['units_per_second']:.0f} units/s "
+                       f"({quota['utilisation']:.0%}) · {quota['retries']} retries")
+        
+        # Replies are sent through a durable outbox; anything left from a crash is settled here
+        outbox_counts = st.session_state.outbox.counts()
+        if outbox_counts['pending'] or outbox_counts['sending'] or outbox_counts['failed']:
+            st.caption(f"📤 Outbox: {outbox_counts['pending'] + outbox_counts['sending']} queued · "
+                       f"{outbox_counts['failed']} failed · {outbox_counts['sent']} sent")
+            if st.button("📤 Send Queued Replies", key="flush_outbox_btn"):
+                st.session_state.outbox.retry_failed()
+                report = st.session_state.gmail_handler.flush_outbox()
+                st.success(f"✅ Sent {report['sent'] + report['reconciled']} · failed {report['failed']} · "
+                           f"{report['per_second']:.1f} msg/s")
+        
+        # Watch the inbox in the background and draft replies as mail arrives
+        watch_inbox = st.toggle("👀 Watch Inbox", key="watch_inbox",
+                                help="Set GMAIL_PUBSUB_TOPIC and GMAIL_PUBSUB_SUBSCRIPTION for push "
+                                     "notifications; otherwise the inbox is polled")
+        watcher = st.session_state.get('inbox_watcher')
+        if watch_inbox and watcher is None:
+            handler = st.session_state.gmail_handler
+            topic = os.environ.get('GMAIL_PUBSUB_TOPIC')
+            subscription = os.environ.get('GMAIL_PUBSUB_SUBSCRIPTION')
+            notifications = PubSubNotificationSource(subscription) if topic and subscription else None
+            watcher = InboxWatcher(handler.syncer, notifications=notifications,
+                                   topic=topic if notifications else None)
+            rag_system = st.session_state.rag_system
+            st.session_state.auto_replier = AutoReplier(
+                handler, st.session_state.ai_agent, watcher.queue,
+                user_profile=st.session_state.user_profile, send=auto_reply, style=response_style,
+                context_for=rag_system.passages_for_email,
+                near_duplicates=st.session_state.mail_duplicates
+            ).start()
+            st.session_state.inbox_watcher = watcher.start()
+        elif not watch_inbox and watcher is not None:
+            watcher.stop()
+            st.session_state.auto_replier.stop()
+            del st.session_state.inbox_watcher, st.session_state.auto_replier
+        if watch_inbox:
+            st.session_state.auto_replier.send = auto_reply
+            st.caption(f"👀 {watcher.stats['syncs']} syncs · {watcher.stats['queued']} new emails · "
+                       f"next check within {watcher.interval:.0f}s")
     
     # Show knowledge base stats
     kb_stats = st.session_state.rag_system.get_stats()
     if kb_stats['total_documents'] > 0:
         st.info(f"📊 Knowledge Base: {kb_stats['total_documents']} documents")
 
+    cache_stats = st.session_state.ai_agent.cache_stats()
+    if cache_stats.get('memory_hits') or cache_stats.get('disk_hits'):
+        st.caption(f"⚡ Response cache: {cache_stats['hit_rate']:.0%} hit rate")
+    query_stats = st.session_state.rag_system.query_cache_stats()
+    if query_stats.get('hits'):
+        st.caption(f"🔎 Retrieval cache: {query_stats['hit_rate']:.0%} hit rate")
+    
+    # Search past mail from the local store without calling the Gmail API
+    message_store = st.session_state.message_store
+    if len(message_store):
+        st.markdown("---")
+        st.header("🔎 Search Mail")
+        mail_query = st.text_input("Search synced emails", key="mail_search",
+                                   help=f"{len(message_store)} emails stored locally")
+        if mail_query:
+            for match in message_store.search(mail_query, limit=10):
+                with st.expander(f"{match['sender'][:25]} | {match['subject'][:40]}"):
+                    st.caption(match['date'])
+                    st.write(match.get('body') or match['snippet'])
+
 # Main content area
 col1, col2 = st.columns([1, 1])
 
@@ -235,13 +373,14 @@ with col1:
                 Generate a clear and concise email response.
                 """
                 
-                # Generate email
-                generated_email = st.session_state.ai_agent.generate_email(generation_prompt)
+                # Stream the email into the page as it is generated
+                st.markdown("---")
+                st.header("📋 Generated Email")
+                stream = st.session_state.ai_agent.stream_email(generation_prompt)
+                generated_email = render_stream(stream)
                 st.success("Email generated successfully!")
                 
                 # Display result
-                st.markdown("---")
-                st.header("📋 Generated Email")
                 st.text_area(
                     "",
                     value=generated_email,
@@ -276,6 +415,74 @@ with col2:
     
 
 
+# Batch triage of all fetched emails
+if st.session_state.emails:
+    st.markdown("---")
+    st.header("⚡ Batch Triage")
+    
+    concurrency = st.slider(
+        "Parallel requests", 1, 16, 4,
+        help="Match Ollama's OLLAMA_NUM_PARALLEL to keep the server fully busy"
+    )
+    
+    if st.button("⚡ Triage All Emails", key="triage_btn"):
+        progress = st.progress(0.0)
+        total = len(st.session_state.emails)
+        done = []
+        
+        def on_result(result):
+            done.append(result)
+            progress.progress(len(done) / total, text=f"Triaged {len(done)}/{total} emails")
+        
+        # Bodies are fetched lazily; pull every missing one in a single batch first
+        try:
+            st.session_state.gmail_handler.load_bodies(st.session_state.emails)
+        except FetchError as e:
+            st.warning(f"⚠️ {e}; those emails are triaged from their snippet")
+        st.session_state.triage_results = triage_inbox(
+            st.session_state.ai_agent,
+            st.session_state.emails,
+            user_profile=st.session_state.user_profile,
+            concurrency=concurrency,
+            on_result=on_result,
+            style=response_style,
+            context_for=st.session_state.rag_system.passages_for_email,
+            near_duplicates=st.session_state.mail_duplicates,
+            cluster_results=st.session_state.triage_clusters
+        )
+        st.success(f"✅ Triaged {total} emails")
+    
+    for result in st.session_state.get('triage_results', []):
+        email = result['email']
+        with st.expander(f"{result['action'] or '—'} | {email['sender'][:30]} | {email['subject'][:50]}"):
+            if result['error']:
+                st.error(f"❌ {result['error']}")
+            if result['summary']:
+                st.write(f"**Summary:** {result['summary']}")
+            if result['reply']:
+                st.text_area("**Draft reply:**", value=result['reply'], height=150, disabled=True,
+                             key=f"triage_reply_{result['index']}")
+            if result['reused_from']:
+                st.caption(f"♻️ Near duplicate; reused the results for message {result['reused_from']}")
+
+# Replies drafted by the background watcher
+if st.session_state.get('auto_replier') and st.session_state.auto_replier.results:
+    st.markdown("---")
+    st.header("📥 Auto-Replies")
+    for result in reversed(st.session_state.auto_replier.results[-20:]):
+        email = result['email'] or {'sender': '', 'subject': result['id']}
+        status = "✅ Sent" if result['sent'] else ("❌" if result['error'] else "📝 Draft")
+        with st.expander(f"{status} | {email['sender'][:30]} | {email['subject'][:50]}"):
+            if result['error']:
+                st.error(f"❌ {result['error']}")
+            if result['reply']:
+                st.text_area("Reply:", value=result['reply'], height=150, disabled=True,
+                             key=f"auto_reply_{result['id']}")
+            if result['reused_from']:
+                st.caption(f"♻️ Reused the reply to near-duplicate message {result['reused_from']}")
+            else:
+                st.caption(f"⏱ Drafted in {result['latency']:.1f}s")
+
 # Email selection and processing
 if st.session_state.emails:
     st.markdown("---")
@@ -295,6 +502,7 @@ if st.session_state.emails:
     
     if selected_idx is not None:
         selected_email = st.session_state.emails[selected_idx]
+        st.session_state.gmail_handler.load_body(selected_email)
         
         # Display selected email
         with st.expander("📧 Email Details", expanded=True):
@@ -324,26 +532,30 @@ if st.session_state.emails:
             if st.button("🙏 Polite Decline"):
                 custom_instruction = "Politely decline the request with explanation"
         
-        # Generate reply
-        if st.button("🚀 Generate Reply", type="primary"):
+        # Generate reply; Regenerate re-runs this with the response cache bypassed
+        regenerate = st.session_state.pop('regenerate', False)
+        if st.button("🚀 Generate Reply", type="primary") or regenerate:
             try:
-                with st.spinner("🤖 AI is generating reply..."):
-                    # Get relevant context from RAG system
-                    context = st.session_state.rag_system.get_relevant_context(
-                        selected_email['body'] + " " + custom_instruction
-                    )
-                    
-                    # Generate reply using AI agent
-                    reply = st.session_state.ai_agent.generate_reply(
-                        email=selected_email,
-                        user_profile=st.session_state.user_profile,
-                        custom_instruction=custom_instruction,
-                        context=context,
-                        style=response_style
-                    )
-                    
-                    st.session_state.generated_reply = reply
-                    st.success("✅ Reply generated successfully!")
+                # Candidate passages from the knowledge base plus earlier mail from the same
+                # thread or on the same subject; the agent keeps the best that fit the prompt
+                context = st.session_state.rag_system.get_relevant_passages(
+                    selected_email['body'] + " " + custom_instruction, max_results=8
+                )
+                context += st.session_state.message_store.related_passages(selected_email)
+                
+                # Stream the reply from the AI agent as it is generated
+                stream = st.session_state.ai_agent.stream_reply(
+                    email=selected_email,
+                    user_profile=st.session_state.user_profile,
+                    custom_instruction=custom_instruction,
+                    context=context,
+                    style=response_style,
+                    use_cache=not regenerate
+                )
+                reply = render_stream(stream)
+                
+                st.session_state.generated_reply = reply
+                st.success("✅ Reply generated successfully!")
             except Exception as e:
                 st.error(f"❌ Error generating reply: {e}")
         
@@ -364,13 +576,19 @@ if st.session_state.emails:
             with col1:
                 if st.button("📧 Send Reply", type="primary"):
                     try:
-                        st.session_state.gmail_handler.send_reply(
-                            selected_email, reply_text
-                        )
+                        handler = st.session_state.gmail_handler
+                        if not handler.queue_reply(selected_email, reply_text):
+                            st.warning("⚠️ A reply to this email is already queued or sent")
+                        handler.flush_outbox()
+                        queued = handler.outbox.get(selected_email['id'])
+                        if queued['status'] != 'sent':
+                            raise RuntimeError(queued['error'] or "reply is still queued")
                         st.success("✅ Reply sent successfully!")
                         
                         # Remove from unread emails
-                        st.session_state.emails.remove(selected_email)
+                        st.session_state.emails = [
+                            email for email in st.session_state.emails if email['id'] != selected_email['id']
+                        ]
                         
                         # Clear generated reply
                         if 'generated_reply' in st.session_state:
@@ -385,6 +603,7 @@ if st.session_state.emails:
                 if st.button("🔄 Regenerate"):
                     if 'generated_reply' in st.session_state:
                         del st.session_state.generated_reply
+                    st.session_state.regenerate = True
                     st.rerun()
             
             with col3:
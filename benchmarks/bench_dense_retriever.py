@@ -0,0 +1,61 @@
+"""IVF vs. exhaustive search over N unit vectors: query latency and recall@k
+
+Usage: python benchmarks/bench_dense_retriever.py --sizes 10000 100000 --dim 384
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from dense_retriever import IVFIndex, _normalise
+
+
+def clustered_vectors(n, dim, n_topics=500, noise=0.6, seed=0):
+    """Unit vectors scattered around random topic directions, like embedded passages"""
+    rng = np.random.default_rng(seed)
+    topics = _normalise(rng.standard_normal((n_topics, dim)).astype(np.float32))
+    vectors = topics[rng.integers(0, n_topics, n)] + noise * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    return _normalise(vectors.astype(np.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--n-probe', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'vectors':>8} {'build s':>8} {'flat ms':>8} {'ivf ms':>8} {'recall@k':>9}")
+    for size in args.sizes:
+        vectors = clustered_vectors(size + args.queries, args.dim)
+        corpus, queries = vectors[:size], vectors[size:]
+
+        start = time.perf_counter()
+        index = IVFIndex(args.dim, n_probe=args.n_probe)
+        for offset in range(0, size, 4096):
+            index.add(range(offset, min(offset + 4096, size)), corpus[offset:offset + 4096])
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        exact = []
+        for query in queries:
+            scores = corpus @ query
+            exact.append(set(np.argpartition(-scores, args.top_k - 1)[:args.top_k]))
+        flat_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        found = [set(key for key, _ in index.search(query, args.top_k)) for query in queries]
+        ivf_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+        recall = np.mean([len(a & b) / args.top_k for a, b in zip(exact, found)])
+        print(f"{size:>8} {build_s:>8.2f} {flat_ms:>8.3f} {ivf_ms:>8.3f} {recall:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""List scans vs. the id -> position table in RAGSystem: add, remove and query cost at 50k documents
+
+Usage: python benchmarks/bench_document_table.py --docs 50000 --ops 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_system import RAGSystem
+
+WORDS = ("invoice delivery schedule contract renewal pricing warehouse audit supplier customer payment "
+         "shipment order refund warranty region quarter forecast budget meeting").split()
+
+
+class LegacyRAGSystem(RAGSystem):
+    """Duplicate check, removal and passage lookup as they were: scans over ``self.documents``"""
+
+    def is_duplicate(self, doc_id):
+        return any(doc['id'] == doc_id for doc in self.documents)
+
+    def remove_document(self, doc_id):
+        removed = [doc for doc in self.documents if doc['id'] == doc_id]
+        if not removed:
+            return
+        for doc in removed:
+            self._unindex_document(doc)
+        self.documents = [doc for doc in self.documents if doc['id'] != doc_id]
+        self.store.append_removal(doc_id)
+
+    def get_relevant_passages(self, query, max_results=3, min_similarity=0.1):
+        hits = self.retriever.search(query, top_k=max_results, min_score=min_similarity)
+        documents_by_id = {doc['id']: doc for doc in self.documents}
+        return [{'doc_id': doc_id, 'title': documents_by_id[doc_id]['title'], 'similarity': similarity,
+                 'content': self.store.read_span(documents_by_id[doc_id], *documents_by_id[doc_id]['passages'][n])}
+                for (doc_id, n), similarity in hits]
+
+    def search_documents(self, query, limit=5):
+        context = self.get_relevant_context(query, max_results=limit, min_similarity=0.05)
+        if context:
+            return [{'title': doc['title'], 'snippet': context[:200]} for doc in self.documents[:limit]]
+        return []
+
+
+def make_documents(n, rng):
+    return [{'text': f"Record {i}: " + " ".join(rng.choice(WORDS) for _ in range(12)), 'title': f"Record {i}"}
+            for i in range(n)]
+
+
+def timed(fn, args):
+    samples = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    documents = make_documents(args.docs, rng)
+    queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(args.ops)]
+
+    print(f"{'mode':>8} {'dup check us':>13} {'remove us':>10} {'query us':>9} {'search hits right':>17}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, cls in (('scan', LegacyRAGSystem), ('table', RAGSystem)):
+            # compact_ratio=1.0 keeps compaction out of the removal timings
+            rag = cls(os.path.join(tmp, mode), compact_ratio=1.0)
+            start = time.perf_counter()
+            ids = rag.add_documents(documents)
+            load_s = time.perf_counter() - start
+            probe = rng.sample(ids, args.ops)
+            dup_check = (rag.is_duplicate if mode == 'scan' else rag._positions.__contains__)
+            dup_us = timed(dup_check, probe)
+            query_us = timed(lambda query: rag.get_relevant_passages(query, max_results=5), queries)
+            remove_us = timed(rag.remove_document, probe)
+            # Share of search_documents results that really are among the query's top matches
+            relevant, returned = 0, 0
+            for query in queries[:50]:
+                top = {passage['title'] for passage in rag.get_relevant_passages(query, max_results=50,
+                                                                                  min_similarity=0.05)}
+                hits = rag.search_documents(query, limit=5)
+                relevant += sum(hit['title'] in top for hit in hits)
+                returned += len(hits)
+            print(f"{mode:>8} {dup_us:>13.1f} {remove_us:>10.1f} {query_us:>9.1f} "
+                  f"{relevant / max(returned, 1):>17.0%}   (batch add {load_s:.1f}s)")
+            rag.store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Per-message vs. batched metadata Gmail fetch against the fake service: round trips, bytes, time
+
+Usage: python benchmarks/bench_gmail_fetch.py --mailbox 3000 --limits 10 100 500 --rtt 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox
+from gmail_fetcher import GmailFetcher, message_to_email
+
+
+def legacy_fetch(service, limit):
+    """The original pattern: one list call, then one full messages.get per message"""
+    results = service.users().messages().list(userId='me', labelIds=['INBOX'], q='is:unread',
+                                              maxResults=limit).execute()
+    return [
+        message_to_email(service.users().messages().get(userId='me', id=ref['id'], format='full').execute(),
+                         with_body=True)
+        for ref in results.get('messages', [])
+    ]
+
+
+def measure(service, fetch):
+    service.reset_stats()
+    start = time.perf_counter()
+    emails = fetch()
+    return emails, time.perf_counter() - start, dict(service.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mailbox', type=int, default=3000)
+    parser.add_argument('--limits', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--rtt', type=float, default=0.05, help="seconds per HTTP round trip")
+    parser.add_argument('--per-request', type=float, default=0.002, help="server seconds per API call")
+    args = parser.parse_args()
+
+    mailbox = FakeMailbox.generate(args.mailbox, unread_ratio=0.5)
+    service = FakeGmailService(mailbox, rtt=args.rtt, per_request=args.per_request)
+    fetcher = GmailFetcher(service)
+
+    print(f"{'emails':>6} {'mode':>10} {'trips':>6} {'KB':>8} {'seconds':>8}")
+    for limit in args.limits:
+        legacy, legacy_s, legacy_stats = measure(service, lambda: legacy_fetch(service, limit))
+        batched, batched_s, batched_stats = measure(service, lambda: fetcher.fetch(limit=limit))
+        assert [email['id'] for email in legacy] == [email['id'] for email in batched]
+
+        # Opening one message afterwards costs a single extra round trip
+        _, open_s, open_stats = measure(service, lambda: fetcher.load_body(batched[0]))
+        assert batched[0]['body'] == legacy[0]['body']
+
+        for mode, seconds, stats in (('per-msg', legacy_s, legacy_stats), ('batched', batched_s, batched_stats),
+                                     ('open one', open_s, open_stats)):
+            print(f"{len(legacy):>6} {mode:>10} {stats['round_trips']:>6} {stats['bytes'] / 1024:>8.1f} "
+                  f"{seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
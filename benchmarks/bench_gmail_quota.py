@@ -0,0 +1,69 @@
+"""Bulk Gmail job against a quota-enforcing fake: raw service vs. QuotaService (failures, units/s)
+
+Usage: python benchmarks/bench_gmail_quota.py --messages 1500 --modify 300 --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox
+from gmail_fetcher import FetchError, GmailFetcher
+from gmail_quota import GMAIL_USER_QUOTA, QuotaService
+
+
+def bulk_job(service, ids, modify_ids, workers):
+    """Fetch metadata for ``ids`` in batches, then mark ``modify_ids`` read from a thread pool"""
+    fetcher = GmailFetcher(service)
+    try:
+        fetched, failed = fetcher.get_messages(ids), {}
+    except FetchError as e:
+        fetched, failed = e.messages, e.failed
+
+    def mark_read(message_id):
+        try:
+            service.users().messages().modify(userId='me', id=message_id,
+                                              body={'removeLabelIds': ['UNREAD']}).execute()
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(workers) as pool:
+        modified = sum(pool.map(mark_read, modify_ids))
+    return len(fetched), len(failed), modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1500)
+    parser.add_argument('--modify', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rtt', type=float, default=0.02)
+    args = parser.parse_args()
+
+    mailbox = FakeMailbox.generate(args.messages)
+    ids = list(mailbox.order)
+    modify_ids = ids[:args.modify]
+
+    print(f"{'client':>12} {'fetched':>8} {'failed':>7} {'modified':>9} {'429s':>6} {'seconds':>8} {'units/s':>8}")
+    for name in ('raw', 'QuotaService'):
+        service = FakeGmailService(mailbox, rtt=args.rtt, units_per_second=GMAIL_USER_QUOTA)
+        client = service if name == 'raw' else QuotaService(service)
+        # Start both runs with a full quota bucket on the server
+        time.sleep(1)
+        start = time.perf_counter()
+        fetched, failed, modified = bulk_job(client, ids, modify_ids, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>12} {fetched:>8} {failed:>7} {modified:>9} {service.stats['rate_limited']:>6} "
+              f"{elapsed:>8.1f} {service.stats['units'] / elapsed:>8.0f}")
+        if name == 'QuotaService':
+            stats = client.stats()
+            print(f"QuotaService: {stats['retries']} retries, {stats['throttled_seconds']:.1f}s throttled, "
+                  f"{stats['units']} units spent")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Per-call build('gmail', 'v1') vs. the cached GmailServiceFactory: startup time per service
+
+Needs google-api-python-client, google-auth and google-auth-httplib2; no network or real account.
+
+Usage: python benchmarks/bench_gmail_service.py --calls 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from gmail_service import GmailServiceFactory
+
+
+def timed(fn, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20)
+    args = parser.parse_args()
+
+    # A token valid for an hour, so no OAuth flow or refresh is involved
+    credentials = Credentials(token='test-token', expiry=datetime.utcnow() + timedelta(hours=1))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        discovery_path = os.path.join(tmp, 'gmail_v1_discovery.json')
+
+        def legacy():
+            build('gmail', 'v1', credentials=credentials).users().messages()
+
+        def cold_factory():
+            factory = GmailServiceFactory(token_path=os.path.join(tmp, 'token.json'),
+                                          discovery_path=discovery_path)
+            factory.credentials = credentials
+            factory.service().users().messages()
+            factory.close()
+
+        shared = GmailServiceFactory(token_path=os.path.join(tmp, 'token.json'), discovery_path=discovery_path)
+        shared.credentials = credentials
+
+        rows = [
+            ('build() per call', timed(legacy, args.calls)),
+            ('factory, cached file', timed(cold_factory, args.calls)),
+            ('factory, in process', timed(lambda: shared.service().users().messages(), args.calls))
+        ]
+        shared.close()
+
+    print(f"{'mode':>22} {'median ms':>10} {'max ms':>8}")
+    for mode, samples in rows:
+        print(f"{mode:>22} {statistics.median(samples) * 1000:>10.2f} {max(samples) * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
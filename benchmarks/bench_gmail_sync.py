@@ -0,0 +1,77 @@
+"""Re-listing unread mail vs. historyId sync when polling the fake Gmail service: bytes and round trips per poll
+
+Usage: python benchmarks/bench_gmail_sync.py --mailbox 2000 --polls 20 --changes 2
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox, make_message
+from gmail_fetcher import GmailFetcher
+from gmail_sync import GmailSync, MemoryMessageStore
+
+
+def mutate(mailbox, rng, n_changes):
+    """A few realistic changes: new mail, messages read, archived or deleted"""
+    for _ in range(n_changes):
+        kind = rng.random()
+        if kind < 0.4:
+            mailbox.deliver(make_message(rng.randrange(10 ** 6), rng))
+        else:
+            message_id = rng.choice(mailbox.order)
+            if kind < 0.8:
+                mailbox.modify(message_id, remove=['UNREAD'])
+            elif kind < 0.9:
+                mailbox.modify(message_id, remove=['INBOX'])
+            else:
+                mailbox.delete(message_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mailbox', type=int, default=2000)
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--changes', type=int, default=2, help="mailbox changes between polls")
+    parser.add_argument('--unread-limit', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    mailbox = FakeMailbox.generate(args.mailbox, unread_ratio=0.3)
+    service = FakeGmailService(mailbox)
+    fetcher = GmailFetcher(service)
+    store = MemoryMessageStore()
+    syncer = GmailSync(service, store, max_messages=args.mailbox)
+
+    service.reset_stats()
+    syncer.sync()
+    initial = dict(service.stats)
+
+    relist = {'round_trips': 0, 'bytes': 0}
+    incremental = {'round_trips': 0, 'bytes': 0}
+    for _ in range(args.polls):
+        mutate(mailbox, rng, args.changes)
+
+        service.reset_stats()
+        fetcher.fetch(limit=args.unread_limit)
+        for key in relist:
+            relist[key] += service.stats[key]
+
+        service.reset_stats()
+        syncer.sync()
+        for key in incremental:
+            incremental[key] += service.stats[key]
+
+    truth = {message_id for message_id in mailbox.order if 'INBOX' in mailbox.messages[message_id]['labelIds']}
+    assert store.ids() == truth
+
+    print(f"initial full sync: {initial['round_trips']} round trips, {initial['bytes'] / 1024:.1f} KB")
+    print(f"{'mode':>12} {'trips/poll':>11} {'bytes/poll':>11}")
+    for mode, stats in (('re-list', relist), ('historyId', incremental)):
+        print(f"{mode:>12} {stats['round_trips'] / args.polls:>11.1f} {stats['bytes'] / args.polls:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
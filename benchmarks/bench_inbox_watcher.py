@@ -0,0 +1,91 @@
+"""Fixed polling vs. adaptive polling vs. push notifications: new-mail latency and Gmail requests
+
+Usage: python benchmarks/bench_inbox_watcher.py --duration 30 --arrivals 12 --rtt 0.05
+"""
+import argparse
+import os
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox, FakePubSub, make_message
+from gmail_sync import GmailSync, MemoryMessageStore
+from inbox_watcher import InboxWatcher
+
+TOPIC = 'projects/demo/topics/gmail'
+
+
+def run(mode, args):
+    rng = random.Random(1)
+    mailbox = FakeMailbox.generate(200)
+    pubsub = FakePubSub(delay=args.push_delay)
+    service = FakeGmailService(mailbox, rtt=args.rtt, pubsub=pubsub)
+    syncer = GmailSync(service, MemoryMessageStore())
+    work = queue.Queue()
+    if mode == 'fixed poll':
+        watcher = InboxWatcher(syncer, work, min_interval=args.fixed, max_interval=args.fixed)
+    elif mode == 'adaptive poll':
+        watcher = InboxWatcher(syncer, work, min_interval=args.min_interval, max_interval=args.max_interval)
+    else:
+        watcher = InboxWatcher(syncer, work, notifications=pubsub.subscription(TOPIC), topic=TOPIC,
+                               min_interval=args.min_interval, max_interval=args.max_interval)
+
+    delivered = {}
+    latencies = []
+
+    def consume():
+        while len(latencies) < args.arrivals:
+            try:
+                message_id = work.get(timeout=args.fixed + 5)
+            except queue.Empty:
+                return
+            latencies.append(time.perf_counter() - delivered[message_id])
+
+    with watcher:
+        while syncer.history_id is None:
+            time.sleep(0.01)
+        service.reset_stats()
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        arrivals = sorted(rng.uniform(0, args.duration) for _ in range(args.arrivals))
+        start = time.perf_counter()
+        for at in arrivals:
+            time.sleep(max(0.0, start + at - time.perf_counter()))
+            raw = make_message(rng.randrange(10 ** 6), rng, html=False)
+            # Record the time first; the watcher may queue the id before deliver() returns
+            now = time.perf_counter()
+            message_id = mailbox.deliver(raw)
+            delivered[message_id] = now
+        consumer.join()
+        elapsed = time.perf_counter() - start
+        requests = service.stats['requests']
+    return latencies, requests / elapsed * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds over which mail arrives")
+    parser.add_argument('--arrivals', type=int, default=12)
+    parser.add_argument('--rtt', type=float, default=0.05, help="seconds per Gmail round trip")
+    parser.add_argument('--push-delay', type=float, default=0.2, help="Pub/Sub delivery delay in seconds")
+    parser.add_argument('--fixed', type=float, default=10.0, help="fixed polling interval")
+    parser.add_argument('--min-interval', type=float, default=1.0)
+    parser.add_argument('--max-interval', type=float, default=16.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':>14} {'queued':>7} {'p50 s':>7} {'p95 s':>7} {'max s':>7} {'requests/min':>13}")
+    for mode in ('fixed poll', 'adaptive poll', 'push'):
+        latencies, per_minute = run(mode, args)
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{mode:>14} {len(latencies):>7} {statistics.median(latencies):>7.2f} {p95:>7.2f} "
+              f"{latencies[-1]:>7.2f} {per_minute:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Add N documents one at a time: incremental TF-IDF index vs. full refit per add
+
+Usage: python benchmarks/bench_incremental_index.py --docs 2000 --words 400
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from rag_index import IncrementalTfidfIndex, compare_with_refit
+
+
+def make_corpus(n_docs, n_words, vocab_size=20000, seed=0):
+    """Zipf-ish synthetic documents over a fixed random vocabulary"""
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocab = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+    return [' '.join(rng.choices(vocab, weights, k=n_words)) for _ in range(n_docs)], vocab
+
+
+def bench_incremental(corpus):
+    index = IncrementalTfidfIndex()
+    timings = []
+    for i, text in enumerate(corpus):
+        start = time.perf_counter()
+        index.add(i, text)
+        timings.append(time.perf_counter() - start)
+    return index, timings
+
+
+def bench_refit(corpus, limit):
+    vectorizer = TfidfVectorizer(stop_words='english')
+    timings = []
+    for n in range(1, min(limit, len(corpus)) + 1):
+        start = time.perf_counter()
+        vectorizer.fit_transform(corpus[:n])
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def describe(label, timings):
+    total = sum(timings)
+    tail = timings[-max(1, len(timings) // 10):]
+    print(f"{label:<28} total {total:8.3f}s | mean add {1000 * total / len(timings):8.3f}ms "
+          f"| last 10% mean {1000 * sum(tail) / len(tail):8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=400)
+    parser.add_argument('--refit-limit', type=int, default=500,
+                        help="Stop the full-refit baseline after this many documents")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    corpus, vocab = make_corpus(args.docs, args.words)
+    print(f"{args.docs} documents x {args.words} words")
+
+    index, incremental = bench_incremental(corpus)
+    describe("incremental add", incremental)
+    describe(f"full refit (first {min(args.refit_limit, args.docs)})", bench_refit(corpus, args.refit_limit))
+
+    rng = random.Random(1)
+    queries = [' '.join(rng.sample(vocab[:2000], 5)) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, top_k=5)
+    query_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    print(f"query latency               mean {query_ms:.3f}ms")
+
+    report = compare_with_refit(index, dict(enumerate(corpus)), queries, tolerance=args.tolerance)
+    print(f"vs. full refit: max score diff {report['max_score_diff']:.2e}, "
+          f"rank mismatches {report['rank_mismatches']}/{report['queries']}, ok={report['ok']}")
+
+
+if __name__ == '__main__':
+    main()
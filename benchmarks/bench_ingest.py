@@ -0,0 +1,136 @@
+"""Serial upload-by-upload ingestion vs. the process-pool bulk ingest: pages/second
+
+Generates a directory of multi-page PDFs, DOCX files and a few byte-identical copies.
+
+Usage: python benchmarks/bench_ingest.py --pdfs 24 --pages 150 --docx 8 --copies 4 --workers 1 4
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PyPDF2
+import docx
+
+from kb_ingest import DOCX_TYPE, PDF_TYPE, expand_paths, file_type_for, ingest
+from rag_system import RAGSystem
+
+WORDS = ("contract party agreement term payment delivery notice liability warranty invoice schedule "
+         "termination clause supplier customer confidential renewal audit penalty service").split()
+
+
+def write_pdf(path, pages, rng, lines=40):
+    """Minimal PDF with ``pages`` pages of Helvetica text, written by hand"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        text = "".join(f"({' '.join(rng.choice(WORDS) for _ in range(12))}) Tj T* " for _ in range(lines))
+        stream = f"BT /F1 9 Tf 12 TL 40 800 Td {text}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in page_ids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_docx(path, paragraphs, rng):
+    document = docx.Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(" ".join(rng.choice(WORDS) for _ in range(40)))
+    document.save(path)
+
+
+def legacy_extract(path):
+    """Text extraction as RAGSystem did it before: one file at a time, built with +="""
+    with open(path, 'rb') as f:
+        if file_type_for(path) == PDF_TYPE:
+            reader = PyPDF2.PdfReader(f)
+            text = ""
+            for page in reader.pages:
+                text += page.extract_text() + "\n"
+            return text, len(reader.pages)
+        if file_type_for(path) == DOCX_TYPE:
+            doc = docx.Document(f)
+            text = ""
+            for paragraph in doc.paragraphs:
+                text += paragraph.text + "\n"
+            return text, len(doc.paragraphs)
+        return f.read().decode('utf-8'), 1
+
+
+def legacy_ingest(rag, paths):
+    pages = 0
+    for path in paths:
+        text, n = legacy_extract(path)
+        try:
+            rag.add_document(text, os.path.basename(path))
+            pages += n
+        except ValueError:
+            pass
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pdfs', type=int, default=24)
+    parser.add_argument('--pages', type=int, default=150)
+    parser.add_argument('--docx', type=int, default=8)
+    parser.add_argument('--copies', type=int, default=4, help="byte-identical duplicates of earlier files")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus')
+        os.makedirs(os.path.join(corpus, 'docx'))
+        for i in range(args.pdfs):
+            write_pdf(os.path.join(corpus, f"contract{i:03d}.pdf"), rng.randint(args.pages // 2, args.pages), rng)
+        for i in range(args.docx):
+            write_docx(os.path.join(corpus, 'docx', f"memo{i:03d}.docx"), 200, rng)
+        for i in range(args.copies):
+            shutil.copy(os.path.join(corpus, f"contract{i:03d}.pdf"), os.path.join(corpus, f"copy{i:03d}.pdf"))
+        paths = expand_paths([corpus])
+
+        print(f"{'mode':>12} {'files':>6} {'added':>6} {'dupes':>6} {'pages':>7} {'seconds':>8} {'pages/s':>8} "
+              f"{'extract s':>10} {'index s':>8}")
+        rag = RAGSystem(os.path.join(tmp, 'legacy_kb'))
+        start = time.perf_counter()
+        pages = legacy_ingest(rag, paths)
+        seconds = time.perf_counter() - start
+        print(f"{'serial':>12} {len(paths):>6} {len(rag.documents):>6} {len(paths) - len(rag.documents):>6} "
+              f"{pages:>7} {seconds:>8.2f} {pages / seconds:>8.1f} {'':>10} {'':>8}")
+
+        for workers in args.workers:
+            rag = RAGSystem(os.path.join(tmp, f"kb_{workers}"))
+            report = ingest(rag, [corpus], workers=workers)
+            print(f"{f'pool x{workers}':>12} {report['files']:>6} {report['added']:>6} "
+                  f"{report['duplicates'] + report['skipped']:>6} {report['pages']:>7} {report['seconds']:>8.2f} "
+                  f"{report['pages_per_second']:>8.1f} {report['extract_seconds']:>10.2f} "
+                  f"{report['index_seconds']:>8.2f}")
+            # Everything is already there on a second run
+            again = ingest(rag, [corpus], workers=workers)
+            assert again['added'] == 0 and again['duplicates'] == again['files']
+        reloaded = RAGSystem(os.path.join(tmp, f"kb_{args.workers[-1]}"))
+        assert len(reloaded.documents) == report['added']
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Cold start and single-add cost: legacy documents.json + refit vs. the mapped binary store
+
+Usage: python benchmarks/bench_kb_cold_start.py --docs 2000 --words 400
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from rag_system import RAGSystem
+from bench_incremental_index import make_corpus
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<36} {1000 * (time.perf_counter() - start):10.1f}ms")
+    return result
+
+
+def legacy_cold_start(path):
+    with open(path) as f:
+        documents = json.load(f)
+    TfidfVectorizer(max_features=1000, stop_words='english').fit_transform([doc['content'] for doc in documents])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=400)
+    args = parser.parse_args()
+
+    corpus, _ = make_corpus(args.docs, args.words)
+    with tempfile.TemporaryDirectory() as storage:
+        legacy_path = os.path.join(storage, 'documents.json')
+        documents = [{'id': str(i), 'title': f"doc {i}", 'content': text} for i, text in enumerate(corpus)]
+        timed("legacy save (one mutation)", lambda: json.dump(documents, open(legacy_path, 'w'), indent=2))
+        timed("legacy cold start (parse + refit)", lambda: legacy_cold_start(legacy_path))
+
+        timed("one-shot migration", lambda: RAGSystem(storage))
+        rag = timed("binary cold start (map files)", lambda: RAGSystem(storage))
+        timed("binary single add", lambda: rag.add_document("A brand new policy about expenses", "new"))
+        timed("first query after cold start", lambda: rag.get_relevant_context("policy expenses"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""One-piece reply prompts vs. a stable system prefix with keep_alive against the fake Ollama server: prefill per reply
+
+Replies arrive ``--gap`` seconds apart, longer than the server's own
+``--server-keep-alive``, as auto-replies to a quiet inbox do.
+
+Usage: python benchmarks/bench_kv_prefix.py --emails 30 --gap 0.3 --server-keep-alive 0.2 --load-delay 0.5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent import AIAgent
+from fake_ollama import FakeOllamaServer
+
+PROFILE = {'name': "Alex Doe", 'role': "Account Manager", 'company': "ACME Logistics",
+           'email': "alex@acme.example",
+           'bio': "Looks after the enterprise accounts in the northern region and the quarterly supplier reviews. " * 3,
+           'preferences': "Short, friendly replies; always confirm dates and owners; sign off with first name only"}
+TOPICS = ["delivery schedule", "invoice 4471", "the warehouse audit", "next quarter's pricing", "the onboarding call"]
+
+
+def make_email(i):
+    topic = TOPICS[i % len(TOPICS)]
+    return {'id': str(i), 'sender': f"Sam Lee <sam{i}@example.com>", 'subject': f"Question about {topic}",
+            'date': "Mon, 1 Jan 2024 09:00:00 +0000",
+            'body': f"Hi Alex,\n\nCould you confirm where we are with {topic}? The team asked for an update "
+                    f"before Friday and I want to make sure the numbers match what we agreed last month.\n\nThanks,\nSam"}
+
+
+def legacy_prompt(email, profile, style="Professional"):
+    """The reply prompt as one piece, with the email ahead of the instructions, as it was built before"""
+    return f"""You are an intelligent email assistant helping to compose professional email replies.
+
+My Profile:
+- Name: {profile['name']}
+- Role: {profile['role']}
+- Company: {profile['company']}
+- Email: {profile['email']}
+- Bio: {profile['bio']}
+- Preferences: {profile['preferences']}
+
+Email to Reply To:
+From: {email['sender']}
+Subject: {email['subject']}
+Date: {email['date']}
+Body: {email['body']}
+
+Instructions:
+- Current date: {datetime.now().strftime("%B %d, %Y")}
+- Response style: {style} - {AIAgent.STYLE_GUIDE[style]}
+- Custom instruction: Reply appropriately to the email
+- Use the sender's name if available
+- Include my name ({profile['name']}) in the signature
+- Keep the reply concise but complete
+- Be helpful and professional
+- Address the main points in the original email
+
+Generate only the email reply content (no subject line needed):"""
+
+
+def run(agent, emails, payload_for, gap):
+    """Seconds spent loading and prefilling, and prompt tokens evaluated, per reply"""
+    rows = []
+    for email in emails:
+        for chunk in agent.client.stream('/api/generate', payload_for(email), timeout=60):
+            if chunk.get('done'):
+                rows.append(((chunk['load_duration'] + chunk['prompt_eval_duration']) / 1e9,
+                             chunk['prompt_eval_count']))
+        time.sleep(gap)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=30)
+    parser.add_argument('--gap', type=float, default=0.3, help="seconds between replies")
+    parser.add_argument('--server-keep-alive', type=float, default=0.2, help="server default, stands in for 5m")
+    parser.add_argument('--load-delay', type=float, default=0.5)
+    parser.add_argument('--prompt-delay', type=float, default=0.002, help="fake server seconds per prompt token")
+    args = parser.parse_args()
+
+    emails = [make_email(i) for i in range(args.emails)]
+    with FakeOllamaServer(prompt_delay=args.prompt_delay, token_delay=0, tokens=1, load_delay=args.load_delay,
+                          keep_alive=args.server_keep_alive) as server:
+        agent = AIAgent(base_url=server.base_url, cache=False)
+
+        def legacy_payload(email):
+            return {"model": agent.model, "prompt": legacy_prompt(email, PROFILE),
+                    "options": {"temperature": 0.7, "top_p": 0.9, "max_tokens": 500}}
+
+        def kept_payload(email):
+            return agent._payload(legacy_prompt(email, PROFILE), agent.REPLY_OPTIONS)
+
+        def prefixed_payload(email):
+            system, prompt = agent._build_prompt(email, PROFILE, "", "", "Professional")
+            return agent._payload(prompt, agent.REPLY_OPTIONS, system)
+
+        results = []
+        modes = (('one piece', legacy_payload), ('+keep_alive', kept_payload), ('+system', prefixed_payload))
+        for mode, payload_for in modes:
+            server.unload()
+            server.reset_counters()
+            rows = run(agent, emails, payload_for, args.gap)
+            results.append((mode, rows, server.loads, server.reused_words / server.prompt_words))
+
+    print(f"{'mode':>12} {'first ms':>9} {'p50 ms':>8} {'mean ms':>8} {'evaluated':>10} {'reused':>7} {'loads':>6}")
+    for mode, rows, loads, reused in results:
+        seconds = [row[0] for row in rows]
+        print(f"{mode:>12} {seconds[0] * 1000:>9.1f} {statistics.median(seconds[1:]) * 1000:>8.1f} "
+              f"{statistics.mean(seconds) * 1000:>8.1f} {statistics.mean(row[1] for row in rows):>10.0f} "
+              f"{reused:>7.0%} {loads:>6}")
+
+
+if __name__ == '__main__':
+    main()
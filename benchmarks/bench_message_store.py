@@ -0,0 +1,75 @@
+"""Linear scan over an email list vs. the SQLite FTS5 message store: search, thread and label lookup latency
+
+Usage: python benchmarks/bench_message_store.py --emails 20000 --queries 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import SENTENCES, TOPICS, FakeMailbox
+from gmail_fetcher import message_to_email
+from message_store import SQLiteMessageStore
+
+
+def scan_search(emails, text, limit=20):
+    """What the app could do before: substring-match every word over every email"""
+    words = text.lower().split()
+    hits = [email for email in emails
+            if all(word in f"{email['subject']} {email['sender']} {email['body']}".lower() for word in words)]
+    return hits[:limit]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    mailbox = FakeMailbox.generate(args.emails, seed=1)
+    emails = []
+    for message_id in mailbox.order:
+        message = mailbox.messages[message_id]
+        emails.append(message_to_email(message, with_body=True))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteMessageStore(os.path.join(tmp, 'messages.sqlite'))
+        start = time.perf_counter()
+        store.upsert(emails)
+        load_s = time.perf_counter() - start
+        print(f"stored {len(store)} emails in {load_s:.2f}s (fts5: {store.has_fts})")
+
+        rng = random.Random(0)
+        searches = [f"{rng.choice(TOPICS)} {rng.choice(rng.choice(SENTENCES).split()).strip('.,?')}"
+                    for _ in range(args.queries)]
+        threads = [rng.choice(emails)['threadId'] for _ in range(args.queries)]
+        by_id = [rng.choice(emails)['id'] for _ in range(args.queries)]
+
+        rows = [
+            ('search', timed(lambda q: scan_search(emails, q), searches), timed(store.search, searches)),
+            ('thread', timed(lambda t: [e for e in emails if e['threadId'] == t], threads), timed(store.thread, threads)),
+            ('by id', timed(lambda i: next(e for e in emails if e['id'] == i), by_id), timed(store.get, by_id)),
+            ('unread 10', timed(lambda _: sorted((e for e in emails if 'UNREAD' in e['labels']),
+                                                 key=lambda e: e['internal_date'], reverse=True)[:10], by_id),
+             timed(lambda _: store.list('UNREAD', 10), by_id)),
+        ]
+        store.close()
+
+    print(f"{'lookup':>10} {'scan ms':>9} {'store ms':>9} {'speedup':>8}")
+    for name, scan_ms, store_ms in rows:
+        print(f"{name:>10} {scan_ms:>9.2f} {store_ms:>9.2f} {scan_ms / store_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
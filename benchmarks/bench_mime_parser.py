@@ -0,0 +1,96 @@
+"""Top-level-only body extraction vs. mime_parser on the fixture corpus: correctness and messages/sec
+
+Usage: python benchmarks/bench_mime_parser.py --messages 5000
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox, make_message
+from mime_parser import MimeMessage
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'mime')
+
+
+def legacy_body(message):
+    """The original extraction: top-level text/plain only, always decoded as UTF-8"""
+    payload = message['payload']
+    body = None
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+                break
+    else:
+        if 'data' in payload['body']:
+            body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+    return body
+
+
+def check(extract, message, expected):
+    try:
+        body = extract(message)
+    except Exception as e:
+        return type(e).__name__
+    return 'ok' if body and expected in body else 'missing'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000, help="messages parsed per throughput run")
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    mailbox = FakeMailbox()
+    cases = []
+    for name, phrase in expected.items():
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            cases.append((name, mailbox.deliver(f.read()), phrase))
+    # Over Gmail's inline size, so the body is only reachable through attachments.get
+    rng = random.Random(0)
+    cases.append(('large body (generated)', mailbox.deliver(make_message(0, rng, body_sentences=8000, html=False)),
+                  "Could you send"))
+    service = FakeGmailService(mailbox)
+    messages = {message_id: service.users().messages().get(userId='me', id=message_id).execute()
+                for _, message_id, _ in cases}
+
+    print(f"{'fixture':<40} {'legacy':>18} {'mime_parser':>12}")
+    for name, message_id, phrase in cases:
+        message = messages[message_id]
+        new = check(lambda m: MimeMessage(m, service).body(), message, phrase)
+        print(f"{name:<40} {check(legacy_body, message, phrase):>18} {new:>12}")
+
+    # Throughput over the fixtures plus generated mail, all bodies inline
+    generated = FakeMailbox.generate(200, seed=1)
+    corpus = [mailbox.messages[message_id] for name, message_id, _ in cases if not name.startswith('large')]
+    corpus += [generated.messages[message_id] for message_id in generated.order]
+    workload = [corpus[i % len(corpus)] for i in range(args.messages)]
+
+    def run(extract):
+        start = time.perf_counter()
+        for message in workload:
+            try:
+                extract(message)
+            except Exception:
+                pass
+        return len(workload) / (time.perf_counter() - start)
+
+    print(f"\n{'mode':<28} {'messages/s':>11}")
+    for mode, extract in (('legacy top-level', legacy_body),
+                          ('mime_parser body', lambda m: MimeMessage(m).body()),
+                          ('mime_parser index only', MimeMessage),
+                          ('stdlib email get_body', lambda m: BytesParser().parsebytes(m['raw']).get_body(
+                              ('plain', 'html')).get_content())):
+        print(f"{mode:<28} {run(extract):>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""MinHash LSH vs. a linear scan for near-duplicate lookup, and triage with near-duplicate reuse
+
+Part one indexes documents plus edited copies and compares LSH lookups with
+scanning every signature, scoring both against exact shingle Jaccard. Part
+two triages an inbox of templated notifications and personal mail against
+the fake Ollama server with and without sharing results across clusters.
+
+Usage: python benchmarks/bench_near_duplicates.py --docs 5000 --queries 100 --emails 200
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent import AIAgent
+from fake_ollama import FakeOllamaServer
+from near_duplicates import NearDuplicateIndex, email_index, shingles
+from triage import triage_inbox
+
+# No digits in the vocabulary: mail shingles mask them
+WORDS = ["".join(letters) for letters in itertools.product("bdfgklmnprst", "aeiou", "bdfgklmnprst")]
+TEMPLATES = [
+    ("orders@shop.example.com", "Your order {n} has shipped",
+     "Hello, your order {n} left our warehouse on {d} and should arrive within {k} days. "
+     "Track it with number {m}. Thank you for shopping with us."),
+    ("billing@cloud.example.com", "Invoice {n} is available",
+     "Your invoice {n} for {d} totalling {k}.{m} EUR is now available in the billing console. "
+     "Payment will be taken automatically from your card on file."),
+    ("noreply@ci.example.com", "Build {n} failed on main",
+     "Build {n} of the main branch failed at step {k} after {m} seconds. "
+     "The failing job was triggered by the merge on {d}. See the log for details."),
+    ("calendar@example.com", "Reminder: review meeting on {d}",
+     "This is a reminder that the review meeting is scheduled for {d} at {k}:00 in room {m}. "
+     "Please prepare your status update before the meeting."),
+]
+
+
+def edit(words, rng, changes):
+    words = list(words)
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return words
+
+
+def exact_jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def bench_lookup(args, rng):
+    base = [[rng.choice(WORDS) for _ in range(args.words)] for _ in range(args.docs)]
+    index = NearDuplicateIndex(args.threshold)
+    start = time.perf_counter()
+    for i, words in enumerate(base):
+        index.add(i, " ".join(words))
+    add_us = (time.perf_counter() - start) / len(base) * 1e6
+
+    # Queries: light edits (should match), heavy edits (should not) and unrelated text
+    queries = []
+    for _ in range(args.queries):
+        original = rng.randrange(len(base))
+        changes = rng.choice([1, 2, 4, args.words // 4, args.words // 2])
+        queries.append(" ".join(edit(base[original], rng, changes)))
+    keys = list(index._signatures)
+    signatures = np.stack([index._signatures[key] for key in keys])
+    shingle_sets = [set(shingles(" ".join(words)).tolist()) for words in base]
+
+    print(f"{args.docs} documents of {args.words} words, threshold {args.threshold} "
+          f"({index.bands} bands x {index.rows} rows), add {add_us:.0f} us/doc")
+    print(f"{'mode':>8} {'lookup us':>10} {'recall':>7} {'precision':>10}")
+    truth = []
+    for query in queries:
+        query_set = set(shingles(query).tolist())
+        truth.append({i for i, other in enumerate(shingle_sets)
+                      if exact_jaccard(query_set, other) >= args.threshold})
+
+    def linear(signature):
+        similarity = (signatures == signature).mean(axis=1)
+        return [(keys[i], similarity[i]) for i in np.nonzero(similarity >= args.threshold)[0]]
+
+    for mode, lookup in (('linear', linear), ('lsh', lambda signature: index.find(signature=signature))):
+        samples, found, relevant, hits = [], 0, 0, 0
+        for query, expected in zip(queries, truth):
+            signature = index.signature(query)
+            start = time.perf_counter()
+            matches = {key for key, _ in lookup(signature)}
+            samples.append(time.perf_counter() - start)
+            found += len(matches)
+            relevant += len(expected)
+            hits += len(matches & expected)
+        print(f"{mode:>8} {statistics.median(samples) * 1e6:>10.1f} {hits / max(relevant, 1):>7.0%} "
+              f"{hits / max(found, 1):>10.0%}")
+
+
+def make_inbox(n, share, rng):
+    emails = []
+    for i in range(n):
+        if rng.random() < share:
+            sender, subject, body = rng.choice(TEMPLATES)
+            values = {'n': rng.randint(10000, 99999), 'd': f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+                      'k': rng.randint(2, 9), 'm': rng.randint(100, 999)}
+            emails.append({'id': str(i), 'sender': sender, 'subject': subject.format(**values),
+                           'body': body.format(**values), 'template': sender})
+        else:
+            emails.append({'id': str(i), 'sender': f"{WORDS[i % len(WORDS)]}@example.com",
+                           'subject': f"Question about {rng.choice(WORDS)}",
+                           'body': " ".join(rng.choice(WORDS) for _ in range(60)), 'template': None})
+        emails[-1]['date'] = "Mon, 1 Jan 2024 09:00:00 +0000"
+    return emails
+
+
+def bench_triage(args, rng):
+    emails = make_inbox(args.emails, args.templated, rng)
+    print(f"\n{len(emails)} emails, {sum(email['template'] is not None for email in emails)} templated")
+    print(f"{'mode':>8} {'seconds':>8} {'requests':>9} {'reused':>7} {'wrong reuse':>12}")
+    with FakeOllamaServer(parallel=args.parallel, token_delay=args.token_delay, tokens=args.tokens) as server:
+        for mode in ('each', 'cluster'):
+            agent = AIAgent(base_url=server.base_url, cache=False)
+            server.reset_counters()
+            options = {'near_duplicates': email_index()} if mode == 'cluster' else {}
+            start = time.perf_counter()
+            results = triage_inbox(agent, emails, concurrency=args.concurrency, **options)
+            seconds = time.perf_counter() - start
+            by_id = {email['id']: email for email in emails}
+            reused = [result for result in results if result['reused_from'] is not None]
+            # Reuse is only right between notifications from the same template
+            wrong = sum(result['email']['template'] is None
+                        or by_id[result['reused_from']]['template'] != result['email']['template']
+                        for result in reused)
+            assert not any(result['error'] for result in results)
+            print(f"{mode:>8} {seconds:>8.2f} {server.requests:>9} {len(reused):>7} {wrong:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--words', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=0.9)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--templated', type=float, default=0.6, help="share of emails that are notifications")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--parallel', type=int, default=4, help="generations the fake server runs at once")
+    parser.add_argument('--token-delay', type=float, default=0.002)
+    parser.add_argument('--tokens', type=int, default=16)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    bench_lookup(args, rng)
+    bench_triage(args, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""One send per reply vs. the batched outbox, plus a crash mid-flush: throughput and duplicate sends
+
+Usage: python benchmarks/bench_outbox.py --replies 300 --rtt 0.05 --batch-size 10 --concurrency 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmailService, FakeMailbox
+from gmail_fetcher import message_to_email
+from outbox import Outbox, reply_message
+
+
+class LostResponses:
+    """Service whose batches reach Gmail but whose responses are lost after ``after`` batches"""
+
+    def __init__(self, service, after):
+        self.service = service
+        self.after = after
+
+    def users(self):
+        return self.service.users()
+
+    def new_batch_http_request(self, callback=None):
+        batch = self.service.new_batch_http_request(callback=callback)
+        execute = batch.execute
+
+        def lossy_execute():
+            if self.after > 0:
+                self.after -= 1
+                return execute()
+            batch.callback = None
+            execute()
+            raise ConnectionResetError("connection reset before the response arrived")
+
+        batch.execute = lossy_execute
+        return batch
+
+
+def sent_ids(mailbox):
+    """RFC 822 Message-IDs of every SENT message, with repeats"""
+    return Counter(mailbox._rfc822_id(message_id) for message_id in mailbox.order
+                   if 'SENT' in mailbox.messages[message_id]['labelIds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replies', type=int, default=300)
+    parser.add_argument('--rtt', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    inbox = FakeMailbox.generate(args.replies)
+    emails = [message_to_email(inbox.messages[message_id]) for message_id in inbox.order]
+    replies = [(email, f"Thanks for your email about {email['subject']}.") for email in emails]
+
+    # One messages.send round trip per reply, as the send button did
+    mailbox = FakeMailbox()
+    service = FakeGmailService(mailbox, rtt=args.rtt)
+    start = time.perf_counter()
+    for i, (email, text) in enumerate(replies):
+        raw = reply_message(email, text, f"<serial-{i}@example.com>")
+        service.users().messages().send(userId='me', body={'raw': raw}).execute()
+    serial_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'outbox.sqlite')
+        mailbox = FakeMailbox()
+        service = FakeGmailService(mailbox, rtt=args.rtt)
+        outbox = Outbox(path)
+        for email, text in replies:
+            outbox.add(email, text)
+        # Queuing again is a no-op
+        assert not any(outbox.add(email, text) for email, text in replies)
+        report = outbox.flush(service, batch_size=args.batch_size, concurrency=args.concurrency)
+        outbox.close()
+
+        print(f"{'mode':>10} {'sent':>6} {'trips':>6} {'seconds':>8} {'msg/s':>7}")
+        print(f"{'serial':>10} {len(replies):>6} {len(replies):>6} {serial_s:>8.2f} {len(replies) / serial_s:>7.1f}")
+        print(f"{'outbox':>10} {report['sent']:>6} {service.stats['round_trips']:>6} {report['seconds']:>8.2f} "
+              f"{report['per_second']:>7.1f}")
+
+        # Crash: responses are lost after three batches, then the process restarts
+        crash_path = os.path.join(tmp, 'crash.sqlite')
+        mailbox = FakeMailbox()
+        service = FakeGmailService(mailbox, rtt=args.rtt)
+        outbox = Outbox(crash_path)
+        for email, text in replies:
+            outbox.add(email, text)
+        first = outbox.flush(LostResponses(service, after=3), batch_size=args.batch_size, concurrency=1, limit=50)
+        outbox.close()
+
+        # Restarted once Gmail search has caught up, so unsent rows are requeued right away
+        outbox = Outbox(crash_path, search_lag=0)
+        second = outbox.flush(service, batch_size=args.batch_size, concurrency=args.concurrency)
+        counts = outbox.counts()
+        outbox.close()
+        repeats = sent_ids(mailbox)
+        duplicates = sum(n - 1 for n in repeats.values())
+        print(f"\ncrash run: {first['sent']} confirmed and {first['unknown']} unknown before the crash; "
+              f"after restart {second['reconciled']} reconciled, {second['sent']} sent")
+        print(f"outbox {counts}; {len(repeats)} distinct replies in SENT, {duplicates} duplicates")
+        assert duplicates == 0 and len(repeats) == len(replies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Per-query latency as documents grow: passage index vs. whole-document rank + snippet scan
+
+Usage: python benchmarks/bench_passage_retrieval.py --lengths 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_index import IncrementalTfidfIndex
+from rag_system import RAGSystem
+from bench_incremental_index import make_corpus
+
+
+def legacy_snippet(text, query, snippet_length=200):
+    """The pre-passage ``_extract_relevant_snippet`` word-window scan"""
+    query_words = query.lower().split()
+    best_pos = 0
+    best_score = 0
+    words = text.split()
+    for i in range(len(words)):
+        snippet_lower = ' '.join(words[i:i + 50]).lower()
+        score = sum(1 for word in query_words if word in snippet_lower)
+        if score > best_score:
+            best_score = score
+            best_pos = i
+    snippet = ' '.join(words[max(0, best_pos - 10):min(len(words), best_pos + 40)])
+    return snippet[:snippet_length] + "..." if len(snippet) > snippet_length else snippet
+
+
+def time_queries(run, queries):
+    start = time.perf_counter()
+    for query in queries:
+        run(query)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=5)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'words/doc':>10} {'legacy ms':>10} {'passage ms':>11}")
+    for length in args.lengths:
+        corpus, vocab = make_corpus(args.docs, length, seed=length)
+        rng = random.Random(1)
+        queries = [' '.join(rng.sample(vocab[:2000], 5)) for _ in range(args.queries)]
+
+        legacy_index = IncrementalTfidfIndex()
+        for i, text in enumerate(corpus):
+            legacy_index.add(i, text)
+
+        def legacy(query):
+            for i, _ in legacy_index.search(query, top_k=3, min_score=0.0):
+                legacy_snippet(corpus[i], query)
+
+        with tempfile.TemporaryDirectory() as storage:
+            rag = RAGSystem(storage)
+            for i, text in enumerate(corpus):
+                rag.add_document(text, title=f"doc {i}")
+            passage_ms = time_queries(lambda q: rag.get_relevant_context(q, min_similarity=0.0), queries)
+
+        legacy_ms = time_queries(legacy, queries)
+        print(f"{length:>10} {legacy_ms:>10.2f} {passage_ms:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
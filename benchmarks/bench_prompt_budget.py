@@ -0,0 +1,114 @@
+"""Unbounded vs. token-budgeted reply prompts against the fake Ollama server: prompt size and prefill time
+
+Usage: python benchmarks/bench_prompt_budget.py --emails 40 --num-ctx 4096 --prompt-delay 0.0005
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent import AIAgent
+from fake_ollama import FakeOllamaServer
+from prompt_budget import estimate_tokens
+
+PROFILE = {'name': "Alex Doe", 'role': "Account Manager", 'company': "ACME", 'email': "alex@acme.example",
+           'bio': "Looks after the enterprise accounts. " * 5, 'preferences': "Short and friendly"}
+SENTENCE = "Could you confirm the delivery schedule and the revised numbers for the quarterly report? "
+
+
+def make_email(i):
+    """Mix of short notes, long quoted threads and newsletters, as in a real inbox"""
+    kind = i % 3
+    if kind == 0:
+        body = f"Hi Alex,\n\n{SENTENCE * 2}\n\nThanks,\nSam\n-- \nSam Lee | Example Corp\n+1 555 0100"
+    elif kind == 1:
+        # Every reply quotes the whole thread below it
+        body = f"Hi Alex,\n\n{SENTENCE}\n\nThanks,\nSam\n"
+        quoted = ""
+        for depth in range(1 + i % 12):
+            quoted = f"\nOn Mon, Jan {depth + 1}, 2024 at 9:00 AM Sam <sam@example.com> wrote:\n" + "\n".join(
+                "> " + line for line in (SENTENCE * 4 + quoted).splitlines()
+            )
+        body += quoted
+    else:
+        body = "This week's product newsletter.\n\n" + (SENTENCE * (40 + i * 8))
+    return {'id': str(i), 'sender': "Sam Lee <sam@example.com>", 'subject': f"Quarterly report {i}",
+            'date': "Mon, 1 Jan 2024 09:00:00 +0000", 'body': body}
+
+
+def make_passages(n, words):
+    return [{'doc_id': f"doc{i}", 'passage': 0, 'title': f"Policy {i}",
+             'content': " ".join(["delivery schedule and pricing terms"] * (words // 5)),
+             'similarity': 0.9 - i * 0.05} for i in range(n)]
+
+
+def legacy_prompt(email, profile, passages):
+    """The prompt as it was built before budgeting: full body, every passage"""
+    context = "\n\n".join(f"From '{passage['title']}':\n{passage['content']}" for passage in passages)
+    return (f"You are an intelligent email assistant helping to compose professional email replies.\n\n"
+            f"My Profile:\n- Name: {profile['name']}\n- Role: {profile['role']}\n- Company: {profile['company']}\n"
+            f"- Email: {profile['email']}\n- Bio: {profile['bio']}\n- Preferences: {profile['preferences']}\n\n"
+            f"Email to Reply To:\nFrom: {email['sender']}\nSubject: {email['subject']}\nDate: {email['date']}\n"
+            f"Body: {email['body']}\n\nRelevant Context from Knowledge Base:\n{context}\n\n"
+            f"Instructions:\n- Keep the reply concise but complete\n\n"
+            f"Generate only the email reply content (no subject line needed):")
+
+
+def prefill(agent, prompt, options):
+    """Server-reported prompt evaluation time in seconds and prompt tokens evaluated"""
+    for chunk in agent.client.stream('/api/generate', {"model": agent.model, "prompt": prompt, "options": options},
+                                     timeout=60):
+        if chunk.get('done'):
+            return chunk['prompt_eval_duration'] / 1e9, chunk['prompt_eval_count']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=40)
+    parser.add_argument('--passages', type=int, default=8)
+    parser.add_argument('--passage-words', type=int, default=400)
+    parser.add_argument('--num-ctx', type=int, default=4096)
+    parser.add_argument('--prompt-delay', type=float, default=0.0005, help="fake server seconds per prompt token")
+    args = parser.parse_args()
+
+    emails = [make_email(i) for i in range(args.emails)]
+    passages = make_passages(args.passages, args.passage_words)
+
+    with FakeOllamaServer(prompt_delay=args.prompt_delay, token_delay=0, tokens=1) as server:
+        agent = AIAgent(base_url=server.base_url, cache=False, num_ctx=args.num_ctx)
+        rows = []
+        modes = [
+            # Before: max_tokens is ignored by Ollama and num_ctx falls back to the server default
+            ('unbounded', lambda email: legacy_prompt(email, PROFILE, passages), {"temperature": 0.7,
+                                                                                 "max_tokens": 500}),
+            # Raising num_ctx alone makes prefill grow with the email
+            ('num_ctx only', lambda email: legacy_prompt(email, PROFILE, passages), agent._options(agent.REPLY_OPTIONS)),
+            ('budgeted', lambda email: "\n\n".join(agent._build_prompt(email, PROFILE, "", passages, "Professional")),
+             agent._options(agent.REPLY_OPTIONS))
+        ]
+        for mode, build, options in modes:
+            server.reset_counters()
+            build_s, sizes, prefills = 0.0, [], []
+            for email in emails:
+                start = time.perf_counter()
+                prompt = build(email)
+                build_s += time.perf_counter() - start
+                sizes.append(estimate_tokens(prompt))
+                prefills.append(prefill(agent, prompt, options)[0])
+            rows.append((mode, sizes, prefills, server.truncated, build_s / len(emails)))
+
+    print(f"{'mode':>12} {'tokens p50':>11} {'tokens max':>11} {'prefill p50 ms':>15} {'prefill max ms':>15} "
+          f"{'stdev ms':>9} {'truncated':>10} {'build ms':>9}")
+    for mode, sizes, prefills, truncated, build_s in rows:
+        print(f"{mode:>12} {statistics.median(sizes):>11.0f} {max(sizes):>11} "
+              f"{statistics.median(prefills) * 1000:>15.1f} {max(prefills) * 1000:>15.1f} "
+              f"{statistics.pstdev(prefills) * 1000:>9.1f} {truncated:>10} {build_s * 1000:>9.2f}")
+    budget = args.num_ctx - AIAgent.REPLY_OPTIONS['num_predict']
+    print(f"\nprompt budget: num_ctx {args.num_ctx} - num_predict {AIAgent.REPLY_OPTIONS['num_predict']} = {budget}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Re-ranking every retrieval vs. the generation-tagged query cache: ms per context lookup
+
+Replays the reply screen: each email is retrieved for Generate, Regenerate and
+a few quick actions. Every few emails a note on the current email is added to
+the knowledge base and the email retrieved again, which must see the note.
+
+Usage: python benchmarks/bench_query_cache.py --docs 2000 --emails 50 --repeats 5 --add-every 10
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_system import RAGSystem
+
+WORDS = ["".join(letters) for letters in itertools.product("bdfgklmnprst", "aeiou", "bdfgklmnprst")]
+
+
+def make_text(rng, words=120):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--emails', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=5, help="retrievals per email")
+    parser.add_argument('--add-every', type=int, default=10, help="add a document after this many emails")
+    parser.add_argument('--retriever', default='hybrid')
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    documents = [{'text': f"Document {i}. " + make_text(rng), 'title': f"Document {i}"} for i in range(args.docs)]
+    bodies = [make_text(rng, 80) for _ in range(args.emails)]
+
+    print(f"{'mode':>8} {'ms/lookup':>10} {'hit rate':>9} {'stale':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode, cache_size in (('uncached', 0), ('cached', 256)):
+            rag = RAGSystem(os.path.join(tmp, mode), retriever=args.retriever, query_cache_size=cache_size,
+                            near_duplicate_threshold=None)
+            rag.add_documents(documents)
+            samples, contexts = [], []
+
+            def lookup(query):
+                start = time.perf_counter()
+                contexts.append(rag.get_relevant_context(query, max_results=8))
+                samples.append(time.perf_counter() - start)
+
+            for n, body in enumerate(bodies, 1):
+                for repeat in range(args.repeats):
+                    # Quick actions re-submit the same body, sometimes with different case and spacing
+                    lookup(body if repeat % 2 else "  " + body.upper())
+                if n % args.add_every == 0:
+                    rag.add_document(f"Notes on email {n}: {body}", f"Notes {n}")
+                    lookup(body)
+                    assert f"Notes {n}" in contexts[-1]
+            results[mode] = contexts
+            stats = rag.query_cache_stats()
+            # A cached context that differs from a fresh ranking means a missed invalidation
+            stale = sum(a != b for a, b in zip(results[mode], results['uncached']))
+            print(f"{mode:>8} {statistics.mean(samples) * 1e3:>10.2f} {stats.get('hit_rate', 0.0):>9.0%} "
+                  f"{stale:>6}")
+            rag.store.close()
+
+
+if __name__ == '__main__':
+    main()
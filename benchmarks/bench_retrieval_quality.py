@@ -0,0 +1,84 @@
+"""Recall@k and p50/p99 query latency per retriever on the bundled synthetic corpus
+
+Usage: python benchmarks/bench_retrieval_quality.py [--k 1 3 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from dense_retriever import DenseRetriever, HashingEmbedder
+from hybrid_retriever import BM25Retriever, HybridRetriever
+from rag_system import RAGSystem
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def read_jsonl(name):
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return [json.loads(line) for line in f]
+
+
+def retriever_configs():
+    """(label, factory) pairs; factories return a RAGSystem ``retriever`` argument"""
+    return [
+        ('tfidf', lambda: 'tfidf'),
+        ('bm25', lambda: 'bm25'),
+        ('hybrid bm25+tfidf', lambda: 'hybrid'),
+        ('dense (hashing)', lambda: DenseRetriever(HashingEmbedder())),
+        ('hybrid bm25+dense', lambda: HybridRetriever([BM25Retriever(), DenseRetriever(HashingEmbedder())])),
+    ]
+
+
+def evaluate(rag, queries, ks, pool=20):
+    ids_by_title = {doc['title']: doc['id'] for doc in read_jsonl('synthetic_kb.jsonl')}
+    hits_at = {kind: {k: [] for k in ks} for kind in ('short', 'email')}
+    latencies = {'short': [], 'email': []}
+
+    for query in queries:
+        start = time.perf_counter()
+        passages = rag.get_relevant_passages(query['query'], max_results=pool, min_similarity=0.0)
+        latencies[query['kind']].append(1000 * (time.perf_counter() - start))
+
+        ranked = []
+        for passage in passages:
+            doc_id = ids_by_title[passage['title']]
+            if doc_id not in ranked:
+                ranked.append(doc_id)
+        for k in ks:
+            hits_at[query['kind']][k].append(bool(set(ranked[:k]) & set(query['relevant'])))
+    return hits_at, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5])
+    args = parser.parse_args()
+
+    documents = read_jsonl('synthetic_kb.jsonl')
+    queries = read_jsonl('synthetic_queries.jsonl')
+    print(f"{len(documents)} documents, {len(queries)} queries\n")
+
+    header = f"{'retriever':<20} {'queries':<6}" + ''.join(f" {'R@' + str(k):>6}" for k in args.k)
+    print(header + f" {'p50 ms':>8} {'p99 ms':>8}")
+    for label, factory in retriever_configs():
+        with tempfile.TemporaryDirectory() as storage:
+            rag = RAGSystem(storage, retriever=factory())
+            for doc in documents:
+                rag.add_document(doc['text'], title=doc['title'])
+
+            hits_at, latencies = evaluate(rag, queries, args.k)
+            for kind in ('short', 'email'):
+                recalls = ''.join(f" {np.mean(hits_at[kind][k]):>6.3f}" for k in args.k)
+                p50, p99 = np.percentile(latencies[kind], [50, 99])
+                print(f"{label:<20} {kind:<6}{recalls} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
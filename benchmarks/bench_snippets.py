@@ -0,0 +1,79 @@
+"""Per-position snippet loop vs. prefix-sum window scoring over term ids: ms per query on long documents
+
+Usage: python benchmarks/bench_snippets.py --words 100000 --queries 5
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_index import best_window, tokenize
+
+# Same-length words, so the legacy substring test and term equality agree
+WORDS = ["".join(letters) for letters in itertools.product("bdfgklmnprst", "aeiou", "bdfgklmnprst", "aeiou")]
+
+
+def legacy_best_position(text, query):
+    """Window search from the old ``RAGSystem._extract_relevant_snippet``, unchanged"""
+    query_words = query.lower().split()
+
+    best_pos = 0
+    best_score = 0
+
+    words = text.split()
+    for i in range(len(words)):
+        snippet = ' '.join(words[i:i+50])  # 50 word window
+        snippet_lower = snippet.lower()
+
+        score = sum(1 for word in query_words if word in snippet_lower)
+        if score > best_score:
+            best_score = score
+            best_pos = i
+    return best_pos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--query-words', type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    text = " ".join(rng.choice(WORDS) for _ in range(args.words))
+    queries = [" ".join(rng.sample(WORDS, args.query_words)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    vocabulary = {}
+    term_ids, _ = tokenize(text, vocabulary)
+    tokenize_ms = (time.perf_counter() - start) * 1e3
+
+    legacy, vectorised, agree = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        expected = legacy_best_position(text, query)
+        legacy.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query_ids, _ = tokenize(query, vocabulary)
+        actual = best_window(term_ids, query_ids, 50)
+        vectorised.append(time.perf_counter() - start)
+        agree += actual == expected
+
+    legacy_ms = statistics.median(legacy) * 1e3
+    vectorised_ms = statistics.median(vectorised) * 1e3
+    print(f"{args.words} words, {len(set(term_ids.tolist()))} distinct terms, "
+          f"{args.query_words}-word queries; tokenised once in {tokenize_ms:.1f} ms")
+    print(f"{'mode':>12} {'ms/query':>10} {'speedup':>8} {'same window':>12}")
+    print(f"{'loop':>12} {legacy_ms:>10.1f} {1.0:>8.1f} {'':>12}")
+    print(f"{'prefix sum':>12} {vectorised_ms:>10.2f} {legacy_ms / vectorised_ms:>8.0f} "
+          f"{f'{agree}/{len(queries)}':>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Serial vs. pipelined inbox triage against the fake Ollama server: emails/second
+
+Usage: python benchmarks/bench_triage.py --emails 200 --parallel 4 --concurrency 1 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent import AIAgent
+from fake_ollama import FakeOllamaServer
+from triage import triage_inbox
+
+
+def make_emails(n):
+    return [{
+        'id': str(i),
+        'sender': f"sender{i % 17}@example.com",
+        'subject': f"Question {i} about the quarterly report",
+        'date': "Mon, 1 Jan 2024 09:00:00 +0000",
+        'body': f"Hi, could you send the numbers for project {i % 23} before the meeting on Friday? " * 3
+    } for i in range(n)]
+
+
+def serial_triage(agent, emails):
+    for email in emails:
+        agent.suggest_action(email)
+        agent.generate_summary([email])
+        agent.generate_reply(email, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--parallel', type=int, default=4, help="generations the fake server runs at once")
+    parser.add_argument('--token-delay', type=float, default=0.002)
+    parser.add_argument('--tokens', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--serial-emails', type=int, default=50, help="emails timed for the serial baseline")
+    args = parser.parse_args()
+
+    emails = make_emails(args.emails)
+    with FakeOllamaServer(parallel=args.parallel, token_delay=args.token_delay, tokens=args.tokens) as server:
+        agent = AIAgent(base_url=server.base_url, cache=False)
+
+        sample = emails[:args.serial_emails]
+        start = time.perf_counter()
+        serial_triage(agent, sample)
+        serial_rate = len(sample) / (time.perf_counter() - start)
+        print(f"{'mode':>14} {'emails/s':>9} {'speedup':>8} {'server busy':>12}")
+        print(f"{'serial':>14} {serial_rate:>9.1f} {1.0:>8.2f} {1:>12}")
+
+        for concurrency in args.concurrency:
+            server.reset_counters()
+            start = time.perf_counter()
+            results = triage_inbox(agent, emails, concurrency=concurrency)
+            rate = len(emails) / (time.perf_counter() - start)
+
+            assert [result['index'] for result in results] == list(range(len(emails)))
+            assert not any(result['error'] for result in results)
+            expected = agent.suggest_action(emails[-1])
+            assert results[-1]['action'] == expected
+            print(f"{'pipeline x' + str(concurrency):>14} {rate:>9.1f} {rate / serial_rate:>8.2f} "
+                  f"{server.max_running:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Regenerate the bundled synthetic knowledge base and labelled queries
+
+Documents are policy snippets about (product, topic) pairs padded with shared
+corporate boilerplate. Each query targets exactly one document, using the
+product name plus paraphrased topic words, either as a short question or
+buried in a long email body with a reply instruction appended (the way
+app.py builds retrieval queries).
+
+Usage: python benchmarks/make_synthetic_corpus.py [--seed 7]
+"""
+import argparse
+import json
+import os
+import random
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+TOPICS = {
+    'Refund Policy': {
+        'facts': ["Customers may request a refund within {n} days of purchase.",
+                  "Refunds are issued to the original payment method after the returned item is inspected.",
+                  "A receipt or order number is required for every return."],
+        'asks': ["can I get my money back", "how do refunds work", "what is the return window"],
+    },
+    'Travel Expenses': {
+        'facts': ["Employees travelling for {name} are reimbursed up to {n} dollars per night for hotels.",
+                  "Flights must be booked in economy class through the travel desk.",
+                  "Expense reports with receipts are due within {n} days of the trip."],
+        'asks': ["how are trip costs reimbursed", "what hotel budget applies", "how do I claim travel costs"],
+    },
+    'Vacation Leave': {
+        'facts': ["Staff on the {name} team accrue {n} days of annual leave per year.",
+                  "Holiday requests need manager approval two weeks in advance.",
+                  "Unused days off carry over until the end of March."],
+        'asks': ["how much time off do I get", "how do I request PTO", "do unused holidays carry over"],
+    },
+    'Security Incidents': {
+        'facts': ["Suspected breaches affecting {name} must be reported to security within {n} hours.",
+                  "Forward phishing emails as attachments to the security mailbox.",
+                  "Never share credentials, even with someone claiming to be from IT."],
+        'asks': ["I think my account was hacked", "what do I do with a suspicious email", "how do I report phishing"],
+    },
+    'Shipping and Delivery': {
+        'facts': ["Standard shipping for {name} takes {n} business days.",
+                  "Express delivery is available for an extra fee at checkout.",
+                  "Tracking numbers are emailed once the parcel leaves the warehouse."],
+        'asks': ["when will my order arrive", "how long does delivery take", "where is my tracking number"],
+    },
+    'Warranty Coverage': {
+        'facts': ["{name} hardware carries a {n} month limited warranty.",
+                  "The warranty covers manufacturing defects but not accidental damage.",
+                  "Claims require the serial number and proof of purchase."],
+        'asks': ["is my broken device covered", "how long is the guarantee", "how do I make a warranty claim"],
+    },
+    'Pricing and Discounts': {
+        'facts': ["Annual subscriptions to {name} are discounted by {n} percent.",
+                  "Nonprofits and schools qualify for special pricing on request.",
+                  "Volume licences above fifty seats are quoted individually."],
+        'asks': ["is there a discount for yearly billing", "how much does it cost", "do you offer nonprofit pricing"],
+    },
+    'Remote Work': {
+        'facts': ["Members of the {name} group may work from home up to {n} days per week.",
+                  "Remote employees must use the company VPN for internal systems.",
+                  "Home office equipment is provided through the IT portal."],
+        'asks': ["can I work from home", "what is the hybrid schedule", "do I need the VPN at home"],
+    },
+    'Invoices and Payments': {
+        'facts': ["Invoices for {name} are payable within {n} days.",
+                  "Payments can be made by bank transfer or credit card.",
+                  "Late payments incur a monthly interest charge."],
+        'asks': ["when is my bill due", "how can I pay the invoice", "is there a late fee"],
+    },
+    'Data Retention': {
+        'facts': ["Customer records in {name} are retained for {n} months after account closure.",
+                  "Backups are encrypted and stored in two regions.",
+                  "Deletion requests are completed within thirty days."],
+        'asks': ["how long do you keep my data", "can you delete my records", "are backups encrypted"],
+    },
+}
+
+PREFIXES = ['Orion', 'Nimbus', 'Aurora', 'Vertex', 'Cobalt', 'Zephyr', 'Quartz', 'Helix', 'Lumen', 'Nova',
+            'Atlas', 'Ember', 'Falcon', 'Glacier', 'Harbor', 'Ion', 'Juniper', 'Kestrel', 'Lotus', 'Meridian']
+SUFFIXES = ['Suite', 'Router', 'Cloud', 'Desk', 'Pay', 'Hub', 'Lens', 'Drive']
+
+BOILERPLATE = [
+    "This document is maintained by the operations team and reviewed every quarter.",
+    "Please contact your manager if anything in this policy is unclear.",
+    "The company reserves the right to update this policy at any time.",
+    "All employees are expected to read and follow these guidelines.",
+    "Exceptions must be approved in writing by the relevant department head.",
+    "For questions, open a ticket with the help desk.",
+    "Previous versions of this document are archived on the intranet.",
+]
+
+EMAIL_FILLER = [
+    "I hope you are doing well and that the week is going smoothly.",
+    "We had a long planning meeting yesterday and several things came up.",
+    "Our team is preparing the quarterly report and collecting updates from everyone.",
+    "Apologies for the long message, I wanted to include all the details.",
+    "Last month we also discussed the roadmap and the hiring plan for next year.",
+    "Let me know if a call would be easier than email.",
+]
+
+INSTRUCTIONS = ["Reply appropriately to the email", "Ask for more information or clarification",
+                "Accept or confirm the request politely"]
+
+
+def build(seed):
+    rng = random.Random(seed)
+    products = [f"{prefix} {suffix}" for prefix in PREFIXES for suffix in SUFFIXES]
+    rng.shuffle(products)
+
+    documents = []
+    for product in products[:70]:
+        for topic in rng.sample(sorted(TOPICS), 3):
+            facts = [fact.format(name=product, n=rng.randint(2, 60)) for fact in TOPICS[topic]['facts']]
+            sentences = facts + rng.sample(BOILERPLATE, 4)
+            rng.shuffle(sentences)
+            documents.append({
+                'id': f"doc-{len(documents):04d}",
+                'title': f"{product} {topic}",
+                'product': product,
+                'topic': topic,
+                'text': f"{product} {topic}. " + ' '.join(sentences)
+            })
+
+    queries = []
+    for i in range(300):
+        target = rng.choice(documents)
+        ask = rng.choice(TOPICS[target['topic']]['asks'])
+        question = f"{ask[0].upper()}{ask[1:]} for {target['product']}?"
+        if i % 2:
+            body = ' '.join(rng.sample(EMAIL_FILLER, 3)[:2] + [question] + rng.sample(EMAIL_FILLER, 2))
+            text = f"Hi team, {body} Thanks, Sam {rng.choice(INSTRUCTIONS)}"
+            kind = 'email'
+        else:
+            text, kind = question, 'short'
+        queries.append({'id': f"q-{i:03d}", 'kind': kind, 'query': text, 'relevant': [target['id']]})
+    return documents, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    documents, queries = build(args.seed)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    for name, rows in (('synthetic_kb.jsonl', documents), ('synthetic_queries.jsonl', queries)):
+        with open(os.path.join(DATA_DIR, name), 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+    print(f"Wrote {len(documents)} documents and {len(queries)} queries to {DATA_DIR}")
+
+
+if __name__ == '__main__':
+    main()
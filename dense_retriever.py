@@ -0,0 +1,334 @@
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+from rag_index import Retriever, _GrowableArray
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder for tests and offline benchmarks
+
+    Tokens are hashed with CRC32 into signed buckets, so the same text always
+    maps to the same unit vector and nothing needs downloading.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                digest = zlib.crc32(token.encode('utf-8', 'surrogatepass'))
+                vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        return _normalise(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """CPU sentence-transformers embedder, loaded lazily on first use"""
+
+    def __init__(self, model_name='all-MiniLM-L6-v2', batch_size=64, device='cpu'):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self.name = f"st-{model_name.replace('/', '-')}"
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True)
+        return _normalise(vectors.astype(np.float32))
+
+
+def _normalise(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingCache:
+    """Embeddings keyed by a hash of (embedder, text), optionally persisted
+
+    On disk the cache is two append-only files per embedder: raw float32
+    rows (memory-mapped on load) and one hex key per line. A key is only
+    written after its row, so a torn write is trimmed on the next load.
+    """
+
+    def __init__(self, embedder_name, dim, path=None):
+        self.embedder_name = embedder_name
+        self.dim = dim
+        self.path = path
+        self._rows_by_hash = {}
+        self._vectors = _GrowableArray(np.float32)
+        self.hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def _file(self, suffix):
+        return os.path.join(self.path, f"{self.embedder_name}{suffix}")
+
+    def _load(self):
+        keys_file, vectors_file = self._file('.keys'), self._file('.f32')
+        if not os.path.exists(keys_file) or not os.path.exists(vectors_file):
+            open(keys_file, 'ab').close()
+            open(vectors_file, 'ab').close()
+            return
+
+        with open(keys_file, 'rb') as f:
+            keys = [line.strip().decode('ascii') for line in f if line.endswith(b'\n')]
+        n_rows = min(len(keys), os.path.getsize(vectors_file) // (4 * self.dim))
+        os.truncate(vectors_file, n_rows * 4 * self.dim)
+        with open(keys_file, 'wb') as f:
+            f.write(''.join(key + '\n' for key in keys[:n_rows]).encode('ascii'))
+
+        if n_rows:
+            self._vectors = _GrowableArray(
+                np.float32, base=np.memmap(vectors_file, dtype=np.float32, mode='r', shape=(n_rows * self.dim,))
+            )
+        self._rows_by_hash = {key: row for row, key in enumerate(keys[:n_rows])}
+
+    def content_hash(self, text):
+        return hashlib.sha1(f"{self.embedder_name}\0{text}".encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def get(self, content_hash):
+        row = self._rows_by_hash.get(content_hash)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._vectors.view()[row * self.dim:(row + 1) * self.dim]
+
+    def put(self, content_hashes, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        first_row = self._vectors.size // self.dim
+        self._vectors.extend(vectors.ravel())
+        for offset, content_hash in enumerate(content_hashes):
+            self._rows_by_hash[content_hash] = first_row + offset
+
+        if self.path:
+            with open(self._file('.f32'), 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self._file('.keys'), 'ab') as f:
+                f.write(''.join(key + '\n' for key in content_hashes).encode('ascii'))
+
+    def __len__(self):
+        return len(self._rows_by_hash)
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over unit vectors
+
+    Vectors are bucketed by their nearest spherical k-means centroid and a
+    query only scores the ``n_probe`` closest buckets, roughly
+    ``n_probe * sqrt(n)`` candidates. Below ``train_threshold`` vectors the
+    search is exhaustive. Centroids are retrained (and tombstones dropped)
+    whenever the index has doubled since the last training.
+    """
+
+    def __init__(self, dim, n_probe=8, train_threshold=2048, kmeans_iterations=10, seed=0):
+        self.dim = dim
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.clear()
+
+    def clear(self):
+        self._vectors = _GrowableArray(np.float32)
+        self._alive = _GrowableArray(np.bool_)
+        self._keys = []
+        self._rows_by_key = {}
+        self.centroids = None
+        self._lists = []
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._rows_by_key)
+
+    def _matrix(self):
+        return self._vectors.view().reshape(-1, self.dim)
+
+    def add(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        for key in keys:
+            if key in self._rows_by_key:
+                raise ValueError(f"Key already indexed: {key}")
+
+        first_row = len(self._keys)
+        self._vectors.extend(vectors.ravel())
+        self._alive.extend(np.ones(len(vectors), dtype=np.bool_))
+        for offset, key in enumerate(keys):
+            self._rows_by_key[key] = first_row + offset
+            self._keys.append(key)
+
+        if self.centroids is not None:
+            self._assign(vectors, first_row)
+        if len(self) >= self.train_threshold and len(self._keys) >= 2 * self._trained_size:
+            self.train()
+
+    def remove(self, key):
+        row = self._rows_by_key.pop(key, None)
+        if row is None:
+            return False
+        self._alive.view()[row] = False
+        if len(self._keys) >= 2 * max(len(self), 1):
+            self.train()
+        return True
+
+    def train(self):
+        """Drop tombstones, recluster and rebuild the inverted lists"""
+        alive = self._alive.view()
+        vectors = self._matrix()[alive]
+        keys = [key for key, live in zip(self._keys, alive) if live]
+
+        self.clear()
+        self._vectors.extend(vectors.ravel())
+        self._alive.extend(np.ones(len(keys), dtype=np.bool_))
+        self._keys = keys
+        self._rows_by_key = {key: row for row, key in enumerate(keys)}
+        if len(keys) < self.train_threshold:
+            return
+
+        self.centroids = self._kmeans(vectors, max(1, int(np.sqrt(len(keys)))))
+        self._lists = [_GrowableArray(np.int64) for _ in range(len(self.centroids))]
+        self._assign(vectors, 0)
+        self._trained_size = len(keys)
+
+    def _kmeans(self, vectors, n_lists):
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), 64 * n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalise(sums)
+        return centroids
+
+    def _assign(self, vectors, first_row, chunk_size=8192):
+        for start in range(0, len(vectors), chunk_size):
+            labels = np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+            order = np.argsort(labels, kind='stable')
+            bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+            for list_no in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[list_no]:bounds[list_no + 1]] + first_row + start
+                self._lists[list_no].extend(rows)
+
+    def search(self, vector, top_k=10):
+        """Return ``[(key, cosine_score), ...]`` for the approximate top ``top_k``"""
+        if not len(self):
+            return []
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+
+        if self.centroids is None:
+            rows = np.flatnonzero(self._alive.view())
+        else:
+            n_probe = min(self.n_probe, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ vector), n_probe - 1)[:n_probe]
+            rows = np.concatenate([self._lists[probe].view() for probe in probes])
+            rows = rows[self._alive.view()[rows]]
+        if not len(rows):
+            return []
+
+        scores = self._matrix()[rows] @ vector
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return [(self._keys[rows[i]], float(scores[i])) for i in order]
+
+
+class DenseRetriever(Retriever):
+    """Dense-embedding passage retriever backed by an IVF index
+
+    Passages are encoded in batches and their embeddings cached by content
+    hash, so re-indexing unchanged passages never calls the embedder again.
+    The cache and index are sized by the embedder's dimension, so they are
+    only built when the first passage is added or query searched; until
+    then the embedder (and its model) stays unloaded.
+    """
+
+    name = 'dense'
+
+    def __init__(self, embedder=None, cache_path=None, n_probe=8, train_threshold=2048, batch_size=64):
+        self.embedder = embedder or SentenceTransformerEmbedder(batch_size=batch_size)
+        self.batch_size = batch_size
+        self.cache_path = cache_path
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold
+        self._cache = None
+        self._ann = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = EmbeddingCache(self.embedder.name, self.embedder.dim, self.cache_path)
+        return self._cache
+
+    @property
+    def ann(self):
+        if self._ann is None:
+            self._ann = IVFIndex(self.embedder.dim, n_probe=self.n_probe, train_threshold=self.train_threshold)
+        return self._ann
+
+    def __len__(self):
+        return len(self._ann) if self._ann is not None else 0
+
+    def __contains__(self, key):
+        return self._ann is not None and key in self._ann._rows_by_key
+
+    def add(self, key, text):
+        self.add_batch([(key, text)])
+
+    def add_batch(self, items):
+        items = list(items)
+        if not items:
+            return
+        hashes = [self.cache.content_hash(text) for _, text in items]
+        vectors = [self.cache.get(content_hash) for content_hash in hashes]
+
+        # Encode only cache misses, in batches
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            encoded = self.embedder.encode([items[i][1] for i in batch])
+            self.cache.put([hashes[i] for i in batch], encoded)
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector
+
+        self.ann.add([key for key, _ in items], np.vstack(vectors))
+
+    def remove(self, key):
+        return self._ann is not None and self._ann.remove(key)
+
+    def search(self, query, top_k=None, min_score=0.0):
+        if not len(self):
+            return []
+        query_vector = self.embedder.encode([query])[0]
+        hits = self.ann.search(query_vector, top_k=top_k or len(self.ann))
+        return [(key, score) for key, score in hits if score >= min_score]
+
+    def clear(self):
+        if self._ann is not None:
+            self._ann.clear()
@@ -0,0 +1,569 @@
+"""Offline stand-in for the Gmail API discovery client, for benchmarks and local runs
+
+Only the calls this project makes are implemented, with the same method
+chaining as ``googleapiclient`` (``service.users().messages().get(...).execute()``)
+and the same batch interface. Every ``execute()`` counts as one HTTP round
+trip and sleeps ``rtt`` seconds plus a per-request server cost, so call
+patterns can be compared without a network.
+"""
+import base64
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.utils import format_datetime
+
+from gmail_quota import quota_units
+from mime_parser import decode_text
+
+try:
+    from googleapiclient.errors import HttpError
+except ImportError:
+    HttpError = None
+
+
+class FakeHttpError(Exception):
+    """Shaped like ``googleapiclient.errors.HttpError`` when it is not installed"""
+
+    def __init__(self, resp, content, uri=None):
+        super().__init__(f"<HttpError {resp.status}: {resp.reason}>")
+        self.resp = resp
+        self.content = content
+        self.uri = uri
+
+    @property
+    def status_code(self):
+        return self.resp.status
+
+
+class _Response(dict):
+    def __init__(self, status, reason):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = reason
+
+
+def http_error(status, reason):
+    """Error instance matching what the real client raises for ``status``"""
+    content = json.dumps({"error": {"code": status, "message": reason}}).encode('utf-8')
+    error_class = HttpError or FakeHttpError
+    return error_class(_Response(status, reason), content)
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+# Bodies larger than this are served through attachments.get, as Gmail does for big parts
+INLINE_LIMIT = 256 * 1024
+
+
+def gmail_payload(message, part_id="", attachments=None, inline_limit=INLINE_LIMIT):
+    """Convert a parsed ``email.message.Message`` into Gmail's ``payload`` structure
+
+    Attachments and bodies over ``inline_limit`` bytes get an ``attachmentId``
+    instead of ``data``; their content goes into the ``attachments`` dict.
+    """
+    payload = {
+        "partId": part_id,
+        "mimeType": message.get_content_type(),
+        "filename": message.get_filename() or "",
+        "headers": [{"name": name, "value": str(value)} for name, value in message.items()]
+    }
+    if message.is_multipart():
+        payload["body"] = {"size": 0}
+        payload["parts"] = [
+            gmail_payload(part, f"{part_id}.{i}" if part_id else str(i), attachments, inline_limit)
+            for i, part in enumerate(message.get_payload())
+        ]
+    else:
+        data = message.get_payload(decode=True) or b""
+        if payload["filename"] or len(data) > inline_limit:
+            payload["body"] = {"size": len(data), "attachmentId": f"att-{part_id or 0}"}
+            if attachments is not None:
+                attachments[payload["body"]["attachmentId"]] = data
+        else:
+            payload["body"] = {"size": len(data), "data": b64url(data)}
+    return payload
+
+
+SENDERS = ["alice@example.com", "bob@example.org", "carol@example.net", "dave@vendor.io", "erin@client.co"]
+TOPICS = ["quarterly report", "contract renewal", "team offsite", "invoice 4411", "product launch",
+          "hiring plan", "security review", "budget approval"]
+SENTENCES = [
+    "Could you send the latest numbers before Friday?",
+    "I have attached the draft for your review.",
+    "Let me know if the proposed time works for you.",
+    "We need a decision by the end of the week.",
+    "Thanks again for your help on this.",
+    "Please confirm the delivery address.",
+    "The client asked for a short call to go over the details."
+]
+
+
+def make_message(i, rng, body_sentences=20, html=True, attachment=False):
+    """Synthetic RFC 822 message number ``i`` as bytes"""
+    message = EmailMessage()
+    message["From"] = rng.choice(SENDERS)
+    message["To"] = "me@example.com"
+    message["Subject"] = f"Re: {rng.choice(TOPICS)} ({i})"
+    message["Date"] = format_datetime(datetime.fromtimestamp(1_700_000_000 + 600 * i, timezone.utc))
+    message["Message-ID"] = f"<msg-{i}@example.com>"
+    text = " ".join(rng.choice(SENTENCES) for _ in range(body_sentences))
+    message.set_content(f"Hi,\n\n{text}\n\nBest regards")
+    if html:
+        message.add_alternative(f"<html><body><p>Hi,</p><p>{text}</p><p>Best regards</p></body></html>",
+                                subtype="html")
+    if attachment:
+        message.add_attachment(rng.randbytes(2048), maintype="application",
+                               subtype="pdf", filename=f"report-{i}.pdf")
+    return message.as_bytes()
+
+
+class FakePubSub:
+    """In-process stand-in for the Cloud Pub/Sub topics ``users.watch`` publishes to
+
+    Messages are delivered to every subscription of a topic on a timer thread
+    after ``delay`` seconds, roughly like a push subscription.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self.published = 0
+
+    def publish(self, topic, data):
+        with self._lock:
+            callbacks = list(self._callbacks.get(topic, ()))
+            self.published += 1
+        for callback in callbacks:
+            timer = threading.Timer(self.delay, callback, args=(dict(data),))
+            timer.daemon = True
+            timer.start()
+
+    def subscription(self, topic):
+        return FakeSubscription(self, topic)
+
+
+class FakeSubscription:
+    """Notification source for ``inbox_watcher.InboxWatcher`` fed by a FakePubSub topic"""
+
+    def __init__(self, pubsub, topic):
+        self.pubsub = pubsub
+        self.topic = topic
+        self._callback = None
+
+    def start(self, callback):
+        self._callback = callback
+        with self.pubsub._lock:
+            self.pubsub._callbacks.setdefault(self.topic, []).append(callback)
+
+    def stop(self):
+        with self.pubsub._lock:
+            callbacks = self.pubsub._callbacks.get(self.topic, [])
+            if self._callback in callbacks:
+                callbacks.remove(self._callback)
+
+
+class FakeMailbox:
+    """In-memory mailbox with Gmail-style ids, labels and a history log
+
+    Functions in ``listeners`` are called with each new history record.
+    """
+
+    def __init__(self, messages=(), history_limit=10000):
+        self._lock = threading.Lock()
+        self.messages = {}
+        self.order = []
+        self.history = []
+        self.listeners = []
+        self.history_limit = history_limit
+        self.history_id = 1000
+        self._next_id = 1
+        for raw, labels in messages:
+            self.deliver(raw, labels)
+
+    @classmethod
+    def generate(cls, n, unread_ratio=0.3, seed=0, **message_options):
+        """Mailbox of ``n`` synthetic messages, about ``unread_ratio`` of them unread"""
+        rng = random.Random(seed)
+        mailbox = cls()
+        for i in range(n):
+            labels = ["INBOX"] + (["UNREAD"] if rng.random() < unread_ratio else [])
+            mailbox.deliver(make_message(i, rng, attachment=(i % 10 == 0), **message_options), labels)
+        return mailbox
+
+    def _record(self, **change):
+        self.history_id += 1
+        refs = [item["message"] for items in change.values() for item in items]
+        record = dict(change, id=str(self.history_id), messages=refs)
+        self.history.append(record)
+        if len(self.history) > self.history_limit:
+            del self.history[:len(self.history) - self.history_limit]
+        for listener in self.listeners:
+            listener(record)
+
+    def expire_history(self):
+        """Forget every history record, as Gmail does after about a week"""
+        with self._lock:
+            self.history.clear()
+
+    def history_since(self, start_history_id):
+        """Records after ``start_history_id``, or None if that point has expired"""
+        with self._lock:
+            start = int(start_history_id)
+            oldest = int(self.history[0]["id"]) if self.history else self.history_id + 1
+            if start < oldest - 1:
+                return None
+            return [record for record in self.history if int(record["id"]) > start]
+
+    def deliver(self, raw, labels=("INBOX", "UNREAD"), thread_id=None):
+        """Add a message from raw RFC 822 bytes; returns its id"""
+        with self._lock:
+            message_id = f"{self._next_id:016x}"
+            self._next_id += 1
+            parsed = BytesParser().parsebytes(raw)
+            text_part = next((part for part in parsed.walk() if part.get_content_type() == 'text/plain'), None)
+            text = decode_text(text_part.get_payload(decode=True) or b"",
+                               text_part.get_content_charset() or 'utf-8') if text_part else ""
+            snippet = " ".join(text.split())[:100]
+            attachments = {}
+            payload = gmail_payload(parsed, attachments=attachments)
+            self._record(messagesAdded=[{"message": {"id": message_id, "threadId": thread_id or message_id,
+                                                     "labelIds": list(labels)}}])
+            self.messages[message_id] = {
+                "id": message_id,
+                "threadId": thread_id or message_id,
+                "labelIds": list(labels),
+                "snippet": snippet,
+                "historyId": str(self.history_id),
+                "internalDate": str(int(time.time() * 1000)),
+                "sizeEstimate": len(raw),
+                "raw": raw,
+                "payload": payload,
+                "attachments": attachments
+            }
+            self.order.append(message_id)
+            return message_id
+
+    def delete(self, message_id):
+        with self._lock:
+            message = self.messages.pop(message_id)
+            self.order.remove(message_id)
+            self._record(messagesDeleted=[{"message": {"id": message_id, "threadId": message["threadId"]}}])
+
+    def modify(self, message_id, add=(), remove=()):
+        with self._lock:
+            message = self.messages[message_id]
+            added = [label for label in add if label not in message["labelIds"]]
+            removed = [label for label in remove if label in message["labelIds"]]
+            message["labelIds"] = [label for label in message["labelIds"] if label not in removed] + added
+            ref = {"id": message_id, "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+            if added:
+                self._record(labelsAdded=[{"message": ref, "labelIds": added}])
+            if removed:
+                self._record(labelsRemoved=[{"message": ref, "labelIds": removed}])
+            message["historyId"] = str(self.history_id)
+            return message
+
+    def matching(self, label_ids=None, q=None):
+        """Ids matching every label and the (very small) query syntax, newest first
+
+        Understands ``is:unread``, ``label:NAME`` and ``rfc822msgid:ID``.
+        """
+        required = set(label_ids or ())
+        rfc822_id = None
+        if q:
+            for term in q.split():
+                if term == "is:unread":
+                    required.add("UNREAD")
+                elif term.startswith("label:"):
+                    required.add(term[6:].upper())
+                elif term.startswith("rfc822msgid:"):
+                    rfc822_id = term[12:].strip("<>")
+        return [message_id for message_id in reversed(self.order)
+                if required.issubset(self.messages[message_id]["labelIds"])
+                and (rfc822_id is None or self._rfc822_id(message_id) == rfc822_id)]
+
+    def _rfc822_id(self, message_id):
+        for header in self.messages[message_id]["payload"]["headers"]:
+            if header["name"].lower() == "message-id":
+                return header["value"].strip().strip("<>")
+        return None
+
+
+class _Request:
+    """Deferred API call, executed alone or as part of a batch"""
+
+    def __init__(self, service, handler, kwargs, method_id):
+        self.service = service
+        self.handler = handler
+        self.kwargs = kwargs
+        self.methodId = method_id
+
+    def run(self):
+        self.service._charge(self.methodId)
+        return self.handler(**self.kwargs)
+
+    def execute(self, num_retries=0):
+        self.service._round_trip(1)
+        result = self.run()
+        self.service._account(result)
+        return result
+
+
+class FakeBatchHttpRequest:
+    """Mirror of ``googleapiclient.http.BatchHttpRequest``"""
+
+    MAX_REQUESTS = 100
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if len(self._requests) >= self.MAX_REQUESTS:
+            raise ValueError(f"Batch can hold at most {self.MAX_REQUESTS} requests")
+        request_id = request_id or str(len(self._requests) + 1)
+        self._requests.append((request_id, request, callback))
+
+    def execute(self):
+        self.service._round_trip(len(self._requests))
+        for request_id, request, callback in self._requests:
+            try:
+                response, exception = request.run(), None
+                self.service._account(response)
+            except Exception as e:
+                response, exception = None, e
+            callback = callback or self.callback
+            if callback:
+                callback(request_id, response, exception)
+
+
+class _Resource:
+    def __init__(self, service, methods, path):
+        self._service = service
+        self._methods = methods
+        self._path = path
+
+    def __getattr__(self, name):
+        method = self._methods.get(name)
+        if method is None:
+            raise AttributeError(name)
+        if isinstance(method, _Resource):
+            return lambda: method
+        return lambda **kwargs: _Request(self._service, method, kwargs, f"gmail.{self._path}.{name}")
+
+
+class FakeGmailService:
+    """``build('gmail', 'v1')`` lookalike backed by a FakeMailbox
+
+    ``rtt`` is the latency of one HTTP round trip; each request inside it adds
+    ``per_request`` seconds of server time. ``stats`` counts round trips,
+    individual requests and response bytes. ``users.watch`` publishes
+    ``{'emailAddress', 'historyId'}`` to ``pubsub`` on mailbox changes.
+    With ``units_per_second`` the per-user quota is enforced and requests
+    over it fail with 429, each part of a batch separately. Like Gmail's
+    search index, ``q=`` searches miss messages added less than
+    ``search_lag`` seconds ago; label-only listing and ``get`` see them at once.
+    """
+
+    def __init__(self, mailbox=None, rtt=0.0, per_request=0.0, email_address="me@example.com", pubsub=None,
+                 units_per_second=None, search_lag=0.0):
+        self.mailbox = mailbox or FakeMailbox()
+        self.rtt = rtt
+        self.per_request = per_request
+        self.email_address = email_address
+        self.pubsub = pubsub
+        self.watch_request = None
+        self.units_per_second = units_per_second
+        self.search_lag = search_lag
+        self._quota = units_per_second
+        self._quota_updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self.mailbox.listeners.append(self._notify)
+
+        messages = _Resource(self, {
+            "list": self._list_messages,
+            "get": self._get_message,
+            "modify": self._modify_message,
+            "send": self._send_message,
+            "attachments": _Resource(self, {"get": self._get_attachment}, "users.messages.attachments")
+        }, "users.messages")
+        threads = _Resource(self, {"get": self._get_thread}, "users.threads")
+        history = _Resource(self, {"list": self._list_history}, "users.history")
+        self._users = _Resource(self, {"messages": messages, "threads": threads, "history": history,
+                                       "getProfile": self._get_profile, "watch": self._watch, "stop": self._stop},
+                                "users")
+
+    def users(self):
+        return self._users
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchHttpRequest(self, callback)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'round_trips': 0, 'requests': 0, 'bytes': 0, 'units': 0, 'rate_limited': 0}
+
+    def _charge(self, method_id):
+        units = quota_units(method_id.replace('gmail.', ''))
+        with self._lock:
+            if self.units_per_second is not None:
+                now = time.monotonic()
+                self._quota = min(self.units_per_second,
+                                  self._quota + (now - self._quota_updated) * self.units_per_second)
+                self._quota_updated = now
+                if self._quota < units:
+                    self.stats['rate_limited'] += 1
+                    raise http_error(429, "User-rate limit exceeded")
+                self._quota -= units
+            self.stats['units'] += units
+
+    def _round_trip(self, n_requests):
+        with self._lock:
+            self.stats['round_trips'] += 1
+            self.stats['requests'] += n_requests
+        time.sleep(self.rtt + self.per_request * n_requests)
+
+    def _account(self, response):
+        with self._lock:
+            self.stats['bytes'] += len(json.dumps(response))
+
+    def _check_user(self, userId):
+        if userId not in ("me", self.email_address):
+            raise http_error(403, "Delegation denied")
+
+    def _list_messages(self, userId, labelIds=None, q=None, maxResults=100, pageToken=None,
+                       includeSpamTrash=False):
+        self._check_user(userId)
+        ids = self.mailbox.matching(labelIds, q)
+        if q and self.search_lag:
+            indexed_before = (time.time() - self.search_lag) * 1000
+            ids = [message_id for message_id in ids
+                   if int(self.mailbox.messages[message_id]["internalDate"]) <= indexed_before]
+        start = int(pageToken or 0)
+        page = ids[start:start + min(maxResults, 500)]
+        result = {
+            "messages": [{"id": message_id, "threadId": self.mailbox.messages[message_id]["threadId"]}
+                         for message_id in page],
+            "resultSizeEstimate": len(ids)
+        }
+        if start + len(page) < len(ids):
+            result["nextPageToken"] = str(start + len(page))
+        if not page:
+            del result["messages"]
+        return result
+
+    def _get_message(self, userId, id, format="full", metadataHeaders=None):
+        self._check_user(userId)
+        message = self.mailbox.messages.get(id)
+        if message is None:
+            raise http_error(404, "Requested entity was not found.")
+
+        result = {key: message[key] for key in
+                  ("id", "threadId", "labelIds", "snippet", "historyId", "internalDate", "sizeEstimate")}
+        result["labelIds"] = list(result["labelIds"])
+        if format == "raw":
+            result["raw"] = b64url(message["raw"])
+        elif format == "metadata":
+            wanted = {name.lower() for name in metadataHeaders} if metadataHeaders else None
+            payload = message["payload"]
+            result["payload"] = {
+                "mimeType": payload["mimeType"],
+                "headers": [header for header in payload["headers"]
+                            if wanted is None or header["name"].lower() in wanted]
+            }
+        elif format == "full":
+            result["payload"] = message["payload"]
+        return result
+
+    def _get_thread(self, userId, id, format="full", metadataHeaders=None):
+        self._check_user(userId)
+        ids = [message_id for message_id in self.mailbox.order if self.mailbox.messages[message_id]["threadId"] == id]
+        if not ids:
+            raise http_error(404, "Requested entity was not found.")
+        return {"id": id, "historyId": str(self.mailbox.history_id),
+                "messages": [self._get_message(userId, message_id, format, metadataHeaders) for message_id in ids]}
+
+    def _get_attachment(self, userId, messageId, id):
+        self._check_user(userId)
+        message = self.mailbox.messages.get(messageId)
+        if message is None or id not in message["attachments"]:
+            raise http_error(404, "Requested entity was not found.")
+        data = message["attachments"][id]
+        return {"attachmentId": id, "size": len(data), "data": b64url(data)}
+
+    def _modify_message(self, userId, id, body):
+        self._check_user(userId)
+        if id not in self.mailbox.messages:
+            raise http_error(404, "Requested entity was not found.")
+        message = self.mailbox.modify(id, body.get("addLabelIds", ()), body.get("removeLabelIds", ()))
+        return {"id": id, "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+
+    def _send_message(self, userId, body):
+        self._check_user(userId)
+        raw = base64.urlsafe_b64decode(body["raw"])
+        message_id = self.mailbox.deliver(raw, ["SENT"], thread_id=body.get("threadId"))
+        return {"id": message_id, "threadId": self.mailbox.messages[message_id]["threadId"], "labelIds": ["SENT"]}
+
+    def _list_history(self, userId, startHistoryId, maxResults=100, pageToken=None, historyTypes=None,
+                      labelId=None):
+        self._check_user(userId)
+        records = self.mailbox.history_since(startHistoryId)
+        if records is None:
+            raise http_error(404, "Requested entity was not found.")
+        if historyTypes:
+            keys = [kind.replace('message', 'messages').replace('label', 'labels') for kind in historyTypes]
+            records = [record for record in records if any(key in record for key in keys)]
+        if labelId:
+            records = [record for record in records
+                       if any(labelId in ref.get("labelIds", [labelId]) for ref in record["messages"])]
+
+        start = int(pageToken or 0)
+        page = records[start:start + min(maxResults, 500)]
+        result = {"historyId": str(self.mailbox.history_id)}
+        if page:
+            result["history"] = page
+        if start + len(page) < len(records):
+            result["nextPageToken"] = str(start + len(page))
+        return result
+
+    def _watch(self, userId, body):
+        self._check_user(userId)
+        if self.pubsub is None:
+            raise http_error(400, "Invalid topicName does not match projects/*/topics/*")
+        self.watch_request = dict(body)
+        return {"historyId": str(self.mailbox.history_id),
+                "expiration": str(int((time.time() + 7 * 24 * 3600) * 1000))}
+
+    def _stop(self, userId):
+        self._check_user(userId)
+        self.watch_request = None
+        return {}
+
+    def _notify(self, record):
+        watch = self.watch_request
+        if watch is None:
+            return
+        label_ids = watch.get("labelIds")
+        if label_ids and watch.get("labelFilterAction", "include") == "include":
+            # Deleted messages carry no labels and always notify
+            if not any(set(label_ids) & set(ref.get("labelIds", label_ids)) for ref in record["messages"]):
+                return
+        self.pubsub.publish(watch["topicName"], {"emailAddress": self.email_address, "historyId": record["id"]})
+
+    def _get_profile(self, userId):
+        self._check_user(userId)
+        return {
+            "emailAddress": self.email_address,
+            "messagesTotal": len(self.mailbox.messages),
+            "threadsTotal": len({message["threadId"] for message in self.mailbox.messages.values()}),
+            "historyId": str(self.mailbox.history_id)
+        }
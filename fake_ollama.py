@@ -0,0 +1,333 @@
+"""Offline stand-in for the Ollama HTTP API, for benchmarks and local runs
+
+Usage: python fake_ollama.py --port 11434 --parallel 4 --token-delay 0.02
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "thanks for the update I will review the proposal and get back to you by "
+    "friday please send the latest numbers so we can confirm the meeting time"
+).split()
+DEFAULT_NUM_CTX = 2048
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+class FakeOllamaServer:
+    """Threaded HTTP server speaking the subset of the Ollama API the agent uses
+
+    Generation cost is simulated like a real server: ``prompt_delay`` seconds
+    per prompt word, then ``token_delay`` seconds per generated token. Prompts
+    longer than the ``num_ctx`` option (2048 words by default, as in Ollama)
+    are silently cut to ``num_ctx`` words and counted in ``truncated``.
+
+    Like Ollama's runner, each of the ``parallel`` slots keeps the KV cache of
+    the last prompt it evaluated (``system`` first, then ``prompt``), and a
+    request only pays for the words after the longest prefix it shares with
+    one of them. A model not used for its ``keep_alive`` (``keep_alive``
+    seconds by default) is unloaded with its caches, and loading it again
+    costs ``load_delay`` seconds.
+
+    At most ``parallel`` generations run at once (``OLLAMA_NUM_PARALLEL``);
+    further requests wait for a slot, and once ``max_queue`` are waiting new
+    ones get a 503 (``OLLAMA_MAX_QUEUE``). Replies are deterministic for a
+    given prompt. ``/api/pull`` streams ``pull_steps`` download progress lines, each after
+    ``pull_delay`` seconds, then installs the model.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, models=("llama2:7b",), parallel=4, max_queue=512,
+                 prompt_delay=0.0002, token_delay=0.01, tokens=32, pull_steps=5, pull_delay=0.05,
+                 load_delay=0.0, keep_alive=300):
+        self.models = list(models)
+        self.pull_steps = pull_steps
+        self.pull_delay = pull_delay
+        self.parallel = parallel
+        self.max_queue = max_queue
+        self.prompt_delay = prompt_delay
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.load_delay = load_delay
+        self.keep_alive = keep_alive
+        # model -> monotonic time it unloads, and model -> evaluated word sequences, least recent first
+        self._loaded_until = {}
+        self._kv = {}
+        self._slots = threading.Semaphore(parallel)
+        self._lock = threading.Lock()
+        self.reset_counters()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.rejected = 0
+            self.waiting = 0
+            self.running = 0
+            self.max_running = 0
+            self.truncated = 0
+            self.prompt_words = 0
+            self.reused_words = 0
+            self.loads = 0
+
+    def unload(self):
+        """Unload every model, dropping their KV caches"""
+        with self._lock:
+            self._loaded_until.clear()
+            self._kv.clear()
+
+    def start(self):
+        """Serve from a daemon thread and return ``self``"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reply_tokens(self, prompt, options):
+        """Deterministic tokens for ``prompt``, as many as the options allow"""
+        limit = options.get('num_predict') or self.tokens
+        seed = int.from_bytes(hashlib.md5(prompt.encode('utf-8', 'surrogatepass')).digest()[:4], 'little')
+        n_tokens = min(limit, self.tokens)
+        return [("" if i == 0 else " ") + WORDS[(seed + i * 7) % len(WORDS)] for i in range(n_tokens)]
+
+    def _acquire(self):
+        """Take a generation slot, or return False when the queue is full"""
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+            self.requests += 1
+            self.max_running = max(self.max_running, self.running)
+        return True
+
+    def _release(self):
+        with self._lock:
+            self.running -= 1
+        self._slots.release()
+
+    def keep_alive_seconds(self, value):
+        """Seconds for an Ollama ``keep_alive`` value: a number or a duration like ``"30m"``"""
+        if value is None or value == "":
+            return self.keep_alive
+        if isinstance(value, str) and value[-1:] in DURATION_UNITS:
+            value = float(value[:-1]) * DURATION_UNITS[value[-1]]
+        value = float(value)
+        return float('inf') if value < 0 else value
+
+    def _load(self, model, keep_alive):
+        """Load ``model`` unless it is still resident; returns the seconds spent loading"""
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._loaded_until.get(model, 0) > now
+            if not loaded:
+                self._kv[model] = []
+                self.loads += 1
+            self._loaded_until[model] = now + keep_alive
+        if loaded:
+            return 0.0
+        time.sleep(self.load_delay)
+        return self.load_delay
+
+    def _reuse(self, model, words):
+        """Take the slot sharing the longest prefix with ``words``; returns the shared length"""
+        with self._lock:
+            cache = self._kv.setdefault(model, [])
+            best, shared = None, 0
+            for i, cached in enumerate(cache):
+                n = 0
+                for a, b in zip(cached, words):
+                    if a != b:
+                        break
+                    n += 1
+                if n > shared:
+                    best, shared = i, n
+            if best is not None:
+                del cache[best]
+            elif len(cache) >= self.parallel:
+                del cache[0]
+            cache.append(words)
+            return shared
+
+    def generate(self, body):
+        """Yield ``/api/generate`` chunks, sleeping to simulate loading and evaluation"""
+        started = time.perf_counter()
+        model = body.get('model')
+        load_s = self._load(model, self.keep_alive_seconds(body.get('keep_alive')))
+        prompt = body.get('prompt', '')
+        system = body.get('system')
+        options = body.get('options') or {}
+        words = ((system.split() + ["\n\n"]) if system else []) + prompt.split()
+        num_ctx = options.get('num_ctx') or DEFAULT_NUM_CTX
+        if len(words) > num_ctx:
+            with self._lock:
+                self.truncated += 1
+            words = words[:num_ctx]
+        reused = self._reuse(model, words)
+        prompt_words = len(words) - reused
+        with self._lock:
+            self.prompt_words += len(words)
+            self.reused_words += reused
+        prompt_started = time.perf_counter()
+        time.sleep(prompt_words * self.prompt_delay)
+        prompt_done = time.perf_counter()
+
+        tokens = self.reply_tokens(f"{system}\n\n{prompt}" if system else prompt, options)
+        for token in tokens:
+            time.sleep(self.token_delay)
+            yield {"model": body.get('model'), "response": token, "done": False}
+
+        finished = time.perf_counter()
+        yield {
+            "model": body.get('model'),
+            "response": "",
+            "done": True,
+            "load_duration": int(load_s * 1e9),
+            "prompt_eval_count": prompt_words,
+            "prompt_eval_duration": int((prompt_done - prompt_started) * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int((finished - prompt_done) * 1e9),
+            "total_duration": int((finished - started) * 1e9)
+        }
+
+    def pull(self, name):
+        """Yield ``/api/pull`` progress chunks and install ``name`` at the end"""
+        yield {"status": "pulling manifest"}
+        total = 1000 * self.pull_steps
+        digest = "sha256:" + hashlib.sha256(name.encode('utf-8')).hexdigest()
+        for step in range(1, self.pull_steps + 1):
+            time.sleep(self.pull_delay)
+            yield {"status": f"pulling {digest[7:19]}", "digest": digest, "total": total, "completed": 1000 * step}
+        yield {"status": "verifying sha256 digest"}
+        yield {"status": "writing manifest"}
+        with self._lock:
+            if name not in self.models:
+                self.models.append(name)
+        yield {"status": "success"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_chunked(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload) + '\n').encode('utf-8')
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            def _end_chunked(self):
+                self.wfile.write(b'0\r\n\r\n')
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send_json(200, {"models": [{"name": name} for name in server.models]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/api/pull':
+                    self._start_chunked()
+                    for chunk in server.pull(body.get('model') or body.get('name')):
+                        self._write_chunk(chunk)
+                    self._end_chunked()
+                    return
+                if self.path != '/api/generate':
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if body.get('model') not in server.models:
+                    self._send_json(404, {"error": f"model '{body.get('model')}' not found"})
+                    return
+                if not server._acquire():
+                    self._send_json(503, {"error": "server busy, please try again. maximum pending requests exceeded"})
+                    return
+
+                try:
+                    if body.get('stream', True):
+                        self._start_chunked()
+                        for chunk in server.generate(body):
+                            self._write_chunk(chunk)
+                        self._end_chunked()
+                    else:
+                        chunks = list(server.generate(body))
+                        final = dict(chunks[-1], response="".join(chunk['response'] for chunk in chunks))
+                        self._send_json(200, final)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._release()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--models', nargs='+', default=["llama2:7b"])
+    parser.add_argument('--parallel', type=int, default=4)
+    parser.add_argument('--max-queue', type=int, default=512)
+    parser.add_argument('--prompt-delay', type=float, default=0.0002)
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--tokens', type=int, default=32)
+    parser.add_argument('--load-delay', type=float, default=0.0)
+    parser.add_argument('--keep-alive', type=float, default=300)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        args.host, args.port, args.models, args.parallel, args.max_queue,
+        args.prompt_delay, args.token_delay, args.tokens, load_delay=args.load_delay, keep_alive=args.keep_alive
+    )
+    print(f"Fake Ollama listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,36 @@
-import os
 import base64
-import pickle
 from email.mime.text import MIMEText
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+from gmail_fetcher import GmailFetcher, message_to_email
+from gmail_service import get_service
 
 def authenticate_gmail():
-    creds = None
-    if os.path.exists('token.json'):
-        with open('token.json', 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'wb') as token:
-            pickle.dump(creds, token)
-
-    service = build('gmail', 'v1', credentials=creds)
-    return service
-
-
-def get_latest_unread_email(service):
-    results = service.users().messages().list(userId='me', labelIds=['INBOX'], q='is:unread', maxResults=1).execute()
-    messages = results.get('messages', [])
-    if not messages:
-        return None, None, None, None
-
-    msg = service.users().messages().get(userId='me', id=messages[0]['id'], format='full').execute()
-    headers = msg['payload']['headers']
-    subject = sender = ''
-    for header in headers:
-        if header['name'] == 'From':
-            sender = header['value']
-        elif header['name'] == 'Subject':
-            subject = header['value']
-
-    # Try to extract email body (handle multipart)
-    body = None
-    payload = msg['payload']
-
-    if 'parts' in payload:
-        for part in payload['parts']:
-            if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                break
+    # Built once per process from the cached discovery document; the token is refreshed in the background
+    return get_service('token.json', 'credentials.json')
+
+
+def get_latest_unread_email(service, handler=None):
+    """Sender, subject, body and thread id of the newest unread inbox email, or four Nones
+
+    With a ``GmailHandler`` the email comes from its synced store, so only
+    the changes since the last sync and a body not seen before are fetched.
+    """
+    if handler is not None:
+        emails = handler.get_unread_emails(limit=1)
+        if not emails:
+            return None, None, None, None
+        email = emails[0]
+        handler.load_body(email)
     else:
-        if 'data' in payload['body']:
-            body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-
-    if body is None:
-        body = "[No readable content]"
-
-    thread_id = msg.get('threadId')
-
-    return sender, subject, body, thread_id
+        fetcher = GmailFetcher(service)
+        ids = [ref['id'] for ref in fetcher.list_ids(query='is:unread', label_ids=('INBOX',), limit=1)]
+        # Deleted between the list and the get, the message is simply missing
+        messages = fetcher.get_messages(ids, format='full')
+        if not messages:
+            return None, None, None, None
+        email = message_to_email(messages[ids[0]], with_body=True, service=service)
+    return email['sender'], email['subject'], email['body'], email['threadId']
 
 
 def send_email_reply(service, to_email, subject, message_text, thread_id=None):
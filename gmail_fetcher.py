@@ -0,0 +1,169 @@
+import html
+
+from mime_parser import MimeMessage
+
+# Headers requested with format='metadata'; enough to list, thread and reply
+METADATA_HEADERS = ['From', 'To', 'Subject', 'Date', 'Message-ID', 'In-Reply-To', 'References']
+
+
+class FetchError(Exception):
+    """Some messages of a batched fetch failed
+
+    ``messages`` holds what was fetched, keyed by id, and ``failed`` maps
+    each failed id to its error, so callers can keep the partial result.
+    """
+
+    def __init__(self, messages, failed):
+        super().__init__(f"{len(failed)} of {len(messages) + len(failed)} messages could not be fetched: "
+                         f"{next(iter(failed.values()))}")
+        self.messages = messages
+        self.failed = failed
+
+
+def http_status(error):
+    """HTTP status of a googleapiclient ``HttpError`` (or lookalike), else None"""
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'resp', None), 'status', None)
+    return int(status) if status is not None else None
+
+
+def header_map(payload):
+    return {header['name'].lower(): header['value'] for header in payload.get('headers', [])}
+
+
+def email_body(email):
+    """Body of an email dict, or its snippet while the body is not loaded (or failed to load)"""
+    return email.get('body') or email.get('snippet', '')
+
+
+def message_to_email(message, with_body=False, service=None, user_id='me'):
+    """Flatten a Gmail message resource into the email dict used across the app
+
+    Pass ``with_body=True`` for messages fetched with ``format='full'``;
+    otherwise the dict has no ``body`` key until it is loaded. With
+    ``service``, bodies Gmail stores by ``attachmentId`` are fetched too.
+    """
+    headers = header_map(message.get('payload', {}))
+    email = {
+        'id': message['id'],
+        'threadId': message.get('threadId'),
+        'sender': headers.get('from', ''),
+        'to': headers.get('to', ''),
+        'subject': headers.get('subject', ''),
+        'date': headers.get('date', ''),
+        'message_id': headers.get('message-id', ''),
+        'snippet': html.unescape(message.get('snippet', '')),
+        'labels': message.get('labelIds', []),
+        'history_id': message.get('historyId'),
+        'internal_date': int(message.get('internalDate', 0))
+    }
+    if with_body:
+        email['body'] = MimeMessage(message, service, user_id).body() or "[No readable content]"
+    return email
+
+
+class GmailFetcher:
+    """Fetch Gmail messages in as few HTTP round trips as possible
+
+    ``messages.list`` is paged with ``nextPageToken`` at up to ``page_size``
+    ids per call, and the per-message ``messages.get`` calls are grouped into
+    batch requests of up to ``batch_size`` (Gmail's limit is 100). Listing
+    fetches ``format='metadata'`` headers only; bodies are fetched with
+    ``load_bodies`` once a message is actually opened.
+    """
+
+    def __init__(self, service, user_id='me', batch_size=100, page_size=500, metadata_headers=METADATA_HEADERS):
+        if not 1 <= batch_size <= 100:
+            raise ValueError("batch_size must be between 1 and 100")
+        self.service = service
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.metadata_headers = list(metadata_headers)
+
+    def list_ids(self, query='is:unread', label_ids=('INBOX',), limit=None):
+        """Yield ``{'id', 'threadId'}`` refs for matching messages, newest first"""
+        page_token = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            refs, page_token = self.list_page(query, label_ids, self.page_size if remaining is None
+                                              else min(self.page_size, remaining), page_token)
+            yield from refs
+            if remaining is not None:
+                remaining -= len(refs)
+            if not page_token or not refs:
+                return
+
+    def list_page(self, query=None, label_ids=('INBOX',), max_results=None, page_token=None):
+        """One ``messages.list`` call: ``(refs, next_page_token)``, the token None on the last page"""
+        request = {'userId': self.user_id, 'maxResults': max_results or self.page_size}
+        if query:
+            request['q'] = query
+        if label_ids:
+            request['labelIds'] = list(label_ids)
+        if page_token:
+            request['pageToken'] = page_token
+        page = self.service.users().messages().list(**request).execute()
+        return page.get('messages', []), page.get('nextPageToken')
+
+    def get_messages(self, ids, format='metadata'):
+        """Fetch message resources with batched ``messages.get``, keyed by id
+
+        Messages deleted since they were listed (404) are left out. Any other
+        failure raises ``FetchError`` once every batch has run.
+        """
+        ids = list(ids)
+        messages = {}
+        failed = {}
+
+        def collect(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif http_status(exception) != 404:
+                failed[request_id] = exception
+
+        for start in range(0, len(ids), self.batch_size):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for message_id in ids[start:start + self.batch_size]:
+                request = {'userId': self.user_id, 'id': message_id, 'format': format}
+                if format == 'metadata':
+                    request['metadataHeaders'] = self.metadata_headers
+                batch.add(self.service.users().messages().get(**request), request_id=message_id)
+            batch.execute()
+        if failed:
+            raise FetchError(messages, failed)
+        return messages
+
+    def fetch(self, query='is:unread', label_ids=('INBOX',), limit=10):
+        """Matching emails with headers and snippet but no body, newest first"""
+        ids = [ref['id'] for ref in self.list_ids(query, label_ids, limit)]
+        messages = self.get_messages(ids)
+        return [message_to_email(messages[message_id]) for message_id in ids if message_id in messages]
+
+    def load_bodies(self, emails):
+        """Fill in ``body`` for every email that lacks one, in batches
+
+        On ``FetchError`` the bodies that did arrive are filled in before it propagates.
+        """
+        missing = [email for email in emails if 'body' not in email]
+        if missing:
+            messages = {}
+            try:
+                messages = self.get_messages([email['id'] for email in missing], format='full')
+            except FetchError as e:
+                messages = e.messages
+                raise
+            finally:
+                for email in missing:
+                    if email['id'] in messages:
+                        email['body'] = self._body(messages[email['id']])
+        return emails
+
+    def load_body(self, email):
+        """Body of one email, fetched on first access"""
+        if 'body' not in email:
+            message = self.service.users().messages().get(userId=self.user_id, id=email['id'], format='full').execute()
+            email['body'] = self._body(message)
+        return email['body']
+
+    def _body(self, message):
+        return MimeMessage(message, self.service, self.user_id).body() or "[No readable content]"
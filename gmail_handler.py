@@ -0,0 +1,98 @@
+from gmail_fetcher import GmailFetcher
+from gmail_quota import GMAIL_USER_QUOTA, QuotaService
+from gmail_sync import GmailSync, MemoryMessageStore
+
+
+class GmailHandler:
+    """Gmail access used by the Streamlit app
+
+    The inbox is mirrored into ``store`` and kept current with ``GmailSync``,
+    so fetching again only downloads what changed. Emails come back with
+    headers and snippet; call ``load_body`` / ``load_bodies`` before reading
+    ``email['body']``. Pass ``service`` to use an existing client, e.g.
+    ``fake_gmail.FakeGmailService``. Every call goes through a
+    ``QuotaService`` throttled to ``units_per_second``; pass None to call
+    the service directly. With an ``outbox.Outbox``, ``queue_reply`` and
+    ``flush_outbox`` send replies durably and at most once. The first sync
+    mirrors only the newest ``initial_sync`` inbox messages; older ones are
+    backfilled a page per ``get_unread_emails`` call that comes up short,
+    or with ``backfill``.
+    """
+
+    def __init__(self, service=None, store=None, batch_size=100, units_per_second=0.95 * GMAIL_USER_QUOTA,
+                 outbox=None, initial_sync=200):
+        self.batch_size = batch_size
+        self.initial_sync = initial_sync
+        self.outbox = outbox
+        self.units_per_second = units_per_second
+        self.store = store if store is not None else MemoryMessageStore()
+        self.service = None
+        self.fetcher = None
+        self.syncer = None
+        self.last_sync = None
+        if service is not None:
+            self._use_service(service)
+
+    def _use_service(self, service):
+        if self.units_per_second is not None and not isinstance(service, QuotaService):
+            service = QuotaService(service, units_per_second=self.units_per_second)
+        self.service = service
+        self.fetcher = GmailFetcher(service, batch_size=self.batch_size)
+        self.syncer = GmailSync(service, self.store, initial_messages=self.initial_sync, fetcher=self.fetcher)
+
+    def authenticate(self):
+        """Run the OAuth flow (or reuse token.json) and build the Gmail service"""
+        from gmail_agent import authenticate_gmail
+
+        self._use_service(authenticate_gmail())
+        return self.service
+
+    def sync(self):
+        """Apply mailbox changes since the last sync to the local store"""
+        self.last_sync = self.syncer.sync()
+        return self.last_sync
+
+    def backfill(self, count=None):
+        """Mirror older inbox messages than the first sync listed; None once all are stored"""
+        return self.syncer.backfill(count)
+
+    def get_unread_emails(self, limit=10):
+        """Newest unread inbox emails, synced incrementally"""
+        self.sync()
+        emails = self.store.list(label='UNREAD', limit=limit)
+        if len(emails) < limit and self.backfill() is not None:
+            emails = self.store.list(label='UNREAD', limit=limit)
+        return emails
+
+    def load_body(self, email):
+        if 'body' not in email:
+            self.fetcher.load_body(email)
+            self.store.upsert([email])
+        return email['body']
+
+    def load_bodies(self, emails):
+        missing = [email for email in emails if 'body' not in email]
+        if missing:
+            try:
+                self.fetcher.load_bodies(missing)
+            finally:
+                self.store.upsert([email for email in missing if 'body' in email])
+        return emails
+
+    def send_reply(self, email, reply_text):
+        from gmail_agent import send_email_reply
+
+        return send_email_reply(
+            self.service,
+            to_email=email['sender'],
+            subject=email['subject'],
+            message_text=reply_text,
+            thread_id=email.get('threadId')
+        )
+
+    def queue_reply(self, email, reply_text):
+        """Store a reply in the outbox; False if this email already has one"""
+        return self.outbox.add(email, reply_text)
+
+    def flush_outbox(self, **options):
+        return self.outbox.flush(self.service, **options)
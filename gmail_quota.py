@@ -0,0 +1,364 @@
+import random
+import threading
+import time
+from collections import deque
+
+from gmail_fetcher import http_status
+
+# Gmail's per-user limit, in quota units per second (moving average)
+GMAIL_USER_QUOTA = 250
+
+# Quota units per method, from https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    'users.getProfile': 1,
+    'users.watch': 100,
+    'users.stop': 50,
+    'users.history.list': 2,
+    'users.labels.list': 1,
+    'users.labels.get': 1,
+    'users.messages.list': 5,
+    'users.messages.get': 5,
+    'users.messages.modify': 5,
+    'users.messages.trash': 5,
+    'users.messages.untrash': 5,
+    'users.messages.delete': 10,
+    'users.messages.send': 100,
+    'users.messages.insert': 25,
+    'users.messages.import': 25,
+    'users.messages.batchModify': 50,
+    'users.messages.batchDelete': 50,
+    'users.messages.attachments.get': 5,
+    'users.threads.list': 10,
+    'users.threads.get': 10,
+    'users.threads.modify': 10,
+    'users.drafts.create': 10,
+    'users.drafts.list': 5,
+    'users.drafts.get': 5,
+    'users.drafts.send': 100
+}
+DEFAULT_UNITS = 5
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = (b'rateLimitExceeded', b'userRateLimitExceeded')
+# Calls that must not be repeated after a failure that may have happened once Gmail had acted
+NON_IDEMPOTENT = frozenset({'users.messages.send', 'users.drafts.send', 'users.messages.insert',
+                            'users.messages.import'})
+
+
+class OutcomeUnknown(Exception):
+    """A non-idempotent call failed without saying whether Gmail carried it out
+
+    Raised (or passed to batch callbacks) instead of retrying on a 5xx or a
+    dropped connection; the caller has to look the result up before trying
+    again. ``error`` is the original exception.
+    """
+
+    def __init__(self, method, error):
+        super().__init__(f"{method}: outcome unknown after {error}")
+        self.method = method
+        self.error = error
+
+
+def quota_units(method):
+    return QUOTA_UNITS.get(method, DEFAULT_UNITS)
+
+
+def is_rate_limited(error):
+    """True for 429 and the 403 Gmail returns for per-user rate limits; nothing was done in either case"""
+    status = http_status(error)
+    if status == 429:
+        return True
+    content = getattr(error, 'content', b'') or b''
+    return status == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable(error, method=None):
+    """True for rate limits, and for 5xx unless ``method`` is non-idempotent"""
+    if is_rate_limited(error):
+        return True
+    return method not in NON_IDEMPOTENT and http_status(error) in RETRY_STATUSES
+
+
+def is_ambiguous(error):
+    """True for failures that may come after the server acted: 5xx and transport errors"""
+    status = http_status(error)
+    return status >= 500 if status is not None else isinstance(error, OSError)
+
+
+def settle_error(error, method):
+    """The exception to report for a call that will not be retried"""
+    if method in NON_IDEMPOTENT and not is_rate_limited(error) and is_ambiguous(error):
+        return OutcomeUnknown(method, error)
+    return error
+
+
+def retry_after(error):
+    """Seconds from a ``Retry-After`` header, if the error carries one"""
+    resp = getattr(error, 'resp', None)
+    value = resp.get('retry-after') if hasattr(resp, 'get') else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second
+
+    ``acquire`` reserves tokens even beyond ``capacity`` and sleeps until the
+    reservation is covered, so callers are served in arrival order and a
+    large request waits in proportion to its cost.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Take ``tokens``, sleeping as long as needed; returns the seconds waited"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def drain(self):
+        """Drop the stored burst, e.g. after the server reported a rate limit"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0)
+
+
+class QuotaService:
+    """Gmail service wrapper that stays under the per-user quota and retries
+
+    Drop-in for a ``build('gmail', 'v1')`` service: call chains and batch
+    requests work as before. Every ``execute()`` first takes the method's
+    quota units from a token bucket refilled at ``units_per_second``
+    (slightly below Gmail's 250 by default). Batches are split so no single
+    HTTP request spends more than one second of quota. Calls failing with
+    429, 5xx or a rate-limit 403 are retried up to ``max_retries`` times
+    with full-jitter exponential backoff; in a batch only the failed parts
+    are retried. Non-idempotent methods (``NON_IDEMPOTENT``, e.g. send) are
+    retried on rate limits only; a 5xx or transport error there surfaces as
+    ``OutcomeUnknown``, since Gmail may have acted before failing.
+    ``stats()`` reports live usage.
+    """
+
+    def __init__(self, service, units_per_second=0.95 * GMAIL_USER_QUOTA, max_retries=5, base_delay=0.5,
+                 max_delay=32.0, window=10.0):
+        self.service = service
+        self.units_per_second = units_per_second
+        self.bucket = TokenBucket(units_per_second)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._started = time.monotonic()
+        self._stats = {'calls': 0, 'units': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0,
+                       'throttled_seconds': 0.0, 'by_method': {}}
+
+    def users(self):
+        return _ResourceProxy(self, self.service.users(), 'users')
+
+    def new_batch_http_request(self, callback=None):
+        return QuotaBatch(self, callback)
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry ``attempt`` (0-based)"""
+        delay = retry_after(error) if error is not None else None
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return delay
+
+    def _spend(self, method_units):
+        """Take quota for ``[(method, units), ...]`` sent as one HTTP request"""
+        units = sum(cost for _, cost in method_units)
+        waited = self.bucket.acquire(units)
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats
+            stats['calls'] += len(method_units)
+            stats['units'] += units
+            stats['throttled_seconds'] += waited
+            for method, cost in method_units:
+                stats['by_method'][method] = stats['by_method'].get(method, 0) + cost
+            self._recent.append((now, units))
+
+    def _record_failure(self, error, retrying):
+        with self._lock:
+            if is_rate_limited(error):
+                self._stats['rate_limited'] += 1
+            self._stats['retries' if retrying else 'failures'] += 1
+        if http_status(error) == 429:
+            self.bucket.drain()
+
+    def execute(self, request, method, num_retries=0):
+        for attempt in range(self.max_retries + 1):
+            self._spend([(method, quota_units(method))])
+            try:
+                return request.execute(num_retries=num_retries)
+            except Exception as e:
+                retrying = is_retryable(e, method) and attempt < self.max_retries
+                self._record_failure(e, retrying)
+                if not retrying:
+                    settled = settle_error(e, method)
+                    if settled is e:
+                        raise
+                    raise settled from e
+                time.sleep(self.backoff(attempt, e))
+
+    def stats(self):
+        """Quota used so far plus the rate over the last ``window`` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > self.window:
+                self._recent.popleft()
+            recent = sum(units for _, units in self._recent)
+            stats = dict(self._stats, by_method=dict(self._stats['by_method']))
+        span = min(self.window, now - self._started) or 1e-9
+        stats['units_per_second'] = recent / span
+        stats['utilisation'] = stats['units_per_second'] / self.units_per_second
+        return stats
+
+
+class _RequestProxy:
+    def __init__(self, client, request, method):
+        self.client = client
+        self.request = request
+        self.method = method
+
+    def execute(self, num_retries=0):
+        return self.client.execute(self.request, self.method, num_retries)
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+
+class _ResourceProxy:
+    def __init__(self, client, resource, path):
+        self._client = client
+        self._resource = resource
+        self._path = path
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        path = f"{self._path}.{name}"
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if result is None:
+                return None
+            if hasattr(result, 'execute'):
+                return _RequestProxy(self._client, result, path)
+            return _ResourceProxy(self._client, result, path)
+
+        return call
+
+
+class QuotaBatch:
+    """Batch request that spends quota per part and retries only the parts that failed
+
+    Each part's callback runs once, with its final outcome. An exception
+    raised by a callback does not touch the other parts; the first one is
+    re-raised from ``execute`` after every part has been delivered.
+    """
+
+    def __init__(self, client, callback=None):
+        self.client = client
+        self.callback = callback
+        self._parts = []
+        self._delivered = set()
+        self._callback_errors = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self._parts) + 1)
+        if isinstance(request, _RequestProxy):
+            method, request = request.method, request.request
+        else:
+            method = getattr(request, 'methodId', '').replace('gmail.', '')
+        self._parts.append((request_id, request, method, callback))
+
+    def _chunks(self, parts):
+        """Split ``parts`` so no HTTP request spends more than a second of quota"""
+        chunk, units = [], 0
+        for part in parts:
+            cost = quota_units(part[2])
+            if chunk and units + cost > self.client.units_per_second:
+                yield chunk
+                chunk, units = [], 0
+            chunk.append(part)
+            units += cost
+        if chunk:
+            yield chunk
+
+    def execute(self):
+        pending = list(self._parts)
+        self._delivered = set()
+        self._callback_errors = []
+        for attempt in range(self.client.max_retries + 1):
+            failed = []
+            for chunk in self._chunks(pending):
+                failed += self._send(chunk, retry=attempt < self.client.max_retries)
+            if not failed:
+                break
+            pending = failed
+            time.sleep(self.client.backoff(attempt))
+        if self._callback_errors:
+            raise self._callback_errors[0]
+
+    def _send(self, chunk, retry):
+        """Send one chunk; returns the parts to retry"""
+        failed = []
+        by_id = {part[0]: part for part in chunk}
+
+        def collect(request_id, response, exception):
+            part = by_id[request_id]
+            if exception is not None and is_retryable(exception, part[2]):
+                self.client._record_failure(exception, retry)
+                if retry:
+                    failed.append(part)
+                    return
+            self._deliver(part, response, None if exception is None else settle_error(exception, part[2]))
+
+        batch = self.client.service.new_batch_http_request(callback=collect)
+        for request_id, request, _, _ in chunk:
+            batch.add(request, request_id=request_id)
+        self.client._spend([(method, quota_units(method)) for _, _, method, _ in chunk])
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole HTTP request failed. Parts already delivered keep their outcome; of the
+            # rest, those safe to repeat are retried and the others fail (or are unknown) with it
+            delivered = self._delivered
+            undelivered = [part for part in chunk if id(part) not in delivered and part not in failed]
+            retried = [part for part in undelivered if retry and is_retryable(e, part[2])]
+            self.client._record_failure(e, bool(retried))
+            for part in undelivered:
+                if part not in retried:
+                    self._deliver(part, None, settle_error(e, part[2]))
+            return failed + retried
+        return failed
+
+    def _deliver(self, part, response, exception):
+        self._delivered.add(id(part))
+        request_id, _, _, callback = part
+        callback = callback or self.callback
+        if callback:
+            try:
+                callback(request_id, response, exception)
+            except Exception as e:
+                self._callback_errors.append(e)
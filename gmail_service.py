@@ -0,0 +1,172 @@
+import json
+import os
+import pickle
+import threading
+from datetime import datetime, timezone
+
+import google_auth_httplib2
+import httplib2
+import requests
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+DISCOVERY_URL = 'https://gmail.googleapis.com/$discovery/rest?version=v1'
+DISCOVERY_CACHE = os.path.join('cache', 'gmail_v1_discovery.json')
+
+
+def _load_discovery_document():
+    """Gmail discovery document bundled with googleapiclient, else downloaded"""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc('gmail', 'v1')
+    except ImportError:
+        document = None
+    if document is None:
+        response = requests.get(DISCOVERY_URL, timeout=30)
+        response.raise_for_status()
+        document = response.text
+    return document
+
+
+class GmailServiceFactory:
+    """Builds the Gmail service once per process and keeps its token fresh
+
+    The discovery document is parsed once and kept in ``discovery_path``,
+    so later starts skip both the download and ``build``'s per-call lookup.
+    Credentials come from ``token_path`` (running the OAuth flow with
+    ``client_secrets`` only when there is no usable token) and a daemon
+    thread refreshes them ``refresh_margin`` seconds before they expire, so
+    requests never wait on a refresh.
+
+    The service is safe to share between threads: each thread gets its own
+    authorised ``httplib2`` transport (httplib2 connections are not
+    thread-safe) over the one shared set of credentials.
+    """
+
+    def __init__(self, token_path='token.json', client_secrets='credentials.json', scopes=SCOPES,
+                 discovery_path=DISCOVERY_CACHE, refresh_margin=300):
+        self.token_path = token_path
+        self.client_secrets = client_secrets
+        self.scopes = list(scopes)
+        self.discovery_path = discovery_path
+        self.refresh_margin = refresh_margin
+        self.credentials = None
+        self._service = None
+        self._document = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stopping = threading.Event()
+        self._refresher = None
+
+    def discovery_document(self):
+        """Parsed discovery document: from memory, the cache file, or fetched and cached"""
+        with self._lock:
+            if self._document is None:
+                if os.path.exists(self.discovery_path):
+                    with open(self.discovery_path, encoding='utf-8') as f:
+                        self._document = json.load(f)
+                else:
+                    self._document = json.loads(_load_discovery_document())
+                    if os.path.dirname(self.discovery_path):
+                        os.makedirs(os.path.dirname(self.discovery_path), exist_ok=True)
+                    with open(self.discovery_path, 'w', encoding='utf-8') as f:
+                        json.dump(self._document, f)
+            return self._document
+
+    def _save_credentials(self):
+        with open(self.token_path, 'wb') as token:
+            pickle.dump(self.credentials, token)
+
+    def load_credentials(self):
+        """Credentials from ``token_path``, refreshed or re-authorised when needed"""
+        with self._lock:
+            creds = self.credentials
+            if creds is None and os.path.exists(self.token_path):
+                with open(self.token_path, 'rb') as token:
+                    creds = pickle.load(token)
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets, self.scopes)
+                    creds = flow.run_local_server(port=0)
+                self.credentials = creds
+                self._save_credentials()
+            else:
+                self.credentials = creds
+            return creds
+
+    def refresh(self):
+        """Refresh the access token now and persist it"""
+        with self._lock:
+            self.credentials.refresh(Request())
+            self._save_credentials()
+
+    def seconds_until_expiry(self):
+        expiry = getattr(self.credentials, 'expiry', None)
+        if expiry is None:
+            return None
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def _refresh_loop(self):
+        while not self._stopping.is_set():
+            remaining = self.seconds_until_expiry()
+            if remaining is None or not getattr(self.credentials, 'refresh_token', None):
+                return
+            if self._stopping.wait(max(remaining - self.refresh_margin, 0)):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing Gmail token: {e}")
+                self._stopping.wait(30)
+
+    def http(self):
+        """This thread's authorised transport"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        # Requests run on the calling thread's transport, whichever thread built the service
+        return HttpRequest(self.http(), *args, **kwargs)
+
+    def service(self):
+        """The shared Gmail service, built on first use"""
+        with self._lock:
+            if self._service is None:
+                self.load_credentials()
+                self._service = build_from_document(self.discovery_document(), http=self.http(),
+                                                    requestBuilder=self._build_request)
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, name='gmail-token-refresh',
+                                                       daemon=True)
+                    self._refresher.start()
+            return self._service
+
+    def close(self):
+        self._stopping.set()
+
+
+_factories = {}
+_factories_lock = threading.Lock()
+
+
+def get_factory(token_path='token.json', client_secrets='credentials.json'):
+    """Process-wide ``GmailServiceFactory`` for one token file"""
+    key = os.path.abspath(token_path)
+    with _factories_lock:
+        factory = _factories.get(key)
+        if factory is None:
+            factory = _factories[key] = GmailServiceFactory(token_path, client_secrets)
+        return factory
+
+
+def get_service(token_path='token.json', client_secrets='credentials.json'):
+    """Authorised Gmail service shared by every caller in the process"""
+    return get_factory(token_path, client_secrets).service()
@@ -0,0 +1,255 @@
+import threading
+from abc import ABC, abstractmethod
+
+from gmail_fetcher import GmailFetcher, http_status, message_to_email
+
+
+class MessageStore(ABC):
+    """Local copy of synced emails, written by ``GmailSync``
+
+    Emails are the dicts produced by ``gmail_fetcher.message_to_email``,
+    keyed by Gmail message id. ``get_state``/``set_state`` keep small sync
+    values such as the last ``historyId``.
+    """
+
+    @abstractmethod
+    def get_state(self, key, default=None):
+        """Sync value stored under ``key``, or ``default``"""
+
+    @abstractmethod
+    def set_state(self, key, value):
+        """Store a small JSON-serialisable sync value"""
+
+    @abstractmethod
+    def ids(self):
+        """Set of every stored message id"""
+
+    @abstractmethod
+    def get(self, message_id):
+        """Stored email with ``message_id``, or None"""
+
+    @abstractmethod
+    def upsert(self, emails):
+        """Insert or replace emails, keeping a body already stored when the new copy has none"""
+
+    @abstractmethod
+    def delete(self, message_ids):
+        """Drop emails; unknown ids are ignored"""
+
+    @abstractmethod
+    def set_labels(self, message_id, labels):
+        """Replace a stored email's labels"""
+
+    @abstractmethod
+    def list(self, label=None, limit=None):
+        """Stored emails carrying ``label``, newest first"""
+
+
+class MemoryMessageStore(MessageStore):
+    """MessageStore kept in a dict; lost when the process exits"""
+
+    def __init__(self):
+        self.emails = {}
+        self.state = {}
+
+    def get_state(self, key, default=None):
+        return self.state.get(key, default)
+
+    def set_state(self, key, value):
+        self.state[key] = value
+
+    def ids(self):
+        return set(self.emails)
+
+    def get(self, message_id):
+        return self.emails.get(message_id)
+
+    def upsert(self, emails):
+        for email in emails:
+            previous = self.emails.get(email['id'])
+            # Keep a body that was already downloaded
+            if previous is not None and 'body' in previous and 'body' not in email:
+                email = dict(email, body=previous['body'])
+            self.emails[email['id']] = email
+
+    def delete(self, message_ids):
+        for message_id in message_ids:
+            self.emails.pop(message_id, None)
+
+    def set_labels(self, message_id, labels):
+        if message_id in self.emails:
+            self.emails[message_id]['labels'] = list(labels)
+
+    def list(self, label=None, limit=None):
+        emails = [email for email in self.emails.values() if label is None or label in email['labels']]
+        emails.sort(key=lambda email: email.get('internal_date', 0), reverse=True)
+        return emails[:limit] if limit is not None else emails
+
+
+class GmailSync:
+    """Keep a MessageStore in step with one Gmail label using ``historyId``
+
+    The first sync lists the newest ``initial_messages`` messages under
+    ``label`` (all ``max_messages`` when None) and records the mailbox
+    ``historyId``; ``backfill`` mirrors older messages a page at a time,
+    up to ``max_messages`` in all. Later syncs page through
+    ``users.history.list`` from that id and apply only what changed: new
+    messages are fetched (metadata, batched), deleted ones dropped, and label
+    changes applied in place. An idle mailbox costs one small request. When
+    Gmail no longer has the history (404, after roughly a week) the store is
+    rebuilt with a full sync. ``sync`` is safe to call from several threads;
+    concurrent calls run one after another.
+    """
+
+    HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+    def __init__(self, service, store, label='INBOX', max_messages=2000, initial_messages=None, fetcher=None,
+                 user_id='me'):
+        self.service = service
+        self.store = store
+        self.label = label
+        self.max_messages = max_messages
+        self.initial_messages = min(initial_messages or max_messages, max_messages)
+        self.user_id = user_id
+        self.fetcher = fetcher or GmailFetcher(service, user_id=user_id)
+        self._lock = threading.Lock()
+
+    @property
+    def history_id(self):
+        return self.store.get_state('history_id')
+
+    def sync(self):
+        """Bring the store up to date; returns a report of what changed"""
+        with self._lock:
+            if self.history_id is None:
+                return self.full_sync()
+            try:
+                return self._incremental_sync(self.history_id)
+            except Exception as e:
+                if http_status(e) != 404:
+                    raise
+                return self.full_sync()
+
+    def full_sync(self):
+        """Re-list the newest ``initial_messages`` and replace the store's contents for that range"""
+        # Take the history id first so changes made while listing are replayed next time
+        history_id = self.service.users().getProfile(userId=self.user_id).execute()['historyId']
+        ids, page_token = self._list_window(self.initial_messages, None)
+        report, oldest = self._apply_window(ids, newer_than=None, complete=page_token is None)
+        self._set_backfill(page_token, len(ids), oldest)
+        self.store.set_state('history_id', history_id)
+        return dict(report, mode='full', history_id=history_id, backfill=page_token is not None)
+
+    def backfill(self, count=None):
+        """Mirror up to ``count`` (default ``initial_messages``) older messages; None when there are no more
+
+        Stored messages in the listed date range that Gmail no longer has
+        under ``label`` are dropped, as a full sync would.
+        """
+        with self._lock:
+            page_token = self.store.get_state('backfill_token')
+            if page_token is None or self.history_id is None:
+                return None
+            listed = self.store.get_state('backfill_listed', 0)
+            count = min(count or self.initial_messages, self.max_messages - listed)
+            ids, page_token = self._list_window(count, page_token)
+            listed += len(ids)
+            if listed >= self.max_messages:
+                page_token = None
+            report, oldest = self._apply_window(ids, newer_than=self.store.get_state('backfill_before'),
+                                                complete=page_token is None)
+            self._set_backfill(page_token, listed, oldest)
+            return dict(report, mode='backfill', history_id=self.history_id, backfill=page_token is not None)
+
+    def _list_window(self, count, page_token):
+        """Ids of the next ``count`` messages under ``label`` after ``page_token``, and the token after them"""
+        ids = []
+        while len(ids) < count:
+            refs, page_token = self.fetcher.list_page(None, [self.label], min(self.fetcher.page_size,
+                                                                              count - len(ids)), page_token)
+            ids.extend(ref['id'] for ref in refs)
+            if not page_token or not refs:
+                break
+        return ids, page_token
+
+    def _apply_window(self, ids, newer_than, complete):
+        """Store the listed messages and drop stored ones in their date range that were not listed
+
+        The range runs from the oldest listed message (or the beginning when
+        the listing is ``complete``) up to ``newer_than`` (or now). Messages
+        dated exactly on a boundary are never dropped: they may belong to the
+        neighbouring page. Returns the report and the oldest listed date.
+        """
+        known = self.store.ids()
+        new = [message_id for message_id in ids if message_id not in known]
+        kept = [message_id for message_id in ids if message_id in known]
+
+        messages = self.fetcher.get_messages(new)
+        self.store.upsert(self._emails(messages, new))
+        # Messages already stored only need their labels refreshed
+        minimal = self.fetcher.get_messages(kept, format='minimal')
+        for message_id, message in minimal.items():
+            self.store.set_labels(message_id, message.get('labelIds', []))
+        messages.update(minimal)
+
+        dates = [int(message.get('internalDate', 0)) for message in messages.values()]
+        oldest = min(dates) if dates else newer_than
+        listed = set(ids)
+        stale = []
+        for message_id in known - listed:
+            date = (self.store.get(message_id) or {}).get('internal_date', 0)
+            if (complete or (oldest is not None and date > oldest)) and (newer_than is None or date < newer_than):
+                stale.append(message_id)
+        self.store.delete(stale)
+        return {'added': len(new), 'deleted': len(stale), 'relabelled': len(kept), 'added_ids': new}, oldest
+
+    def _set_backfill(self, page_token, listed, oldest):
+        self.store.set_state('backfill_token', page_token)
+        self.store.set_state('backfill_listed', listed)
+        self.store.set_state('backfill_before', oldest)
+
+    def _incremental_sync(self, start_history_id):
+        # Net effect per message id: its latest labels, or None once deleted
+        changes = {}
+        page_token = None
+        history_id = start_history_id
+        while True:
+            request = {'userId': self.user_id, 'startHistoryId': start_history_id,
+                       'historyTypes': self.HISTORY_TYPES, 'maxResults': 500}
+            if page_token:
+                request['pageToken'] = page_token
+            page = self.service.users().history().list(**request).execute()
+            for record in page.get('history', []):
+                for item in record.get('messagesAdded', []) + record.get('labelsAdded', []) + \
+                        record.get('labelsRemoved', []):
+                    message = item['message']
+                    if 'labelIds' in message:
+                        changes[message['id']] = message['labelIds']
+                for item in record.get('messagesDeleted', []):
+                    changes[item['message']['id']] = None
+            history_id = page.get('historyId', history_id)
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+        known = self.store.ids()
+        removed = [message_id for message_id, labels in changes.items()
+                   if message_id in known and (labels is None or self.label not in labels)]
+        fetch = [message_id for message_id, labels in changes.items()
+                 if labels is not None and self.label in labels and message_id not in known]
+        relabelled = [message_id for message_id, labels in changes.items()
+                      if labels is not None and self.label in labels and message_id in known]
+
+        self.store.delete(removed)
+        for message_id in relabelled:
+            self.store.set_labels(message_id, changes[message_id])
+        if fetch:
+            messages = self.fetcher.get_messages(fetch)
+            self.store.upsert(self._emails(messages, fetch))
+        self.store.set_state('history_id', history_id)
+        return {'mode': 'incremental', 'added': len(fetch), 'deleted': len(removed),
+                'relabelled': len(relabelled), 'history_id': history_id, 'added_ids': fetch}
+
+    @staticmethod
+    def _emails(messages, ids):
+        return [message_to_email(messages[message_id]) for message_id in ids if message_id in messages]
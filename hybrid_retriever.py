@@ -0,0 +1,221 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from rag_index import Retriever, _GrowableArray
+
+
+class BM25Retriever(Retriever):
+    """Okapi BM25 over an incrementally maintained inverted index
+
+    Each term keeps a postings list of ``(row, term_frequency)``. Adding a
+    passage appends to the postings of its terms; removing one tombstones the
+    row, and postings are compacted once tombstones dominate. Document
+    frequencies are counted from the live postings of the query terms, so a
+    query costs time proportional to those postings only. Long queries are
+    capped to their ``max_query_terms`` rarest terms.
+    """
+
+    name = 'bm25'
+
+    def __init__(self, k1=1.5, b=0.75, max_query_terms=32, stop_words='english', compact_ratio=0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self.stop_words = stop_words
+        self.compact_ratio = compact_ratio
+        self.analyzer = TfidfVectorizer(stop_words=stop_words).build_analyzer()
+        self.clear()
+
+    def clear(self):
+        self.vocabulary = {}
+        self._postings_rows = []
+        self._postings_tf = []
+        self._lengths = _GrowableArray(np.float64)
+        self._alive = _GrowableArray(np.bool_)
+        self._keys = []
+        self._rows_by_key = {}
+        self.total_length = 0.0
+
+    def __len__(self):
+        return len(self._rows_by_key)
+
+    def __contains__(self, key):
+        return key in self._rows_by_key
+
+    def load(self, terms, indices, data, indptr, keys, alive):
+        """Build postings from stored term-count rows instead of re-tokenising
+
+        Accepts the same arrays as ``IncrementalTfidfIndex.load``; both share
+        the analyzer, so the counts are exactly what ``add`` would produce.
+        """
+        self.clear()
+        counts = sp.csr_matrix(
+            (np.asarray(data), np.asarray(indices), np.asarray(indptr)),
+            shape=(len(keys), len(terms))
+        )
+        by_term = counts.tocsc()
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        for term_id in range(len(terms)):
+            start, end = by_term.indptr[term_id:term_id + 2]
+            self._postings_rows.append(_GrowableArray(np.int64, base=by_term.indices[start:end].astype(np.int64)))
+            self._postings_tf.append(_GrowableArray(np.float32, base=by_term.data[start:end]))
+
+        alive = np.array(alive, dtype=np.bool_)
+        lengths = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+        self._lengths = _GrowableArray(np.float64, base=lengths)
+        self._alive = _GrowableArray(np.bool_, base=alive)
+        self._keys = list(keys)
+        self._rows_by_key = {key: row for row, key in enumerate(self._keys) if alive[row]}
+        self.total_length = float(lengths[alive].sum())
+
+    def add(self, key, text):
+        if key in self._rows_by_key:
+            raise ValueError(f"Key already indexed: {key}")
+
+        row = len(self._keys)
+        ids = []
+        for token in self.analyzer(text):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                term_id = self.vocabulary[token] = len(self._postings_rows)
+                self._postings_rows.append(_GrowableArray(np.int64, capacity=4))
+                self._postings_tf.append(_GrowableArray(np.float32, capacity=4))
+            ids.append(term_id)
+
+        terms, counts = np.unique(np.asarray(ids, dtype=np.int64), return_counts=True)
+        for term_id, count in zip(terms, counts):
+            self._postings_rows[term_id].extend([row])
+            self._postings_tf[term_id].extend([count])
+
+        self._lengths.extend([len(ids)])
+        self._alive.extend([True])
+        self._keys.append(key)
+        self._rows_by_key[key] = row
+        self.total_length += len(ids)
+
+    def remove(self, key):
+        row = self._rows_by_key.pop(key, None)
+        if row is None:
+            return False
+        self._alive.view()[row] = False
+        self.total_length -= self._lengths.view()[row]
+
+        dead = len(self._keys) - len(self)
+        if self.compact_ratio is not None and dead >= self.compact_ratio * len(self._keys):
+            self.compact()
+        return True
+
+    def compact(self):
+        """Drop tombstoned rows from every postings list"""
+        alive = self._alive.view()
+        if alive.all():
+            return
+
+        new_rows = np.cumsum(alive) - 1
+        for term_id, rows in enumerate(self._postings_rows):
+            live = alive[rows.view()]
+            self._postings_rows[term_id] = _GrowableArray(np.int64, base=new_rows[rows.view()[live]])
+            self._postings_tf[term_id] = _GrowableArray(np.float32, base=self._postings_tf[term_id].view()[live])
+
+        self._lengths = _GrowableArray(np.float64, base=self._lengths.view()[alive].copy())
+        self._keys = [key for key, live in zip(self._keys, alive) if live]
+        self._alive = _GrowableArray(np.bool_, base=np.ones(len(self._keys), dtype=np.bool_))
+        self._rows_by_key = {key: row for row, key in enumerate(self._keys)}
+
+    def query_terms(self, query):
+        """Known query terms, capped to the ``max_query_terms`` rarest"""
+        term_ids = {self.vocabulary[token] for token in self.analyzer(query) if token in self.vocabulary}
+        term_ids = sorted(term_ids, key=lambda term_id: self._postings_rows[term_id].size)
+        return term_ids[:self.max_query_terms] if self.max_query_terms else term_ids
+
+    def search(self, query, top_k=None, min_score=0.0):
+        n_live = len(self)
+        if not n_live:
+            return []
+
+        alive = self._alive.view()
+        lengths = self._lengths.view()
+        average_length = self.total_length / n_live or 1.0
+
+        matched_rows = []
+        contributions = []
+        for term_id in self.query_terms(query):
+            rows = self._postings_rows[term_id].view()
+            live = alive[rows]
+            rows = rows[live]
+            if not len(rows):
+                continue
+            tf = self._postings_tf[term_id].view()[live]
+            idf = np.log(1.0 + (n_live - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / average_length)
+            matched_rows.append(rows)
+            contributions.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+
+        if not matched_rows:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        keep = scores >= min_score
+        rows, scores = rows[keep], scores[keep]
+        if top_k is not None and len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return [(self._keys[rows[i]], float(scores[i])) for i in order]
+
+
+class HybridRetriever(Retriever):
+    """Reciprocal-rank fusion over several retrievers
+
+    Each member returns its own top ``candidates``; a key scores
+    ``sum(weight / (rrf_k + rank))`` across members, scaled so a key ranked
+    first by every member scores 1.0. Rank-based scores say nothing about how
+    well a key matched, so ``min_score`` is applied to each member's own
+    scores before fusion: a key is returned if at least one member scores it
+    that high. Members are fed passages by their owner; the hybrid only searches.
+    """
+
+    name = 'hybrid'
+
+    def __init__(self, members, weights=None, rrf_k=60, candidates=50, member_min_score=1e-9):
+        self.members = list(members)
+        self.weights = list(weights) if weights else [1.0] * len(self.members)
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.member_min_score = member_min_score
+        self.name = 'hybrid(' + '+'.join(member.name for member in self.members) + ')'
+
+    def __len__(self):
+        return max((len(member) for member in self.members), default=0)
+
+    def add(self, key, text):
+        for member in self.members:
+            member.add(key, text)
+
+    def add_batch(self, items):
+        items = list(items)
+        for member in self.members:
+            member.add_batch(items)
+
+    def remove(self, key):
+        return any([member.remove(key) for member in self.members])
+
+    def clear(self):
+        for member in self.members:
+            member.clear()
+
+    def search(self, query, top_k=None, min_score=0.0):
+        fused, matched = {}, set()
+        for member, weight in zip(self.members, self.weights):
+            hits = member.search(query, top_k=self.candidates, min_score=self.member_min_score)
+            for rank, (key, score) in enumerate(hits, start=1):
+                fused[key] = fused.get(key, 0.0) + weight / (self.rrf_k + rank)
+                if score >= min_score:
+                    matched.add(key)
+
+        best_possible = sum(self.weights) / (self.rrf_k + 1)
+        hits = [(key, score / best_possible) for key, score in fused.items() if key in matched]
+        hits.sort(key=lambda hit: -hit[1])
+        return hits[:top_k] if top_k is not None else hits
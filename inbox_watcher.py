@@ -0,0 +1,260 @@
+import json
+import queue
+import threading
+import time
+
+from near_duplicates import email_text
+from response_cache import LRUCache
+
+
+class PubSubNotificationSource:
+    """Gmail push notifications from a Cloud Pub/Sub pull subscription
+
+    ``subscription`` is the full path, ``projects/<project>/subscriptions/<name>``,
+    of a subscription to the topic passed to ``users.watch``. Needs the
+    ``google-cloud-pubsub`` package.
+    """
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self._subscriber = None
+        self._future = None
+
+    def start(self, callback):
+        from google.cloud import pubsub_v1
+
+        def receive(message):
+            try:
+                callback(json.loads(message.data.decode('utf-8')))
+            finally:
+                message.ack()
+
+        self._subscriber = pubsub_v1.SubscriberClient()
+        self._future = self._subscriber.subscribe(self.subscription, callback=receive)
+
+    def stop(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._subscriber.close()
+            self._future = self._subscriber = None
+
+
+class InboxWatcher:
+    """Notice new mail within seconds and queue it for processing
+
+    A background thread keeps ``syncer`` (a ``GmailSync``) current and puts
+    the id of every newly arrived unread message on ``work_queue``. With a
+    ``topic`` the watcher registers ``users.watch`` (renewed daily; Gmail
+    drops it after seven days) and a notification from ``notifications``
+    (``start(callback)`` / ``stop()``) triggers an immediate sync. Polling
+    ``users.history.list`` stays on as the fallback: the interval doubles up
+    to ``max_interval`` while the mailbox is idle and, without notifications,
+    drops back to ``min_interval`` after a change, so a quiet inbox costs a
+    request every few minutes.
+
+    Mail already in the store on the first sync is not queued.
+    """
+
+    WATCH_RENEWAL = 24 * 3600
+
+    def __init__(self, syncer, work_queue=None, notifications=None, topic=None, min_interval=2.0,
+                 max_interval=120.0, label='UNREAD'):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Need 0 < min_interval <= max_interval")
+        self.syncer = syncer
+        self.queue = work_queue if work_queue is not None else queue.Queue()
+        self.notifications = notifications
+        self.topic = topic
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.label = label
+        self.interval = min_interval
+        self.stats = {'syncs': 0, 'notifications': 0, 'queued': 0, 'errors': 0}
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._watched_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stopping.clear()
+        if self.notifications is not None:
+            self.notifications.start(self._on_notification)
+        self._thread = threading.Thread(target=self._run, name='inbox-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wake.set()
+        if self.notifications is not None:
+            self.notifications.stop()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.topic and self._watched_at is not None:
+            try:
+                self.syncer.service.users().stop(userId=self.syncer.user_id).execute()
+            except Exception as e:
+                print(f"Error stopping Gmail watch: {e}")
+            self._watched_at = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _on_notification(self, data):
+        self.stats['notifications'] += 1
+        history_id = self.syncer.history_id
+        # Notifications can arrive late or twice; skip ones the store has already seen
+        if history_id is None or int(data.get('historyId', 0)) > int(history_id):
+            self._wake.set()
+
+    def _renew_watch(self):
+        if not self.topic or (self._watched_at is not None
+                              and time.monotonic() - self._watched_at < self.WATCH_RENEWAL):
+            return
+        self.syncer.service.users().watch(userId=self.syncer.user_id, body={
+            'topicName': self.topic,
+            'labelIds': [self.syncer.label],
+            'labelFilterAction': 'include'
+        }).execute()
+        self._watched_at = time.monotonic()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._renew_watch()
+                self.poll()
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.last_error = e
+                print(f"Inbox watcher error: {e}")
+                self.interval = self.max_interval
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """Sync once, queue new unread message ids and adapt the polling interval"""
+        first_sync = self.syncer.history_id is None
+        report = self.syncer.sync()
+        self.stats['syncs'] += 1
+        new_ids = [] if first_sync else [
+            message_id for message_id in report['added_ids']
+            if self.label in (self.syncer.store.get(message_id) or {}).get('labels', ())
+        ]
+        for message_id in new_ids:
+            self.queue.put(message_id)
+        self.stats['queued'] += len(new_ids)
+
+        # With push notifications a change does not predict more; keep backing off
+        changed = report['added'] or report['deleted'] or report['relabelled']
+        if changed and self.notifications is None:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return new_ids
+
+
+class AutoReplier:
+    """Drafts (and optionally sends) replies for message ids taken from a work queue
+
+    Runs on its own thread next to an ``InboxWatcher``. ``on_reply`` is called
+    with a result dict (email, reply, sent, error, latency) for every message.
+
+    With a ``near_duplicates`` index (see ``near_duplicates.email_index``)
+    a message in the same cluster as one already answered gets that reply
+    again rather than a new generation, and its result's ``reused_from``
+    names the message the reply was written for. Reuse is for drafts only:
+    with ``send=True`` every message gets its own generation, since a reply
+    written for one recipient must not go out verbatim to another.
+    """
+
+    def __init__(self, handler, agent, work_queue, user_profile=None, send=False, style="Professional",
+                 context_for=None, on_reply=None, near_duplicates=None, max_clusters=1024):
+        self.handler = handler
+        self.agent = agent
+        self.queue = work_queue
+        self.user_profile = user_profile or {}
+        self.send = send
+        self.style = style
+        self.context_for = context_for
+        self.on_reply = on_reply
+        self.near_duplicates = near_duplicates
+        # cluster id -> (message id, reply)
+        self._cluster_replies = LRUCache(max_clusters)
+        self.results = []
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='auto-replier', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                message_id = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.process(message_id)
+            finally:
+                self.queue.task_done()
+
+    def process(self, message_id):
+        start = time.perf_counter()
+        result = {'id': message_id, 'email': None, 'reply': None, 'sent': False, 'error': None, 'reused_from': None}
+        try:
+            email = self.handler.store.get(message_id)
+            if email is None:
+                raise ValueError(f"Message {message_id} is no longer in the inbox")
+            result['email'] = email
+            self.handler.load_body(email)
+            cluster = None
+            if self.near_duplicates is not None:
+                cluster = self.near_duplicates.add(message_id, email_text(email))
+            shared = self._cluster_replies.get(cluster) if cluster is not None and not self.send else None
+            if shared is not None:
+                result['reused_from'], result['reply'] = shared
+            else:
+                context = self.context_for(email) if self.context_for else ""
+                stream = self.agent.stream_reply(email=email, user_profile=self.user_profile, context=context,
+                                                 style=self.style)
+                result['reply'] = stream.text()
+                if stream.stats.get('error'):
+                    # Never send the fallback error text
+                    raise RuntimeError(stream.stats['error'])
+                if cluster is not None:
+                    self._cluster_replies.put(cluster, (message_id, result['reply']))
+            if self.send and getattr(self.handler, 'outbox', None) is not None:
+                self.handler.queue_reply(email, result['reply'])
+                self.handler.flush_outbox()
+                result['sent'] = self.handler.outbox.get(message_id)['status'] == 'sent'
+            elif self.send:
+                self.handler.send_reply(email, result['reply'])
+                result['sent'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency'] = time.perf_counter() - start
+        self.results.append(result)
+        if self.on_reply:
+            self.on_reply(result)
+        return result
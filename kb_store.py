@@ -0,0 +1,379 @@
+import json
+import mmap
+import os
+import re
+import sys
+from datetime import datetime
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+LOG_FILE = 'documents.log'
+CONTENT_FILE = 'content.bin'
+VOCABULARY_FILE = 'vocabulary.txt'
+INDICES_FILE = 'indices.bin'
+DATA_FILE = 'data.bin'
+INDPTR_FILE = 'indptr.bin'
+LEGACY_FILE = 'documents.json'
+SIGNATURES_FILE = 'signatures.bin'
+# Rewritten as a whole by compaction; the manifest names the generation in use
+GENERATION_FILES = (LOG_FILE, CONTENT_FILE, VOCABULARY_FILE, INDICES_FILE, DATA_FILE, INDPTR_FILE)
+GENERATION_PATTERN = re.compile(r'^(documents|content|vocabulary|indices|data|indptr)(?:\.(\d+))?\.(log|bin|txt)$')
+
+INDICES_DTYPE = np.dtype('<i4')
+DATA_DTYPE = np.dtype('<f4')
+INDPTR_DTYPE = np.dtype('<i8')
+
+# Lone surrogates survive PDF extraction, so keep them round-trippable
+TEXT_ERRORS = 'surrogatepass'
+
+
+def encode_with_spans(text, spans):
+    """UTF-8 encode ``text`` and convert character spans into byte spans"""
+    data = text.encode('utf-8', TEXT_ERRORS)
+    if len(data) == len(text):
+        return data, [(start, end) for start, end in spans]
+
+    codepoints = np.frombuffer(text.encode('utf-32-le', TEXT_ERRORS), dtype='<u4')
+    widths = 1 + (codepoints >= 0x80) + (codepoints >= 0x800) + (codepoints >= 0x10000)
+    offsets = np.concatenate(([0], np.cumsum(widths)))
+    return data, [(int(offsets[start]), int(offsets[end])) for start, end in spans]
+
+
+class KnowledgeBaseStore:
+    """Append-only on-disk layout for the knowledge base
+
+    manifest.json    format version and chunking parameters
+    documents.log    one JSON line per document add/remove, replayed on load
+    content.bin      UTF-8 document bodies, read through mmap
+    vocabulary.txt   index terms, one per line in term-id order
+    indices.bin, data.bin, indptr.bin
+                     passage term-count rows as raw little-endian CSR arrays,
+                     loaded with ``np.memmap``
+    signatures.bin   near-duplicate MinHash signatures, ``(id, uint32[n])``
+                     records; a cache that may hold removed ids
+
+    Adding a document only appends to these files. The log line is written
+    last, so a partially written add is trimmed away on the next load.
+    Compaction writes the other files as a new generation (``content.2.bin``
+    and so on) and switches to it with one atomic manifest replace, so a
+    crash at any point leaves either the old or the new generation whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest = None
+        self.generation = 0
+        self._content_map = None
+        self._content_file = None
+
+    def _file(self, name, generation=None):
+        """Path of ``name``; data files get the (current) generation number, except generation 0"""
+        if name in GENERATION_FILES:
+            generation = self.generation if generation is None else generation
+            if generation:
+                stem, ext = os.path.splitext(name)
+                name = f"{stem}.{generation}{ext}"
+        return os.path.join(self.path, name)
+
+    def _remove_other_generations(self):
+        """Delete data files of generations the manifest does not point at"""
+        for name in os.listdir(self.path):
+            match = GENERATION_PATTERN.match(name)
+            if match and int(match.group(2) or 0) != self.generation:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Still mapped (Windows); the next load tries again
+                    pass
+
+    def exists(self):
+        return os.path.exists(self._file(MANIFEST_FILE))
+
+    def has_legacy_json(self):
+        return os.path.exists(self._file(LEGACY_FILE))
+
+    def create(self, passage_words, overlap_words, stop_words):
+        """Start an empty store, discarding any previous files"""
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+        self.generation = 0
+        self._remove_other_generations()
+        for name in (LOG_FILE, CONTENT_FILE, VOCABULARY_FILE, INDICES_FILE, DATA_FILE, SIGNATURES_FILE):
+            open(self._file(name), 'wb').close()
+        with open(self._file(INDPTR_FILE), 'wb') as f:
+            f.write(np.zeros(1, dtype=INDPTR_DTYPE).tobytes())
+        self._write_manifest({
+            'version': FORMAT_VERSION,
+            'passage_words': passage_words,
+            'overlap_words': overlap_words,
+            'stop_words': stop_words,
+            'generation': 0,
+            'created_at': datetime.now().isoformat()
+        })
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._file(MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file(MANIFEST_FILE))
+        self.manifest = manifest
+        self.generation = manifest.get('generation', 0)
+
+    def load(self):
+        """Replay the log and map the row arrays
+
+        Returns ``(documents, terms, indices, data, indptr, row_keys, row_alive)``
+        where the arrays are read-only memory maps of the on-disk rows.
+        """
+        with open(self._file(MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported knowledge base format: {self.manifest.get('version')}")
+        self.generation = self.manifest.get('generation', 0)
+        # Left behind by a compaction that crashed before or after switching generations
+        self._remove_other_generations()
+
+        documents = {}
+        row_keys = []
+        row_alive = []
+        rows_by_doc = {}
+        content_end = 0
+        with open(self._file(LOG_FILE), 'rb') as f:
+            log_end = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                record = json.loads(line)
+                if record.pop('op') == 'add':
+                    first_row = len(row_keys)
+                    row_keys.extend((record['id'], n) for n in range(len(record['passages'])))
+                    row_alive.extend([True] * len(record['passages']))
+                    rows_by_doc[record['id']] = range(first_row, len(row_keys))
+                    documents[record['id']] = record
+                    content_end = record['content_offset'] + record['content_length']
+                else:
+                    for row in rows_by_doc.pop(record['id'], ()):
+                        row_alive[row] = False
+                    documents.pop(record['id'], None)
+                log_end += len(line)
+
+        # Drop anything written after the last complete log record
+        n_rows = len(row_keys)
+        self._truncate(LOG_FILE, log_end)
+        self._truncate(CONTENT_FILE, content_end)
+        self._truncate(INDPTR_FILE, (n_rows + 1) * INDPTR_DTYPE.itemsize)
+        indptr = self._map(INDPTR_FILE, INDPTR_DTYPE)
+        nnz = int(indptr[n_rows])
+        self._truncate(INDICES_FILE, nnz * INDICES_DTYPE.itemsize)
+        self._truncate(DATA_FILE, nnz * DATA_DTYPE.itemsize)
+
+        with open(self._file(VOCABULARY_FILE), 'rb+') as f:
+            raw = f.read()
+            complete = raw.rfind(b'\n') + 1
+            if complete != len(raw):
+                f.truncate(complete)
+        terms = raw[:complete].decode('utf-8').split('\n')[:-1]
+
+        return (
+            list(documents.values()),
+            terms,
+            self._map(INDICES_FILE, INDICES_DTYPE),
+            self._map(DATA_FILE, DATA_DTYPE),
+            indptr,
+            row_keys,
+            np.array(row_alive, dtype=np.bool_)
+        )
+
+    def _truncate(self, name, size):
+        if os.path.getsize(self._file(name)) > size:
+            os.truncate(self._file(name), size)
+
+    def _map(self, name, dtype):
+        size = os.path.getsize(self._file(name)) // dtype.itemsize
+        if not size:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=(size,))
+
+    def append_document(self, record, content, rows, new_terms):
+        """Append one document's content, passage rows and log record
+
+        ``record`` is updated in place with its content offset and length.
+        ``rows`` is a list of ``(term_ids, counts)`` pairs, one per passage.
+        """
+        self.append_documents([(record, content, rows)], new_terms)
+
+    def append_documents(self, items, new_terms):
+        """Append several ``(record, content, rows)`` documents with one write per file
+
+        The log records go last in a single write, so after a crash the load
+        keeps the documents whose log line made it and trims the rest.
+        """
+        with open(self._file(CONTENT_FILE), 'ab') as f:
+            for record, content, _ in items:
+                record['content_offset'] = f.tell()
+                record['content_length'] = len(content)
+                f.write(content)
+
+        if new_terms:
+            with open(self._file(VOCABULARY_FILE), 'ab') as f:
+                f.write(''.join(term + '\n' for term in new_terms).encode('utf-8'))
+
+        rows = [row for _, _, document_rows in items for row in document_rows]
+        with open(self._file(INDICES_FILE), 'ab') as f:
+            nnz = f.tell() // INDICES_DTYPE.itemsize
+            for terms, _ in rows:
+                f.write(np.asarray(terms, dtype=INDICES_DTYPE).tobytes())
+        with open(self._file(DATA_FILE), 'ab') as f:
+            for _, counts in rows:
+                f.write(np.asarray(counts, dtype=DATA_DTYPE).tobytes())
+        with open(self._file(INDPTR_FILE), 'ab') as f:
+            ends = nnz + np.cumsum([len(terms) for terms, _ in rows], dtype=np.int64)
+            f.write(ends.astype(INDPTR_DTYPE).tobytes())
+
+        with open(self._file(LOG_FILE), 'ab') as f:
+            f.write(b''.join(json.dumps(dict(record, op='add')).encode('utf-8') + b'\n' for record, _, _ in items))
+
+    def append_removal(self, doc_id):
+        self._append_log({'op': 'remove', 'id': doc_id})
+
+    def _append_log(self, record):
+        with open(self._file(LOG_FILE), 'ab') as f:
+            f.write(json.dumps(record).encode('utf-8') + b'\n')
+
+    def read_span(self, record, start=0, end=None):
+        """Decode a byte span of a document's content"""
+        length = record['content_length']
+        end = length if end is None else end
+        offset = record['content_offset']
+        content_map = self._content(offset + end)
+        return content_map[offset + start:offset + end].decode('utf-8', TEXT_ERRORS)
+
+    def read_content(self, record):
+        return self.read_span(record)
+
+    def _content(self, needed):
+        """Map content.bin, remapping when appends went past the current mapping"""
+        if self._content_map is None or len(self._content_map) < needed:
+            self.close()
+            self._content_file = open(self._file(CONTENT_FILE), 'rb')
+            self._content_map = mmap.mmap(self._content_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._content_map
+
+    def close(self):
+        if self._content_map is not None:
+            self._content_map.close()
+            self._content_file.close()
+        self._content_map = None
+        self._content_file = None
+
+    def rewrite(self, documents, terms, indices, data, indptr):
+        """Write a compacted copy of the store as the next generation and switch to it
+
+        ``documents`` are the live records in row order; their content is
+        copied into a fresh content file. Records get their new offsets only
+        once the switch has happened. Until the manifest is replaced the
+        current generation is untouched and stays authoritative.
+        """
+        contents = [self.read_content(record).encode('utf-8', TEXT_ERRORS) for record in documents]
+        self.close()
+        generation = self.generation + 1
+
+        def write(name, chunks):
+            with open(self._file(name, generation), 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+        offsets = np.concatenate(([0], np.cumsum([len(content) for content in contents], dtype=np.int64)))
+        write(CONTENT_FILE, contents)
+        write(LOG_FILE, [
+            json.dumps(dict(record, op='add', content_offset=int(offset), content_length=len(content)))
+            .encode('utf-8') + b'\n'
+            for record, content, offset in zip(documents, contents, offsets)
+        ])
+        write(VOCABULARY_FILE, [''.join(term + '\n' for term in terms).encode('utf-8')])
+        for name, array, dtype in (
+            (INDICES_FILE, indices, INDICES_DTYPE),
+            (DATA_FILE, data, DATA_DTYPE),
+            (INDPTR_FILE, indptr, INDPTR_DTYPE)
+        ):
+            write(name, [np.asarray(array, dtype=dtype).tobytes()])
+
+        self._write_manifest(dict(self.manifest, generation=generation))
+        for record, content, offset in zip(documents, contents, offsets):
+            record['content_offset'] = int(offset)
+            record['content_length'] = len(content)
+        self._remove_other_generations()
+
+    @staticmethod
+    def _signature_dtype(num_perm):
+        return np.dtype([('id', 'S32'), ('signature', '<u4', (num_perm,))])
+
+    def load_signatures(self, num_perm):
+        """Stored ``(ids, signatures)``; a torn last record is ignored, a later one for the same id wins"""
+        dtype = self._signature_dtype(num_perm)
+        path = self._file(SIGNATURES_FILE)
+        if not os.path.exists(path):
+            return [], np.zeros((0, num_perm), dtype=np.uint32)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        records = np.frombuffer(raw[:len(raw) - len(raw) % dtype.itemsize], dtype=dtype)
+        return [doc_id.decode('ascii') for doc_id in records['id']], records['signature']
+
+    def _signature_records(self, items):
+        if not items:
+            return b''
+        return np.array([(doc_id.encode('ascii'), signature) for doc_id, signature in items],
+                        dtype=self._signature_dtype(len(items[0][1]))).tobytes()
+
+    def append_signatures(self, items):
+        """Append ``(doc_id, signature)`` pairs"""
+        if items:
+            with open(self._file(SIGNATURES_FILE), 'ab') as f:
+                f.write(self._signature_records(items))
+
+    def rewrite_signatures(self, items):
+        """Atomically replace the signature file with ``(doc_id, signature)`` pairs"""
+        tmp_path = self._file(SIGNATURES_FILE + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(self._signature_records(items))
+        os.replace(tmp_path, self._file(SIGNATURES_FILE))
+
+    def load_legacy_json(self):
+        """Documents from the pre-binary ``documents.json`` file"""
+        with open(self._file(LEGACY_FILE), 'r') as f:
+            return json.load(f)
+
+    def retire_legacy_json(self):
+        os.replace(self._file(LEGACY_FILE), self._file(LEGACY_FILE + '.migrated'))
+
+
+def migrate_json_store(storage_path="knowledge_base"):
+    """One-shot conversion of ``documents.json`` into the binary store"""
+    from rag_system import RAGSystem
+
+    store = KnowledgeBaseStore(storage_path)
+    if not store.has_legacy_json():
+        print(f"No {LEGACY_FILE} found in {storage_path}")
+        return 0
+    if store.exists():
+        print(f"{storage_path} already uses the binary format; remove {MANIFEST_FILE} to migrate again")
+        return 0
+
+    rag = RAGSystem(storage_path)
+    migrated = len(rag.documents)
+    print(f"Migrated {migrated} documents into {storage_path}")
+    return migrated
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python kb_store.py migrate [storage_path]")
+        sys.exit(1)
+    migrate_json_store(*sys.argv[2:3])
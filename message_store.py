@@ -0,0 +1,239 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from gmail_sync import MessageStore
+
+FTS_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+COLUMNS = ('id', 'thread_id', 'sender', 'to_addr', 'subject', 'date', 'internal_date', 'snippet', 'body',
+           'message_id', 'history_id', 'labels')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    sender TEXT,
+    to_addr TEXT,
+    subject TEXT,
+    date TEXT,
+    internal_date INTEGER,
+    snippet TEXT,
+    body TEXT,
+    message_id TEXT,
+    history_id TEXT,
+    labels TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_thread ON messages (thread_id, internal_date);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (internal_date);
+CREATE TABLE IF NOT EXISTS message_labels (
+    label TEXT,
+    message_id TEXT,
+    PRIMARY KEY (label, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS message_labels_message ON message_labels (message_id);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# External-content FTS index kept in step with ``messages`` by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, body, content='messages', content_rowid='rowid', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, subject, sender, body)
+    VALUES (new.rowid, new.subject, new.sender, coalesce(new.body, new.snippet));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, coalesce(old.body, old.snippet));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF subject, sender, body, snippet ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, coalesce(old.body, old.snippet));
+    INSERT INTO messages_fts (rowid, subject, sender, body)
+    VALUES (new.rowid, new.subject, new.sender, coalesce(new.body, new.snippet));
+END;
+"""
+
+
+def fts_query(text, match_all=True):
+    """Turn free text into an FTS5 query over its words, ignoring FTS syntax"""
+    return (" " if match_all else " OR ").join(f'"{token}"' for token in FTS_TOKEN.findall(text))
+
+
+class SQLiteMessageStore(MessageStore):
+    """Persistent MessageStore in one SQLite file with a full-text index
+
+    Messages are indexed by thread and date, labels live in their own table
+    so ``list(label=...)`` is an indexed lookup, and subject, sender and
+    body (the snippet until the body is loaded) are searchable through FTS5.
+    Bodies are kept across upserts that do not carry one, so syncing headers
+    never discards a downloaded body.
+    """
+
+    def __init__(self, path=os.path.join('mail_store', 'messages.sqlite')):
+        self.path = path
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+            try:
+                self._db.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5; search falls back to LIKE scans
+                self.has_fts = False
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _to_email(row):
+        email = {
+            'id': row['id'],
+            'threadId': row['thread_id'],
+            'sender': row['sender'],
+            'to': row['to_addr'],
+            'subject': row['subject'],
+            'date': row['date'],
+            'message_id': row['message_id'],
+            'snippet': row['snippet'],
+            'labels': json.loads(row['labels']),
+            'history_id': row['history_id'],
+            'internal_date': row['internal_date']
+        }
+        if row['body'] is not None:
+            email['body'] = row['body']
+        return email
+
+    def _select(self, where="", params=(), suffix=""):
+        with self._lock:
+            rows = self._db.execute(f"SELECT m.* FROM messages m {where} {suffix}", params).fetchall()
+        return [self._to_email(row) for row in rows]
+
+    def get_state(self, key, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, key, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def ids(self):
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT id FROM messages")}
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def get(self, message_id):
+        emails = self._select("WHERE m.id = ?", (message_id,))
+        return emails[0] if emails else None
+
+    def upsert(self, emails):
+        rows = [(
+            email['id'], email.get('threadId'), email.get('sender', ''), email.get('to', ''),
+            email.get('subject', ''), email.get('date', ''), email.get('internal_date', 0), email.get('snippet', ''),
+            email.get('body'), email.get('message_id', ''), email.get('history_id'),
+            json.dumps(email.get('labels', []))
+        ) for email in emails]
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT INTO messages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                "ON CONFLICT (id) DO UPDATE SET thread_id = excluded.thread_id, sender = excluded.sender, "
+                "to_addr = excluded.to_addr, subject = excluded.subject, date = excluded.date, "
+                "internal_date = excluded.internal_date, snippet = excluded.snippet, "
+                "body = coalesce(excluded.body, messages.body), message_id = excluded.message_id, "
+                "history_id = excluded.history_id, labels = excluded.labels", rows
+            )
+            self._write_labels(self._db, [(email['id'], email.get('labels', [])) for email in emails])
+
+    @staticmethod
+    def _write_labels(db, labels_by_id):
+        db.executemany("DELETE FROM message_labels WHERE message_id = ?",
+                       [(message_id,) for message_id, _ in labels_by_id])
+        db.executemany(
+            "INSERT INTO message_labels (label, message_id) VALUES (?, ?)",
+            [(label, message_id) for message_id, labels in labels_by_id for label in labels]
+        )
+
+    def delete(self, message_ids):
+        params = [(message_id,) for message_id in message_ids]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM messages WHERE id = ?", params)
+            self._db.executemany("DELETE FROM message_labels WHERE message_id = ?", params)
+
+    def set_labels(self, message_id, labels):
+        with self._lock, self._db:
+            if self._db.execute("UPDATE messages SET labels = ? WHERE id = ?",
+                                (json.dumps(list(labels)), message_id)).rowcount:
+                self._write_labels(self._db, [(message_id, labels)])
+
+    def list(self, label=None, limit=None):
+        if label is None:
+            return self._select(suffix="ORDER BY m.internal_date DESC LIMIT ?", params=(limit or -1,))
+        # Walk the date index newest first and stop at ``limit``, rather than sorting every labelled message
+        return self._select(
+            "WHERE EXISTS (SELECT 1 FROM message_labels l WHERE l.label = ? AND l.message_id = m.id)",
+            (label, limit or -1), "ORDER BY m.internal_date DESC LIMIT ?"
+        )
+
+    def thread(self, thread_id):
+        """Every stored message of a thread, oldest first"""
+        return self._select("WHERE m.thread_id = ?", (thread_id,), "ORDER BY m.internal_date")
+
+    def search(self, text, limit=20, label=None, match_all=True):
+        """Emails matching every word of ``text`` (any word with ``match_all=False``), best match first"""
+        query = fts_query(text, match_all)
+        if not query:
+            return []
+        label_join = "JOIN message_labels l ON l.message_id = m.id AND l.label = ?" if label else ""
+        label_params = (label,) if label else ()
+        if self.has_fts:
+            return self._select(
+                f"JOIN messages_fts f ON f.rowid = m.rowid {label_join} WHERE messages_fts MATCH ?",
+                label_params + (query, limit), "ORDER BY f.rank LIMIT ?"
+            )
+
+        words = FTS_TOKEN.findall(text)
+        where = (" AND " if match_all else " OR ").join(
+            "(m.subject || ' ' || m.sender || ' ' || coalesce(m.body, m.snippet)) LIKE ?" for _ in words
+        )
+        params = label_params + tuple(f"%{word}%" for word in words) + (limit,)
+        return self._select(f"{label_join} WHERE {where}", params, "ORDER BY m.internal_date DESC LIMIT ?")
+
+    def related_passages(self, email, limit=3, max_chars=500):
+        """Earlier mail from the same thread or on the same subject, as RAG-style passages
+
+        Thread messages score 1.0 and subject matches 0.5, so a prompt budget
+        keeps the thread first.
+        """
+        related = [message for message in self.thread(email.get('threadId')) if message['id'] != email['id']]
+        similarity = {message['id']: 1.0 for message in related}
+        subject = re.sub(r'^((re|fwd?):\s*)+', '', email.get('subject', ''), flags=re.IGNORECASE)
+        if len(related) < limit and subject:
+            seen = {message['id'] for message in related} | {email['id']}
+            matches = self.search(subject, limit=limit + len(seen), match_all=False)
+            related += [message for message in matches if message['id'] not in seen]
+
+        return [{
+            'doc_id': message['id'],
+            'title': message['subject'],
+            'sender': message['sender'],
+            'content': (message.get('body') or message['snippet'])[:max_chars],
+            'similarity': similarity.get(message['id'], 0.5)
+        } for message in related[:limit]]
+
+    def related_context(self, email, limit=3, max_chars=500):
+        """Earlier mail from the same thread or on the same subject, formatted as reply context"""
+        return "\n\n".join(f"From '{passage['title']}' ({passage['sender']}):\n{passage['content']}"
+                           for passage in self.related_passages(email, limit, max_chars))
@@ -0,0 +1,214 @@
+import base64
+import codecs
+import html
+import re
+
+CHARSET_PATTERN = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+HIDDEN_PATTERN = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+BREAK_PATTERN = re.compile(r'<(br|/p|/div|/tr|/li|/h[1-6])\b[^>]*>', re.IGNORECASE)
+
+# Labels that mail clients routinely put on text in a wider encoding
+CHARSET_ALIASES = {
+    'us-ascii': 'utf-8',
+    'ascii': 'utf-8',
+    'iso-8859-1': 'windows-1252',
+    'latin1': 'windows-1252',
+    'unknown-8bit': 'utf-8',
+    'x-unknown': 'utf-8'
+}
+
+# Base64 characters decoded per step when saving an attachment (a multiple of 4)
+CHUNK_CHARS = 1 << 20
+
+
+def b64url_decode(data):
+    """Decode base64url bytes or text, tolerating missing padding"""
+    return base64.urlsafe_b64decode(data + ('=' if isinstance(data, str) else b'=') * (-len(data) % 4))
+
+
+def iter_b64url_decode(data, chunk_chars=None):
+    """Yield the decoded bytes of base64url ``data`` a chunk at a time
+
+    Only one ``chunk_chars`` (default ``CHUNK_CHARS``) slice and its decoded
+    bytes exist at once, so a large attachment is never held decoded in full.
+    """
+    chunk_chars = chunk_chars or CHUNK_CHARS
+    for start in range(0, len(data), chunk_chars):
+        yield b64url_decode(data[start:start + chunk_chars])
+
+
+def header(part, name):
+    """Value of the first ``name`` header of a payload part, or None"""
+    name = name.lower()
+    for item in part.get('headers', ()):
+        if item['name'].lower() == name:
+            return item['value']
+    return None
+
+
+def content_charset(part, default='utf-8'):
+    match = CHARSET_PATTERN.search(header(part, 'Content-Type') or '')
+    return match.group(1).lower() if match else default
+
+
+def decode_text(data, charset='utf-8'):
+    """Decode body bytes in their declared charset, falling back to UTF-8"""
+    charset = CHARSET_ALIASES.get(charset, charset)
+    try:
+        codec = codecs.lookup(charset).name
+    except LookupError:
+        codec = 'utf-8'
+    try:
+        return data.decode(codec)
+    except UnicodeDecodeError:
+        # Mislabelled mail is most often UTF-8; otherwise keep what decodes
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data.decode(codec, errors='replace')
+
+
+def html_to_text(markup):
+    """Readable text of an HTML body: tags dropped, block ends kept as line breaks"""
+    markup = BREAK_PATTERN.sub('\n', HIDDEN_PATTERN.sub('', markup))
+    text = html.unescape(TAG_PATTERN.sub(' ', markup))
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+
+def is_attachment(part):
+    disposition = (header(part, 'Content-Disposition') or '').lstrip().lower()
+    return bool(part.get('filename')) or disposition.startswith('attachment')
+
+
+def iter_parts(payload):
+    """Yield the leaf parts of a payload tree in document order, without recursion"""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+class MimeMessage:
+    """Lazy view of a Gmail ``format='full'`` message
+
+    The part tree is walked once, iteratively, to find the first plain-text
+    and HTML bodies and the attachments at any depth (nested
+    ``multipart/mixed`` > ``multipart/alternative`` > ``multipart/related``
+    and so on). Nothing is decoded until ``text``, ``html`` or ``body`` is
+    read, and then only that part, in the charset it declares.
+
+    Gmail leaves attachments and very large bodies out of the payload and
+    serves them by ``attachmentId``; those are fetched with
+    ``users.messages.attachments.get`` on demand when ``service`` is given,
+    and treated as missing otherwise.
+    """
+
+    def __init__(self, message, service=None, user_id='me'):
+        self.id = message.get('id')
+        self.payload = message.get('payload', {})
+        self.service = service
+        self.user_id = user_id
+        self.text_part = None
+        self.html_part = None
+        self.attachment_parts = []
+        self._decoded = {}
+        for part in iter_parts(self.payload):
+            mime_type = part.get('mimeType', '').lower()
+            if is_attachment(part):
+                self.attachment_parts.append(part)
+            elif mime_type == 'text/plain' and self.text_part is None:
+                self.text_part = part
+            elif mime_type == 'text/html' and self.html_part is None:
+                self.html_part = part
+            elif not mime_type.startswith(('text/', 'multipart/')):
+                # Inline images and other non-text leaves
+                self.attachment_parts.append(part)
+
+    def _fetch(self, attachment_id):
+        if self.service is None:
+            return None
+        return self.service.users().messages().attachments().get(
+            userId=self.user_id, messageId=self.id, id=attachment_id
+        ).execute().get('data', '')
+
+    def part_data(self, part):
+        """Encoded body of a part, fetched if Gmail stored it separately; None if unavailable"""
+        body = part.get('body', {})
+        if 'data' in body:
+            return body['data']
+        if 'attachmentId' in body:
+            return self._fetch(body['attachmentId'])
+        return ''
+
+    def part_bytes(self, part):
+        data = self.part_data(part)
+        return b64url_decode(data) if data is not None else None
+
+    def part_text(self, part):
+        if part is None:
+            return None
+        key = part.get('partId', id(part))
+        if key not in self._decoded:
+            data = self.part_bytes(part)
+            self._decoded[key] = decode_text(data, content_charset(part)) if data is not None else None
+        return self._decoded[key]
+
+    @property
+    def text(self):
+        return self.part_text(self.text_part)
+
+    @property
+    def html(self):
+        return self.part_text(self.html_part)
+
+    def body(self):
+        """Plain-text body, falling back to the HTML body as text; None if there is neither"""
+        text = self.text
+        if text is not None:
+            return text
+        markup = self.html
+        return html_to_text(markup) if markup is not None else None
+
+    @property
+    def attachments(self):
+        """Attachment metadata; nothing is downloaded"""
+        return [{
+            'part_id': part.get('partId'),
+            'filename': part.get('filename', ''),
+            'mime_type': part.get('mimeType', ''),
+            'size': part.get('body', {}).get('size', 0),
+            'attachment_id': part.get('body', {}).get('attachmentId')
+        } for part in self.attachment_parts]
+
+    def _attachment_part(self, part_id):
+        for part in self.attachment_parts:
+            if part.get('partId') == part_id:
+                return part
+        raise ValueError(f"No attachment with part id {part_id!r}")
+
+    def attachment_bytes(self, part_id):
+        """Decoded content of one attachment, fetched on demand"""
+        data = self.part_bytes(self._attachment_part(part_id))
+        if data is None:
+            raise ValueError("Attachment is stored separately; pass service= to fetch it")
+        return data
+
+    def save_attachment(self, part_id, path):
+        """Write one attachment to ``path``, decoding in chunks; returns the bytes written
+
+        ``attachments.get`` returns the encoded payload as one JSON field, so
+        that string is held while saving; the decoded bytes never are.
+        """
+        data = self.part_data(self._attachment_part(part_id))
+        if data is None:
+            raise ValueError("Attachment is stored separately; pass service= to fetch it")
+        written = 0
+        with open(path, 'wb') as f:
+            for chunk in iter_b64url_decode(data):
+                written += f.write(chunk)
+        return written
@@ -0,0 +1,188 @@
+import threading
+import time
+
+from ollama_client import OllamaError
+
+# Models the agent is tuned for, with their approximate download size
+SUPPORTED_MODELS = {
+    "llama2:7b": {"name": "Llama 2 7B", "size": "3.8GB", "description": "General purpose chat model"},
+    "llama3:8b": {"name": "Llama 3 8B", "size": "4.7GB", "description": "Stronger general purpose chat model"},
+    "mistral": {"name": "Mistral 7B", "size": "4.1GB", "description": "Fast, good at following instructions"},
+    "phi3:mini": {"name": "Phi-3 Mini", "size": "2.3GB", "description": "Small model for low-memory machines"},
+    "gemma:2b": {"name": "Gemma 2B", "size": "1.7GB", "description": "Smallest and fastest option"}
+}
+
+
+class PullJob:
+    """Progress of one ``/api/pull``, updated from the pulling thread"""
+
+    def __init__(self, model):
+        self.model = model
+        self.status = "queued"
+        self.completed = 0
+        self.total = 0
+        self.error = None
+        self.done = threading.Event()
+        self.started_at = time.time()
+
+    @property
+    def progress(self):
+        """Fraction of the current layer downloaded, or None when unknown"""
+        return self.completed / self.total if self.total else None
+
+    @property
+    def succeeded(self):
+        return self.done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def as_dict(self):
+        return {
+            'model': self.model,
+            'status': self.status,
+            'completed': self.completed,
+            'total': self.total,
+            'progress': self.progress,
+            'error': self.error,
+            'done': self.done.is_set()
+        }
+
+
+class ModelRegistry:
+    """Cached view of the models installed on an Ollama server
+
+    ``/api/tags`` is fetched at most once per ``ttl`` seconds; a failed fetch
+    is remembered for ``error_ttl`` seconds so an unreachable server is not
+    probed on every call. Nothing touches the network until first asked, and
+    missing models are pulled on a background thread with progress from the
+    streamed ``/api/pull`` response.
+    """
+
+    def __init__(self, client, ttl=30, error_ttl=5, timeout=10, pull_timeout=120):
+        self.client = client
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self.pull_timeout = pull_timeout
+        self._lock = threading.Lock()
+        self._models = None
+        self._error = None
+        self._fetched_at = 0.0
+        self._pulls = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = 0.0
+
+    def _fresh(self):
+        age = time.monotonic() - self._fetched_at
+        return self._fetched_at and age < (self.ttl if self._error is None else self.error_ttl)
+
+    def models(self, refresh=False):
+        """Installed model records; raises the fetch error if the server is unreachable"""
+        with self._lock:
+            if refresh or not self._fresh():
+                try:
+                    self._models = self.client.tags(timeout=self.timeout)
+                    self._error = None
+                except Exception as e:
+                    self._error = e
+                self._fetched_at = time.monotonic()
+            if self._error is not None:
+                raise self._error
+            return list(self._models)
+
+    def names(self):
+        try:
+            return [model['name'] for model in self.models()]
+        except Exception:
+            return []
+
+    def info(self, name):
+        """Record of an installed model, or None"""
+        return next((model for model in self.models() if model['name'] == name), None)
+
+    def has(self, name):
+        try:
+            return self.info(name) is not None
+        except Exception:
+            return False
+
+    def is_reachable(self):
+        try:
+            self.models()
+            return True
+        except Exception:
+            return False
+
+    def pull_job(self, name):
+        """Latest PullJob for ``name``, or None if it was never pulled"""
+        return self._pulls.get(name)
+
+    def pull(self, name, on_progress=None, job=None):
+        """Pull ``name`` in the calling thread, reporting each progress line
+
+        Returns the finished PullJob; failures are recorded on it, not raised.
+        """
+        job = job or PullJob(name)
+        try:
+            for chunk in self.client.stream('/api/pull', {"name": name}, timeout=self.pull_timeout):
+                job.status = chunk.get('status', job.status)
+                if 'total' in chunk:
+                    job.total = chunk['total']
+                    job.completed = chunk.get('completed', 0)
+                if on_progress:
+                    on_progress(job)
+            if job.status != 'success':
+                job.error = f"Pull ended with status: {job.status}"
+        except OllamaError as e:
+            job.error = e.text
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            self.invalidate()
+            job.done.set()
+            if on_progress:
+                on_progress(job)
+        return job
+
+    def pull_in_background(self, name, on_progress=None):
+        """Start pulling ``name`` on a daemon thread; a pull already running is reused"""
+        with self._lock:
+            job = self._pulls.get(name)
+            if job is not None and not job.done.is_set():
+                return job
+            job = self._pulls[name] = PullJob(name)
+        threading.Thread(target=self.pull, args=(name, on_progress, job), daemon=True).start()
+        return job
+
+    def ensure(self, name, on_progress=None):
+        """Pull ``name`` in the background if the server does not have it
+
+        Returns immediately. The check itself runs on the background thread, so
+        callers never wait on the network; the returned job reports
+        ``status='installed'`` when no pull was needed.
+        """
+        with self._lock:
+            job = self._pulls.get(name)
+            if job is not None and not job.done.is_set():
+                return job
+            job = self._pulls[name] = PullJob(name)
+
+        def check_then_pull():
+            job.status = "checking"
+            try:
+                installed = self.info(name) is not None
+            except Exception as e:
+                job.error = str(e)
+                job.done.set()
+                return
+            if installed:
+                job.status = "installed"
+                job.done.set()
+            else:
+                self.pull(name, on_progress, job)
+
+        threading.Thread(target=check_then_pull, daemon=True).start()
+        return job
@@ -0,0 +1,230 @@
+import re
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from gmail_fetcher import email_body
+from prompt_budget import strip_quoted
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+DIGITS = re.compile(r"\d+")
+HASH_SHIFT = np.uint64(32)
+GRAM_MULTIPLIER = np.uint64(1000003)
+# Shingles hashed per step of NearDuplicateIndex.signature: bounds its scratch array to
+# num_perm * SIGNATURE_CHUNK uint64s (4 MB at the default 128 permutations)
+SIGNATURE_CHUNK = 4096
+
+
+def shingles(text, size=5, mask_digits=False):
+    """Hashes of the word ``size``-grams of ``text``, case-folded; repeated grams repeat
+
+    Splitting on words makes layout (PDF vs. DOCX line breaks) irrelevant.
+    ``mask_digits`` makes notification mail that differs only in order
+    numbers, dates or amounts hash alike.
+    """
+    text = text.lower()
+    if mask_digits:
+        text = DIGITS.sub("0", text)
+    words = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in WORD_PATTERN.findall(text)),
+                        dtype=np.uint64)
+    size = max(1, min(size, len(words)))
+    # Polynomial combination of each window's word hashes; uint64 arithmetic wraps
+    grams = np.zeros(len(words) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        grams = grams * GRAM_MULTIPLIER + words[offset:len(grams) + offset]
+    return grams
+
+
+def email_text(email):
+    """Sender, subject and the new part of the body: the text that decides how an email is handled"""
+    return f"{email.get('sender', '')}\n{email.get('subject', '')}\n{strip_quoted(email_body(email))}"
+
+
+def email_index(threshold=0.85, **options):
+    """Index for incoming mail; digits are masked so notifications differing only in numbers cluster"""
+    return NearDuplicateIndex(threshold, mask_digits=True, **options)
+
+
+@lru_cache(maxsize=None)
+def _optimal_bands(threshold, num_perm, false_negative_weight=0.9):
+    """``(bands, rows)`` minimising the weighted false positive and negative probability at ``threshold``
+
+    Misses weigh more by default: a spurious candidate only costs one
+    signature comparison, a missed one is a duplicate let through.
+    """
+    xs = np.linspace(0.0, 1.0, 201)
+    below, above = xs < threshold, xs >= threshold
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        candidate = 1.0 - (1.0 - xs ** rows) ** bands
+        error = ((1.0 - false_negative_weight) * candidate[below].sum()
+                 + false_negative_weight * (1.0 - candidate[above]).sum())
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """MinHash LSH index that finds and clusters near-duplicate texts
+
+    Each text gets a ``num_perm``-value MinHash signature over its word
+    shingles; the signature is cut into bands and every band hashed into a
+    bucket, so a lookup only compares against texts sharing a bucket rather
+    than against everything indexed. Candidates are confirmed by their
+    estimated Jaccard similarity reaching ``threshold``. Band and row counts
+    are chosen around ``threshold``, favouring recall over spurious candidates.
+
+    ``add`` puts a text in the cluster of its most similar indexed text (or
+    starts a new one) and returns the cluster id, which is the key of the
+    cluster's first member, so callers can reuse whatever they computed for
+    that first member.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle_size=5, mask_digits=False, seed=1):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.mask_digits = mask_digits
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        # Odd 64-bit multipliers for multiply-shift hashing
+        self._a = rng.randint(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.randint(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self._clusters = {}
+        self._members = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def signature(self, text):
+        """MinHash signature of ``text``; None when it has no words"""
+        hashed = shingles(text, self.shingle_size, self.mask_digits)
+        if not len(hashed):
+            return None
+        # Top 32 bits of (a * x + b) mod 2**64, one row per permutation; uint64 arithmetic wraps.
+        # Shifting after the min gives the same result with one shift per row. Long documents are
+        # hashed a chunk at a time with a running minimum rather than as one num_perm x n array
+        minimum = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        values = np.empty((self.num_perm, min(len(hashed), SIGNATURE_CHUNK)), dtype=np.uint64)
+        for start in range(0, len(hashed), SIGNATURE_CHUNK):
+            chunk = hashed[start:start + SIGNATURE_CHUNK]
+            block = values[:, :len(chunk)]
+            np.multiply(self._a[:, None], chunk, out=block)
+            block += self._b[:, None]
+            np.minimum(minimum, block.min(axis=1), out=minimum)
+        return (minimum >> HASH_SHIFT).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _matches(self, signature):
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        matches = []
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def find(self, text=None, signature=None):
+        """Indexed ``(key, similarity)`` pairs at or above the threshold, most similar first"""
+        if signature is None:
+            signature = self.signature(text or "")
+        if signature is None:
+            return []
+        with self._lock:
+            return self._matches(signature)
+
+    def add(self, key, text=None, signature=None):
+        """Index ``key`` and return its cluster id, or None for a text with no words"""
+        if signature is None:
+            signature = self.signature(text or "")
+        if signature is None:
+            return None
+        with self._lock:
+            if key in self._signatures:
+                return self._clusters[key]
+            matches = self._matches(signature)
+            cluster = self._clusters[matches[0][0]] if matches else key
+            self._signatures[key] = signature
+            self._clusters[key] = cluster
+            self._members.setdefault(cluster, []).append(key)
+            for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+                bucket.setdefault(band_key, []).append(key)
+            return cluster
+
+    def load(self, keys, signatures):
+        """Bulk-index stored ``signatures`` (a ``(len(keys), num_perm)`` array) without matching them
+
+        For restoring an index whose texts were already checked against each
+        other; every key becomes its own cluster.
+        """
+        signatures = np.ascontiguousarray(signatures, dtype=np.uint32).reshape(len(keys), self.num_perm)
+        band_width = np.dtype((np.void, self.rows * signatures.itemsize))
+        with self._lock:
+            new = [n for n, key in enumerate(keys) if key not in self._signatures]
+            keys = [keys[n] for n in new]
+            signatures = signatures[new]
+            for key, signature in zip(keys, signatures):
+                self._signatures[key] = signature
+                self._clusters[key] = key
+                self._members[key] = [key]
+            # One view per band instead of slicing every signature: the same bytes as ``_band_keys``
+            for band, bucket in enumerate(self._buckets):
+                columns = np.ascontiguousarray(signatures[:, band * self.rows:(band + 1) * self.rows])
+                for key, band_key in zip(keys, columns.view(band_width).ravel().tolist()):
+                    bucket.setdefault(band_key, []).append(key)
+
+    def remove(self, key):
+        with self._lock:
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return
+            for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+                keys = bucket[band_key]
+                keys.remove(key)
+                if not keys:
+                    del bucket[band_key]
+            cluster = self._clusters.pop(key)
+            members = self._members[cluster]
+            members.remove(key)
+            if not members:
+                del self._members[cluster]
+
+    def stored_signature(self, key):
+        """Signature indexed for ``key``, or None"""
+        return self._signatures.get(key)
+
+    def cluster(self, key):
+        """Cluster id of an indexed key, or None"""
+        return self._clusters.get(key)
+
+    def members(self, cluster):
+        """Keys in a cluster, first added first"""
+        return list(self._members.get(cluster, ()))
+
+    def clusters(self, min_size=2):
+        """``{cluster id: keys}`` for clusters with at least ``min_size`` members"""
+        with self._lock:
+            return {cluster: list(keys) for cluster, keys in self._members.items() if len(keys) >= min_size}
+
+    def clear(self):
+        with self._lock:
+            self._buckets = [{} for _ in range(self.bands)]
+            self._signatures.clear()
+            self._clusters.clear()
+            self._members.clear()
@@ -1,12 +1,12 @@
 import requests
+from ollama_client import get_client
 
 OLLAMA_API_URL = "http://localhost:11434"
 OLLAMA_MODEL = "mistral"
 
 def generate_reply(prompt):
-    url = f"{OLLAMA_API_URL}/api/generate"
     try:
-        response = requests.post(url, json={
+        response = get_client(OLLAMA_API_URL).post('/api/generate', {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
             "stream": False
@@ -17,3 +17,5 @@ def generate_reply(prompt):
             return f"❌ Failed: {response.status_code} | {response.text}"
     except requests.exceptions.ConnectionError:
         return "❌ Could not connect to Ollama server. Is it running?"
+    except requests.exceptions.RequestException as e:
+        return f"❌ Request to Ollama failed: {e}"
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# Ollama answers 503 when its request queue is full; retrying later is safe
+RETRY_STATUSES = (502, 503, 504)
+
+
+class OllamaError(Exception):
+    """Non-200 response from the Ollama API"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class OllamaClient:
+    """Ollama HTTP client over one pooled keep-alive session
+
+    ``pool_maxsize`` bounds the connections kept open per host, which is
+    also the number of requests that can run concurrently without waiting
+    for a connection. Connection failures and 502/503/504 answers are
+    retried ``retries`` times with exponential backoff; for POST the status
+    retries are opt-in (``retry_posts``), since a gateway error does not say
+    whether the server already ran the request.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_connections=4, pool_maxsize=16, retries=2,
+                 backoff_factor=0.5, retry_posts=False):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(
+                total=retries,
+                connect=retries,
+                read=0,
+                status=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'POST', 'DELETE'] if retry_posts else ['GET', 'DELETE']),
+                raise_on_status=False
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def get(self, path, timeout=10):
+        return self.session.get(self.url(path), timeout=timeout)
+
+    def post(self, path, payload, timeout=60, stream=False):
+        return self.session.post(self.url(path), json=payload, timeout=timeout, stream=stream)
+
+    def tags(self, timeout=10):
+        """Models installed on the server"""
+        response = self.get('/api/tags', timeout=timeout)
+        if response.status_code != 200:
+            raise OllamaError(response.status_code, response.text)
+        return response.json().get('models', [])
+
+    def generate(self, payload, timeout=60):
+        """Non-streaming ``/api/generate``; returns the response JSON"""
+        response = self.post('/api/generate', dict(payload, stream=False), timeout=timeout)
+        if response.status_code != 200:
+            raise OllamaError(response.status_code, response.text)
+        return response.json()
+
+    def stream(self, path, payload, timeout=60):
+        """Yield parsed NDJSON chunks from a streaming endpoint"""
+        with self.post(path, dict(payload, stream=True), timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise OllamaError(response.status_code, response.text)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise OllamaError(response.status_code, chunk['error'])
+                yield chunk
+                if chunk.get('done'):
+                    return
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOllamaClient:
+    """asyncio counterpart of ``OllamaClient`` built on ``httpx.AsyncClient``
+
+    Methods mirror the sync client and raise the same exceptions (transport
+    failures are mapped onto ``requests.exceptions``), so callers can share
+    error handling. A client belongs to the event loop it is first used on.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_maxsize=16, retries=2, retry_posts=False):
+        import httpx
+
+        self._httpx = httpx
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.retry_posts = retry_posts
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+            timeout=None
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _translate(self, error):
+        if isinstance(error, self._httpx.TimeoutException):
+            return requests.exceptions.Timeout(str(error))
+        if isinstance(error, self._httpx.TransportError):
+            return requests.exceptions.ConnectionError(str(error))
+        return error
+
+    async def _request(self, method, path, payload=None, timeout=60):
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.request(method, path, json=payload, timeout=timeout)
+            except self._httpx.HTTPError as e:
+                raise self._translate(e) from e
+            if (response.status_code not in RETRY_STATUSES or attempt == self.retries
+                    or (method == 'POST' and not self.retry_posts)):
+                return response
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def get(self, path, timeout=10):
+        return await self._request('GET', path, timeout=timeout)
+
+    async def post(self, path, payload, timeout=60):
+        return await self._request('POST', path, payload, timeout=timeout)
+
+    async def tags(self, timeout=10):
+        response = await self.get('/api/tags', timeout=timeout)
+        if response.status_code != 200:
+            raise OllamaError(response.status_code, response.text)
+        return response.json().get('models', [])
+
+    async def generate(self, payload, timeout=60):
+        response = await self.post('/api/generate', dict(payload, stream=False), timeout=timeout)
+        if response.status_code != 200:
+            raise OllamaError(response.status_code, response.text)
+        return response.json()
+
+    async def stream(self, path, payload, timeout=60):
+        """Async iterator over parsed NDJSON chunks from a streaming endpoint"""
+        try:
+            async with self.client.stream('POST', path, json=dict(payload, stream=True), timeout=timeout) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise OllamaError(response.status_code, response.text)
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(response.status_code, chunk['error'])
+                    yield chunk
+                    if chunk.get('done'):
+                        return
+        except self._httpx.HTTPError as e:
+            raise self._translate(e) from e
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url=DEFAULT_BASE_URL, pool_maxsize=16, retries=2, retry_posts=False):
+    """Process-wide ``OllamaClient``, shared by every caller with the same settings"""
+    key = (base_url.rstrip('/'), pool_maxsize, retries, retry_posts)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OllamaClient(base_url, pool_maxsize=pool_maxsize, retries=retries,
+                                                  retry_posts=retry_posts)
+        return client
@@ -0,0 +1,241 @@
+import base64
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.utils import make_msgid
+
+from gmail_fetcher import header_map, http_status
+from gmail_quota import OutcomeUnknown, is_ambiguous, is_retryable
+
+SEND_METHOD = 'users.messages.send'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    message_id TEXT UNIQUE,
+    thread_id TEXT,
+    to_addr TEXT,
+    subject TEXT,
+    raw TEXT,
+    status TEXT,
+    attempts INTEGER DEFAULT 0,
+    sent_id TEXT,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, created_at);
+"""
+
+STATUSES = ('pending', 'sending', 'sent', 'failed')
+
+
+def reply_message(email, text, message_id):
+    """RFC 822 reply to ``email`` threaded through In-Reply-To/References, base64url encoded"""
+    message = MIMEText(text, 'plain', 'utf-8')
+    message['To'] = email['sender']
+    subject = email.get('subject', '')
+    message['Subject'] = subject if subject.lower().startswith('re:') else f"Re: {subject}"
+    message['Message-ID'] = message_id
+    if email.get('message_id'):
+        message['In-Reply-To'] = email['message_id']
+        message['References'] = email['message_id']
+    return base64.urlsafe_b64encode(message.as_bytes()).decode('ascii')
+
+
+class Outbox:
+    """Durable queue of outgoing replies in SQLite, sent in batches
+
+    ``add`` stores a reply keyed by the Gmail id of the email it answers, so
+    queuing the same reply twice is a no-op, and fixes its RFC 822
+    Message-ID. ``flush`` claims pending rows (status ``sending``), sends
+    them through Gmail batch requests of ``batch_size`` on up to
+    ``concurrency`` threads and records each outcome. A row left in
+    ``sending`` by a crash is reconciled on the next flush by looking its
+    Message-ID up in Gmail before anything is resent: in search
+    (``rfc822msgid:``) and among the SENT messages of its thread, which
+    shows a send before search does. A row found in neither stays in
+    ``sending`` until ``search_lag`` seconds after its send attempt, so a
+    restart never sends a reply twice. Rate-limited sends go back to
+    ``pending`` until ``max_attempts`` is reached; a 5xx or dropped
+    connection may come after Gmail sent the mail, so those rows stay in
+    ``sending`` for reconcile too rather than being sent again.
+    """
+
+    def __init__(self, path=os.path.join('mail_store', 'outbox.sqlite'), max_attempts=5, user_id='me',
+                 search_lag=300):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.user_id = user_id
+        # Gmail search can take minutes to show a sent message
+        self.search_lag = search_lag
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def add(self, email, text):
+        """Queue a reply to ``email``; returns False if one is already queued or sent"""
+        message_id = make_msgid(domain='gmail-agent.local')
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (key, message_id, thread_id, to_addr, subject, raw, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (email['id'], message_id, email.get('threadId'), email['sender'], email.get('subject', ''),
+                 reply_message(email, text, message_id), now, now)
+            )
+        return cursor.rowcount == 1
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM outbox WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        with self._lock:
+            if status is None:
+                rows = self._db.execute("SELECT * FROM outbox ORDER BY created_at DESC LIMIT ?", (limit,))
+            else:
+                rows = self._db.execute("SELECT * FROM outbox WHERE status = ? ORDER BY created_at LIMIT ?",
+                                        (status, limit))
+            return [dict(row) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def retry_failed(self):
+        """Put every failed reply back in the queue"""
+        with self._lock, self._db:
+            return self._db.execute("UPDATE outbox SET status = 'pending', attempts = 0, error = NULL "
+                                    "WHERE status = 'failed'").rowcount
+
+    def _set(self, key, status, sent_id=None, error=None):
+        with self._lock, self._db:
+            self._db.execute("UPDATE outbox SET status = ?, sent_id = coalesce(?, sent_id), error = ?, "
+                             "updated_at = ? WHERE key = ?", (status, sent_id, error, time.time(), key))
+
+    def _claim(self, limit, before):
+        """Mark up to ``limit`` rows pending since before ``before`` as sending and return them"""
+        with self._lock, self._db:
+            rows = [dict(row) for row in self._db.execute(
+                "SELECT * FROM outbox WHERE status = 'pending' AND updated_at < ? ORDER BY created_at LIMIT ?",
+                (before, limit)
+            )]
+            self._db.executemany(
+                "UPDATE outbox SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                [(time.time(), row['key']) for row in rows]
+            )
+        return rows
+
+    def _sent_id(self, service, row):
+        """Gmail id of the sent copy of ``row``, or None while Gmail shows none"""
+        message_id = row['message_id'].strip('<>')
+        found = service.users().messages().list(
+            userId=self.user_id, q=f"rfc822msgid:{message_id}", maxResults=1
+        ).execute().get('messages', [])
+        if found:
+            return found[0]['id']
+        if not row['thread_id']:
+            return None
+        try:
+            thread = service.users().threads().get(userId=self.user_id, id=row['thread_id'], format='metadata',
+                                                   metadataHeaders=['Message-ID']).execute()
+        except Exception as e:
+            if http_status(e) != 404:
+                raise
+            return None
+        for message in thread.get('messages', []):
+            headers = header_map(message.get('payload', {}))
+            if 'SENT' in message.get('labelIds', []) and headers.get('message-id', '').strip('<> ') == message_id:
+                return message['id']
+        return None
+
+    def reconcile(self, service):
+        """Settle rows left in ``sending``: mark sent if Gmail has them, requeue once ``search_lag`` has passed"""
+        settled = {'sent': 0, 'pending': 0, 'unknown': 0}
+        for row in self.list('sending', limit=-1):
+            sent_id = self._sent_id(service, row)
+            if sent_id is not None:
+                self._set(row['key'], 'sent', sent_id=sent_id)
+                settled['sent'] += 1
+            elif time.time() - row['updated_at'] >= self.search_lag:
+                self._set(row['key'], 'pending')
+                settled['pending'] += 1
+            else:
+                # Search may not show the send yet; ask again on a later flush
+                settled['unknown'] += 1
+        return settled
+
+    def _send_batch(self, service, rows, report):
+        def done(key, response, exception):
+            if exception is None:
+                self._set(key, 'sent', sent_id=response['id'])
+                outcome = 'sent'
+            elif isinstance(exception, OutcomeUnknown) or is_ambiguous(exception):
+                # Gmail may have sent it before failing; leave the row in 'sending' for reconcile
+                self._set(key, 'sending', error=str(exception))
+                outcome = 'unknown'
+            elif is_retryable(exception, SEND_METHOD) and by_key[key]['attempts'] + 1 < self.max_attempts:
+                self._set(key, 'pending', error=str(exception))
+                outcome = 'requeued'
+            else:
+                self._set(key, 'failed', error=f"{http_status(exception) or ''} {exception}".strip())
+                outcome = 'failed'
+            with self._lock:
+                report[outcome] += 1
+
+        by_key = {row['key']: row for row in rows}
+        batch = service.new_batch_http_request(callback=done)
+        for row in rows:
+            body = {'raw': row['raw']}
+            if row['thread_id']:
+                body['threadId'] = row['thread_id']
+            batch.add(service.users().messages().send(userId=self.user_id, body=body), request_id=row['key'])
+        try:
+            batch.execute()
+        except Exception as e:
+            # The outcome is unknown; leave the rows in 'sending' for reconcile
+            with self._lock:
+                report['unknown'] += len(rows)
+            print(f"Error sending outbox batch: {e}")
+
+    def flush(self, service, batch_size=10, concurrency=2, limit=None):
+        """Send pending replies; returns counts, elapsed seconds and messages per second
+
+        Replies requeued by this flush wait for the next one.
+        """
+        with self._flush_lock:
+            start = time.perf_counter()
+            report = {'sent': 0, 'failed': 0, 'requeued': 0, 'unknown': 0}
+            report['reconciled'] = self.reconcile(service)['sent']
+            # Rows reconcile requeued go out now; ones this flush requeues wait for the next
+            started_at = time.time()
+            remaining = limit
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                while remaining is None or remaining > 0:
+                    size = batch_size * concurrency if remaining is None else min(batch_size * concurrency,
+                                                                                   remaining)
+                    rows = self._claim(size, started_at)
+                    if not rows:
+                        break
+                    if remaining is not None:
+                        remaining -= len(rows)
+                    chunks = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                    list(pool.map(lambda chunk: self._send_batch(service, chunk, report), chunks))
+            report['seconds'] = time.perf_counter() - start
+            report['per_second'] = report['sent'] / report['seconds'] if report['seconds'] else 0.0
+            return report
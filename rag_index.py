@@ -0,0 +1,381 @@
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+WORD_PATTERN = re.compile(r'\S+')
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def split_passages(text, passage_words=60, overlap_words=15):
+    """Split ``text`` into overlapping word windows, returned as ``[(start, end), ...]`` character spans
+
+    Spans point into the original text, so a passage is recovered with a
+    plain slice and never needs to be stored twice.
+    """
+    if overlap_words >= passage_words:
+        raise ValueError("overlap_words must be smaller than passage_words")
+
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if not words:
+        return []
+
+    stride = passage_words - overlap_words
+    spans = []
+    for first in range(0, len(words), stride):
+        last = min(first + passage_words, len(words)) - 1
+        spans.append((words[first][0], words[last][1]))
+        if last == len(words) - 1:
+            break
+    return spans
+
+
+def tokenize(text, vocabulary=None):
+    """Lower-cased words of ``text`` as ``(term_ids, spans)``, ``spans`` being ``(n, 2)`` character offsets
+
+    Unseen words are added to ``vocabulary`` (a fresh dict when None), so
+    texts tokenised against the same dict share term ids.
+    """
+    vocabulary = {} if vocabulary is None else vocabulary
+    matches = list(TERM_PATTERN.finditer(text))
+    term_ids = np.fromiter((vocabulary.setdefault(match.group().lower(), len(vocabulary)) for match in matches),
+                           dtype=np.int32, count=len(matches))
+    spans = np.array([match.span() for match in matches], dtype=np.int64).reshape(-1, 2)
+    return term_ids, spans
+
+
+def best_window(term_ids, query_ids, window):
+    """Start of the ``window``-term run containing the most distinct query terms; the earliest wins ties
+
+    Each query term gets a hit mask over the text whose prefix sum gives its
+    count in every window as one subtraction, so all windows are scored at
+    once instead of rebuilding and searching each one.
+    """
+    query_ids = np.unique(query_ids)
+    if not len(term_ids) or not len(query_ids):
+        return 0
+    window = max(1, min(window, len(term_ids)))
+    counts = np.zeros((len(query_ids), len(term_ids) + 1), dtype=np.int32)
+    np.cumsum(term_ids[None, :] == query_ids[:, None], axis=1, out=counts[:, 1:])
+    covered = (counts[:, window:] - counts[:, :-window]) > 0
+    return int(np.argmax(covered.sum(axis=0)))
+
+
+class _GrowableArray:
+    """Append-only numpy buffer with amortised O(1) growth
+
+    ``base`` may be a read-only memory map; it is only copied into memory
+    the first time the array grows past it.
+    """
+
+    def __init__(self, dtype, capacity=1024, base=None):
+        if base is None:
+            self._buffer = np.empty(capacity, dtype=dtype)
+            self.size = 0
+        else:
+            self._buffer = base
+            self.size = len(base)
+
+    def extend(self, values):
+        needed = self.size + len(values)
+        if needed > len(self._buffer):
+            grown = np.empty(max(needed, 2 * len(self._buffer)), dtype=self._buffer.dtype)
+            grown[:self.size] = self._buffer[:self.size]
+            self._buffer = grown
+        self._buffer[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self._buffer[:self.size]
+
+
+class Retriever(ABC):
+    """Passage retrieval backend used by RAGSystem
+
+    Backends are keyed by opaque hashable keys (RAGSystem uses
+    ``(doc_id, passage_no)``) and return ``[(key, score), ...]`` from
+    ``search`` sorted by descending score.
+    """
+
+    name = 'retriever'
+
+    @abstractmethod
+    def add(self, key, text):
+        """Index one passage"""
+
+    def add_batch(self, items):
+        """Add ``(key, text)`` pairs; backends that batch work override this"""
+        return [self.add(key, text) for key, text in items]
+
+    @abstractmethod
+    def remove(self, key):
+        """Drop a passage; returns whether it was indexed"""
+
+    def load(self, terms, indices, data, indptr, keys, alive):
+        """Adopt stored TF-IDF term-count rows; backends that cannot are fed text instead"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, query, top_k=None, min_score=0.0):
+        """``[(key, score), ...]`` for passages scoring at least ``min_score``, best first"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every passage"""
+
+    @abstractmethod
+    def __len__(self):
+        """Number of live passages"""
+
+
+class IncrementalTfidfIndex(Retriever):
+    """TF-IDF index where adding or removing one document only touches that document
+
+    Documents are tokenised with the same analyzer as ``TfidfVectorizer`` and
+    appended as CSR rows of raw term counts over a vocabulary that grows as new
+    terms appear. Document frequencies are kept separately, so IDF weights and
+    row norms are derived at query time instead of refitting the whole corpus.
+    Removed rows are tombstoned and dropped on the next compaction; pass
+    ``compact_ratio=None`` when the caller compacts together with its storage.
+    """
+
+    name = 'tfidf'
+
+    def __init__(self, stop_words='english', compact_ratio=0.5):
+        self.stop_words = stop_words
+        self.compact_ratio = compact_ratio
+        self.analyzer = TfidfVectorizer(stop_words=stop_words).build_analyzer()
+        self.clear()
+
+    def clear(self):
+        """Drop every row, the vocabulary and term statistics"""
+        self.vocabulary = {}
+        self.terms = []
+        self._doc_freq = _GrowableArray(np.int64)
+        self._indices = _GrowableArray(np.int32)
+        self._data = _GrowableArray(np.float32)
+        self._indptr = _GrowableArray(np.int64)
+        self._indptr.extend([0])
+        self._alive = _GrowableArray(np.bool_)
+        self._keys = []
+        self._rows_by_key = {}
+        self.n_live = 0
+        self._weights = None
+
+    def __len__(self):
+        return self.n_live
+
+    def __contains__(self, key):
+        return key in self._rows_by_key
+
+    @property
+    def n_features(self):
+        return len(self.vocabulary)
+
+    @property
+    def doc_freq(self):
+        return self._doc_freq.view()
+
+    def load(self, terms, indices, data, indptr, keys, alive):
+        """Adopt previously stored rows without re-tokenising anything
+
+        The arrays may be memory maps; ``keys`` and ``alive`` cover every row,
+        including tombstoned ones.
+        """
+        self.clear()
+        self.terms = list(terms)
+        self.vocabulary = {term: term_id for term_id, term in enumerate(self.terms)}
+        self._indices = _GrowableArray(np.int32, base=indices)
+        self._data = _GrowableArray(np.float32, base=data)
+        self._indptr = _GrowableArray(np.int64, base=indptr)
+        alive = np.array(alive, dtype=np.bool_)
+        self._alive = _GrowableArray(np.bool_, base=alive)
+        self._keys = list(keys)
+        self._rows_by_key = {key: row for row, key in enumerate(self._keys) if alive[row]}
+        self.n_live = len(self._rows_by_key)
+
+        # Document frequencies only count terms of live rows
+        row_of_entry = np.repeat(np.arange(len(self._keys)), np.diff(indptr))
+        live_terms = np.asarray(indices)[alive[row_of_entry]]
+        self._doc_freq = _GrowableArray(
+            np.int64, base=np.bincount(live_terms, minlength=len(self.terms)).astype(np.int64)
+        )
+
+    def arrays(self):
+        """Current ``(indices, data, indptr)`` CSR arrays, tombstones included"""
+        return self._indices.view(), self._data.view(), self._indptr.view()
+
+    @property
+    def dead_ratio(self):
+        return (len(self._keys) - self.n_live) / len(self._keys) if self._keys else 0.0
+
+    def add(self, key, text):
+        """Append a row for ``key``; cost is proportional to the length of ``text``
+
+        Returns the row's ``(term_ids, counts)`` so callers can persist it.
+        """
+        if key in self._rows_by_key:
+            raise ValueError(f"Key already indexed: {key}")
+
+        terms, counts = self._term_counts(text, grow=True)
+        self._indices.extend(terms)
+        self._data.extend(counts)
+        self._indptr.extend([self._indices.size])
+        self._alive.extend([True])
+        self.doc_freq[terms] += 1
+
+        self._rows_by_key[key] = len(self._keys)
+        self._keys.append(key)
+        self.n_live += 1
+        self._weights = None
+        return terms, counts
+
+    def remove(self, key):
+        """Tombstone the row for ``key`` and subtract its document frequencies"""
+        row = self._rows_by_key.pop(key, None)
+        if row is None:
+            return False
+
+        start, end = self._indptr.view()[row:row + 2]
+        self.doc_freq[self._indices.view()[start:end]] -= 1
+        self._alive.view()[row] = False
+        self.n_live -= 1
+        self._weights = None
+
+        if self.compact_ratio is not None and self.dead_ratio >= self.compact_ratio:
+            self.compact()
+        return True
+
+    def compact(self):
+        """Rewrite storage without tombstoned rows"""
+        alive = self._alive.view()
+        if alive.all():
+            return
+
+        counts = self._count_matrix()[alive]
+        keys = [key for key, live in zip(self._keys, alive) if live]
+        vocabulary = self.vocabulary
+        terms = self.terms
+        doc_freq = self.doc_freq.copy()
+
+        self.clear()
+        self.vocabulary = vocabulary
+        self.terms = terms
+        self._doc_freq.extend(doc_freq)
+        self._indices.extend(counts.indices)
+        self._data.extend(counts.data)
+        self._indptr.extend(counts.indptr[1:])
+        self._alive.extend(np.ones(len(keys), dtype=np.bool_))
+        self._keys = keys
+        self._rows_by_key = {key: row for row, key in enumerate(keys)}
+        self.n_live = len(keys)
+
+    def idf(self):
+        """Smoothed IDF, matching ``TfidfVectorizer(smooth_idf=True)``"""
+        return np.log((1.0 + self.n_live) / (1.0 + self.doc_freq)) + 1.0
+
+    def search(self, query, top_k=None, min_score=0.0):
+        """Return ``[(key, cosine_score), ...]`` sorted by descending score"""
+        if not self.n_live:
+            return []
+
+        scores = self.score(query)
+        alive = self._alive.view()
+        candidates = np.flatnonzero(alive & (scores >= min_score))
+        if top_k is not None and len(candidates) > top_k:
+            part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[part]
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self._keys[row], float(scores[row])) for row in order]
+
+    def score(self, query):
+        """Cosine score of ``query`` against every stored row (tombstones included)"""
+        terms, counts = self._term_counts(query, grow=False)
+        n_rows = len(self._keys)
+
+        idf = self.idf()
+        known = self.doc_freq[terms] > 0
+        terms = terms[known]
+        query_weights = counts[known] * idf[terms]
+
+        query_norm = np.linalg.norm(query_weights)
+        if not query_norm:
+            return np.zeros(n_rows)
+
+        query_vector = np.zeros(self.n_features)
+        query_vector[terms] = query_weights / query_norm
+        return self._row_weights(idf) @ query_vector
+
+    def _term_counts(self, text, grow):
+        """Vocabulary ids and counts for ``text``, optionally adding unseen terms"""
+        ids = []
+        for token in self.analyzer(text):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                if not grow:
+                    continue
+                term_id = self.vocabulary[token] = len(self.terms)
+                self.terms.append(token)
+                self._doc_freq.extend([0])
+            ids.append(term_id)
+        terms, counts = np.unique(np.asarray(ids, dtype=np.int32), return_counts=True)
+        return terms, counts.astype(np.float32)
+
+    def _row_weights(self, idf):
+        """L2-normalised TF-IDF rows, cached until the next mutation"""
+        if self._weights is None:
+            counts = self._count_matrix()
+            weighted = counts.multiply(idf.reshape(1, -1)).tocsr()
+            norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+            norms[norms == 0] = 1.0
+            self._weights = sp.diags(1.0 / norms) @ weighted
+        return self._weights
+
+    def _count_matrix(self):
+        return sp.csr_matrix(
+            (self._data.view(), self._indices.view(), self._indptr.view()),
+            shape=(len(self._keys), self.n_features)
+        )
+
+
+def compare_with_refit(index, texts_by_key, queries, tolerance=1e-6, top_k=5):
+    """Check ``index`` against a full ``TfidfVectorizer`` refit over the same texts
+
+    Returns a report with the largest absolute score difference and the number
+    of queries whose top-k ranking differs beyond ``tolerance``. Only floating
+    point summation order separates the two, so the difference stays near zero.
+    """
+    keys = list(texts_by_key)
+    if not keys:
+        # TfidfVectorizer refuses an empty corpus; an empty index must then find nothing
+        found = sum(bool(index.search(query)) for query in queries)
+        return {'queries': len(queries), 'max_score_diff': 0.0, 'rank_mismatches': found, 'ok': not found}
+    reference = TfidfVectorizer(stop_words=index.stop_words)
+    matrix = reference.fit_transform([texts_by_key[key] for key in keys])
+
+    max_diff = 0.0
+    mismatches = 0
+    for query in queries:
+        expected = cosine_similarity(reference.transform([query]), matrix)[0]
+        actual_by_key = dict(index.search(query))
+        actual = np.array([actual_by_key.get(key, 0.0) for key in keys])
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+
+        # Rankings only count as different when the swapped scores are not tied
+        expected_top = np.argsort(-expected, kind='stable')[:top_k]
+        actual_top = np.argsort(-actual, kind='stable')[:top_k]
+        if any(
+            exp != act and abs(expected[exp] - expected[act]) > tolerance
+            for exp, act in zip(expected_top, actual_top)
+        ):
+            mismatches += 1
+
+    return {
+        'queries': len(queries),
+        'max_score_diff': max_diff,
+        'rank_mismatches': mismatches,
+        'ok': max_diff <= tolerance and mismatches == 0
+    }
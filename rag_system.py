@@ -1,21 +1,44 @@
 import os
-import json
 import hashlib
+import threading
 from datetime import datetime
-from typing import List, Dict
-import requests
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-import PyPDF2
-import docx
+from rag_index import IncrementalTfidfIndex, best_window, compare_with_refit, split_passages, tokenize
+from gmail_fetcher import email_body
+from kb_store import KnowledgeBaseStore, encode_with_spans
+from hybrid_retriever import BM25Retriever, HybridRetriever
+from kb_ingest import TEXT_TYPE, extract_text
+from near_duplicates import NearDuplicateIndex
+from response_cache import LRUCache
 
 class RAGSystem:
-    def __init__(self, storage_path="knowledge_base"):
+    def __init__(self, storage_path="knowledge_base", passage_words=60, overlap_words=15, compact_ratio=0.5,
+                 retriever=None, near_duplicate_threshold=0.9, query_cache_size=256):
         self.storage_path = storage_path
+        # Reads and mutations run under this lock: the app and the auto-replier share one instance
+        self._lock = threading.RLock()
+        self.passage_words = passage_words
+        self.overlap_words = overlap_words
+        self.compact_ratio = compact_ratio
+        # Documents at least this similar (estimated Jaccard over word shingles) to a stored one
+        # are refused like exact duplicates; None disables the check
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._near_duplicates = None
+        # Document records (metadata and byte spans; content stays in the store),
+        # with an id -> position map so add, remove and lookup are O(1)
         self.documents = []
-        self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-        self.document_vectors = None
+        self._positions = {}
+        self._total_words = 0
+        # Bumped by every add, remove and clear; query results are cached under the
+        # generation they were ranked at, so older entries simply stop matching
+        self.generation = 0
+        self.query_cache = LRUCache(query_cache_size) if query_cache_size else None
+        self.index = IncrementalTfidfIndex(compact_ratio=None)
+        
+        # The TF-IDF index is always kept since the store persists its rows;
+        # any other retriever is fed the same passages and used for search
+        self.retriever = self._make_retriever(retriever)
+        self.store = KnowledgeBaseStore(storage_path)
         
         # Create storage directory
         os.makedirs(storage_path, exist_ok=True)
@@ -25,97 +48,250 @@ class RAGSystem:
     
     def add_document(self, file_or_text, title=None, metadata=None):
         """Add a document to the knowledge base"""
+        with self._lock:
+            # Extract text based on input type
+            if hasattr(file_or_text, 'read'):  # File-like object
+                text = self._extract_text_from_file(file_or_text)
+                title = title or getattr(file_or_text, 'name', 'Uploaded Document')
+            else:  # String text
+                text = file_or_text
+                title = title or f"Document {len(self.documents) + 1}"
         
-        # Extract text based on input type
-        if hasattr(file_or_text, 'read'):  # File-like object
-            text = self._extract_text_from_file(file_or_text)
-            title = title or getattr(file_or_text, 'name', 'Uploaded Document')
-        else:  # String text
-            text = file_or_text
-            title = title or f"Document {len(self.documents) + 1}"
-        
-        if not text or len(text.strip()) < 10:
-            raise ValueError("Document text is too short or empty")
-        
-        # Create document object
-        doc_id = hashlib.md5(text.encode()).hexdigest()
-        document = {
-            'id': doc_id,
-            'title': title,
-            'content': text,
-            'metadata': metadata or {},
-            'created_at': datetime.now().isoformat(),
-            'word_count': len(text.split())
-        }
-        
-        # Check if document already exists
-        if any(doc['id'] == doc_id for doc in self.documents):
-            raise ValueError("Document already exists in knowledge base")
-        
-        # Add to documents list
-        self.documents.append(document)
+            if not text or len(text.strip()) < 10:
+                raise ValueError("Document text is too short or empty")
         
-        # Update vectors
-        self._update_vectors()
+            # Check if document already exists
+            doc_id = hashlib.md5(text.encode()).hexdigest()
+            if doc_id in self._positions:
+                raise ValueError("Document already exists in knowledge base")
         
-        # Save to disk
-        self._save_documents()
+            signature = self._near_duplicate_signature(text)
+            if signature is not None:
+                matches = self.near_duplicates().find(signature=signature)
+                if matches:
+                    original, similarity = matches[0]
+                    raise ValueError(f"Document is a near duplicate of '{self.get_document(original)['title']}' "
+                                     f"({similarity:.0%} similar)")
+        
+            self._store_document(text, doc_id, title, metadata or {}, datetime.now().isoformat())
+            if signature is not None:
+                self.near_duplicates().add(doc_id, signature=signature)
+                self.store.append_signatures([(doc_id, signature)])
+            return doc_id
+    
+    def add_documents(self, documents):
+        """Add many ``{'text', 'title', 'metadata'}`` documents in one index and store commit
         
+        Returns the new ids in input order, with None for documents that are
+        empty or already in the knowledge base, exactly or nearly.
+        """
+        with self._lock:
+            created_at = datetime.now().isoformat()
+            existing = set()
+            ids, batch, signatures = [], [], []
+            for document in documents:
+                text = document['text']
+                doc_id = hashlib.md5(text.encode()).hexdigest() if text and len(text.strip()) >= 10 else None
+                if doc_id is None or doc_id in self._positions or doc_id in existing:
+                    ids.append(None)
+                    continue
+                signature = self._near_duplicate_signature(text)
+                if signature is not None:
+                    # Earlier documents of this batch are indexed too, so they count as well
+                    if self.near_duplicates().find(signature=signature):
+                        ids.append(None)
+                        continue
+                    self.near_duplicates().add(doc_id, signature=signature)
+                    signatures.append((doc_id, signature))
+                existing.add(doc_id)
+                title = document.get('title') or f"Document {len(self.documents) + len(batch) + 1}"
+                batch.append((text, doc_id, title, document.get('metadata') or {}, created_at))
+                ids.append(doc_id)
+            self._store_documents(batch)
+            self.store.append_signatures(signatures)
+            return ids
+    
+    def _store_document(self, text, doc_id, title, metadata, created_at):
+        """Index a document's passages and append it to the store"""
+        self._store_documents([(text, doc_id, title, metadata, created_at)])
         return doc_id
     
+    def _store_documents(self, batch):
+        """Index ``(text, doc_id, title, metadata, created_at)`` documents and append them to the store"""
+        if not batch:
+            return
+        n_terms = len(self.index.terms)
+        items, passages = [], []
+        for text, doc_id, title, metadata, created_at in batch:
+            spans = split_passages(text, self.passage_words, self.overlap_words)
+            content, byte_spans = encode_with_spans(text, spans)
+            
+            # Content lives in the store; the record keeps byte spans into it
+            document = {
+                'id': doc_id,
+                'title': title,
+                'metadata': metadata,
+                'created_at': created_at,
+                'word_count': len(text.split()),
+                'passages': byte_spans
+            }
+            
+            # Index only the new documents' passages
+            document_passages = [((doc_id, passage_no), text[start:end])
+                                 for passage_no, (start, end) in enumerate(spans)]
+            rows = [self.index.add(key, passage) for key, passage in document_passages]
+            items.append((document, content, rows))
+            passages += document_passages
+        for backend in self._backends():
+            backend.add_batch(passages)
+        
+        # Append to disk
+        self.store.append_documents(items, self.index.terms[n_terms:])
+        for document, _, _ in items:
+            self._append_record(document)
+    
+    def _append_record(self, document):
+        self.generation += 1
+        self._positions[document['id']] = len(self.documents)
+        self.documents.append(document)
+        self._total_words += document.get('word_count', 0)
+    
+    def _drop_record(self, doc_id):
+        """Remove a record by moving the last one into its slot"""
+        self.generation += 1
+        position = self._positions.pop(doc_id)
+        document = self.documents[position]
+        last = self.documents.pop()
+        if last is not document:
+            self.documents[position] = last
+            self._positions[last['id']] = position
+        self._total_words -= document.get('word_count', 0)
+        return document
+    
+    def _reset_records(self, documents=()):
+        self.generation += 1
+        self.documents = []
+        self._positions = {}
+        self._total_words = 0
+        for document in documents:
+            self._append_record(document)
+    
+    def near_duplicates(self):
+        """Near-duplicate index over the stored documents, loaded from the stored signatures on first use
+        
+        Documents stored without a signature (added before signatures were
+        kept, or with the check disabled) are hashed once and their
+        signatures appended.
+        """
+        with self._lock:
+            if self._near_duplicates is None:
+                index = NearDuplicateIndex(self.near_duplicate_threshold or 0.9)
+                doc_ids, signatures = self.store.load_signatures(index.num_perm)
+                live = [n for n, doc_id in enumerate(doc_ids) if doc_id in self._positions]
+                index.load([doc_ids[n] for n in live], signatures[live])
+                missing = []
+                for doc in self.documents:
+                    if doc['id'] not in index:
+                        signature = index.signature(self.store.read_content(doc))
+                        if signature is not None:
+                            index.add(doc['id'], signature=signature)
+                            missing.append((doc['id'], signature))
+                self.store.append_signatures(missing)
+                self._near_duplicates = index
+            return self._near_duplicates
+    
+    def _near_duplicate_signature(self, text):
+        if self.near_duplicate_threshold is None:
+            return None
+        return self.near_duplicates().signature(text)
+    
+    def find_near_duplicates(self, text):
+        """Stored documents similar to ``text``, as ``(record, similarity)`` pairs, most similar first"""
+        with self._lock:
+            return [(self.get_document(doc_id), similarity)
+                    for doc_id, similarity in self.near_duplicates().find(text)]
+    
+    def get_document(self, doc_id):
+        """Record of one document (title, metadata, passage spans), or None"""
+        with self._lock:
+            position = self._positions.get(doc_id)
+            return None if position is None else self.documents[position]
+    
+    def get_document_text(self, doc_id):
+        """Full text of one document, read from the store"""
+        with self._lock:
+            document = self.get_document(doc_id)
+            return None if document is None else self.store.read_content(document)
+    
+    def get_documents(self):
+        """Every document record, in storage order"""
+        with self._lock:
+            return list(self.documents)
+    
     def _extract_text_from_file(self, file):
         """Extract text from uploaded file"""
-        file_type = file.type if hasattr(file, 'type') else 'text/plain'
+        file_type = file.type if hasattr(file, 'type') else TEXT_TYPE
+        return extract_text(file, file_type)[0]
+    
+    def get_relevant_passages(self, query, max_results=3, min_similarity=0.1):
+        """Rank stored passages against a query
         
-        if file_type == 'text/plain':
-            return file.read().decode('utf-8')
+        Results are cached per (normalised query, max_results, min_similarity)
+        until the knowledge base next changes.
+        """
+        with self._lock:
+            if not self.documents or not len(self.retriever):
+                return []
         
-        elif file_type == 'application/pdf':
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            key = None
+            if self.query_cache is not None:
+                # Every retriever lower-cases and splits on whitespace, so these are the same query
+                key = (self.generation, " ".join(query.lower().split()), max_results, min_similarity)
+                cached = self.query_cache.get(key)
+                if cached is not None:
+                    return [dict(passage) for passage in cached]
         
-        elif file_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-            doc = docx.Document(file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            hits = self.retriever.search(query, top_k=max_results, min_score=min_similarity)
         
-        else:
-            # Try to read as text
-            try:
-                return file.read().decode('utf-8')
-            except:
-                raise ValueError(f"Unsupported file type: {file_type}")
+            passages = []
+            for (doc_id, passage_no), similarity in hits:
+                doc = self.documents[self._positions[doc_id]]
+                start, end = doc['passages'][passage_no]
+                passages.append({
+                    'doc_id': doc_id,
+                    'passage': passage_no,
+                    'title': doc['title'],
+                    'content': self.store.read_span(doc, start, end),
+                    'similarity': similarity
+                })
+            if key is not None:
+                self.query_cache.put(key, [dict(passage) for passage in passages])
+            return passages
+    
+    def passages_for_email(self, email, max_results=8):
+        """Passages relevant to an email, ranked against its body or, until that is loaded, its snippet"""
+        return self.get_relevant_passages(email_body(email), max_results=max_results)
+    
+    def query_cache_stats(self):
+        """Query-result cache counters and hit rate, empty when caching is disabled"""
+        with self._lock:
+            if self.query_cache is None:
+                return {}
+            cache = self.query_cache
+            lookups = cache.hits + cache.misses
+            return {
+                'entries': len(cache),
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'evictions': cache.evictions,
+                'generation': self.generation,
+                'hit_rate': cache.hits / lookups if lookups else 0.0
+            }
     
     def get_relevant_context(self, query, max_results=3, min_similarity=0.1):
         """Get relevant context for a query"""
-        if not self.documents or self.document_vectors is None:
-            return ""
-        
         try:
-            # Vectorize query
-            query_vector = self.vectorizer.transform([query])
-            
-            # Calculate similarities
-            similarities = cosine_similarity(query_vector, self.document_vectors)[0]
-            
-            # Get top results
-            top_indices = np.argsort(similarities)[::-1][:max_results]
-            
-            relevant_contexts = []
-            for idx in top_indices:
-                if similarities[idx] >= min_similarity:
-                    doc = self.documents[idx]
-                    context = self._extract_relevant_snippet(doc['content'], query)
-                    relevant_contexts.append({
-                        'title': doc['title'],
-                        'content': context,
-                        'similarity': float(similarities[idx])
-                    })
+            relevant_contexts = self.get_relevant_passages(query, max_results, min_similarity)
             
             # Format context for AI
             if relevant_contexts:
@@ -130,102 +306,202 @@ class RAGSystem:
             print(f"Error getting relevant context: {e}")
             return ""
     
-    def _extract_relevant_snippet(self, text, query, snippet_length=200):
-        """Extract relevant snippet from document"""
-        query_words = query.lower().split()
-        text_lower = text.lower()
-        
-        # Find best position
-        best_pos = 0
-        best_score = 0
-        
-        words = text.split()
-        for i in range(len(words)):
-            snippet = ' '.join(words[i:i+50])  # 50 word window
-            snippet_lower = snippet.lower()
-            
-            score = sum(1 for word in query_words if word in snippet_lower)
-            if score > best_score:
-                best_score = score
-                best_pos = i
-        
-        # Extract snippet
-        start = max(0, best_pos - 10)
-        end = min(len(words), best_pos + 40)
-        snippet = ' '.join(words[start:end])
-        
-        # Truncate if too long
-        if len(snippet) > snippet_length:
-            snippet = snippet[:snippet_length] + "..."
-        
-        return snippet
-    
-    def _update_vectors(self):
-        """Update document vectors"""
-        if not self.documents:
-            self.document_vectors = None
+    def _make_retriever(self, retriever):
+        """Resolve the retriever argument: 'tfidf', 'bm25', 'hybrid' or a Retriever"""
+        if retriever is None or retriever == 'tfidf':
+            return self.index
+        if retriever == 'bm25':
+            return BM25Retriever()
+        if retriever == 'hybrid':
+            return HybridRetriever([BM25Retriever(), self.index])
+        if isinstance(retriever, str):
+            raise ValueError(f"Unknown retriever: {retriever}")
+        return retriever
+    
+    def _backends(self):
+        """Retrievers other than the TF-IDF index that need passages fed to them"""
+        leaves = []
+        pending = [self.retriever]
+        while pending:
+            retriever = pending.pop()
+            if hasattr(retriever, 'members'):
+                pending.extend(retriever.members)
+            elif retriever is not self.index:
+                leaves.append(retriever)
+        return leaves
+    
+    def _populate_backends(self, rows, batch_size=1024):
+        """Give stored passages to the retrieval backends after a load"""
+        backends = []
+        for backend in self._backends():
+            try:
+                # Backends that understand the stored TF-IDF rows skip re-tokenising
+                backend.load(*rows)
+            except NotImplementedError:
+                backends.append(backend)
+        if not backends:
             return
         
-        try:
-            contents = [doc['content'] for doc in self.documents]
-            self.document_vectors = self.vectorizer.fit_transform(contents)
-        except Exception as e:
-            print(f"Error updating vectors: {e}")
-            self.document_vectors = None
+        batch = []
+        for doc in self.documents:
+            for passage_no, (start, end) in enumerate(doc['passages']):
+                batch.append(((doc['id'], passage_no), self.store.read_span(doc, start, end)))
+            if len(batch) >= batch_size or doc is self.documents[-1]:
+                for backend in backends:
+                    backend.add_batch(batch)
+                batch = []
     
-    def _save_documents(self):
-        """Save documents to disk"""
-        try:
-            with open(os.path.join(self.storage_path, 'documents.json'), 'w') as f:
-                json.dump(self.documents, f, indent=2)
-        except Exception as e:
-            print(f"Error saving documents: {e}")
+    def _unindex_document(self, doc):
+        """Remove every passage of a document from the index and backends"""
+        for passage_no in range(len(doc['passages'])):
+            key = (doc['id'], passage_no)
+            self.index.remove(key)
+            for backend in self._backends():
+                backend.remove(key)
+    
+    def verify_index(self, queries, tolerance=1e-6, top_k=5):
+        """Compare incremental index scores with a full TF-IDF refit"""
+        with self._lock:
+            texts_by_key = {
+                (doc['id'], passage_no): self.store.read_span(doc, start, end)
+                for doc in self.documents
+                for passage_no, (start, end) in enumerate(doc['passages'])
+            }
+            return compare_with_refit(self.index, texts_by_key, queries, tolerance=tolerance, top_k=top_k)
     
     def _load_documents(self):
-        """Load documents from disk"""
+        """Map the on-disk store, creating or migrating it on first use"""
         try:
-            doc_file = os.path.join(self.storage_path, 'documents.json')
-            if os.path.exists(doc_file):
-                with open(doc_file, 'r') as f:
-                    self.documents = json.load(f)
-                self._update_vectors()
+            if self.store.exists():
+                documents, terms, indices, data, indptr, keys, alive = self.store.load()
+                self.passage_words = self.store.manifest['passage_words']
+                self.overlap_words = self.store.manifest['overlap_words']
+                self.index.load(terms, indices, data, indptr, keys, alive)
+                self._reset_records(documents)
+                self._populate_backends((terms, indices, data, indptr, keys, alive))
+            else:
+                self.store.create(self.passage_words, self.overlap_words, self.index.stop_words)
+                if self.store.has_legacy_json():
+                    self._migrate_legacy_documents()
         except Exception as e:
             print(f"Error loading documents: {e}")
-            self.documents = []
+            self._reset_records()
+            self.index.clear()
+    
+    def _migrate_legacy_documents(self):
+        """One-shot import of a documents.json knowledge base"""
+        seen = set()
+        batch = []
+        for doc in self.store.load_legacy_json():
+            if doc['id'] in seen:
+                continue
+            seen.add(doc['id'])
+            batch.append((
+                doc['content'], doc['id'], doc.get('title'),
+                doc.get('metadata', {}), doc.get('created_at', datetime.now().isoformat())
+            ))
+        self._store_documents(batch)
+        if self.near_duplicate_threshold is not None:
+            # Hash the imported documents now rather than on the first add
+            self.near_duplicates()
+        self.store.retire_legacy_json()
+    
+    def compact(self):
+        """Drop removed documents from the index and rewrite the store"""
+        with self._lock:
+            self.index.compact()
+            indices, data, indptr = self.index.arrays()
+            # Removals reorder the records; the store wants them in row (append) order
+            self._reset_records(sorted(self.documents, key=lambda doc: doc['content_offset']))
+            self.store.rewrite(self.documents, self.index.terms, indices, data, indptr)
+            if self._near_duplicates is not None:
+                # Drop signatures of removed documents too
+                index = self._near_duplicates
+                self.store.rewrite_signatures([(doc['id'], index.stored_signature(doc['id']))
+                                               for doc in self.documents if doc['id'] in index])
     
     def get_stats(self):
         """Get knowledge base statistics"""
-        total_words = sum(doc.get('word_count', 0) for doc in self.documents)
-        return {
-            'total_documents': len(self.documents),
-            'total_words': total_words,
-            'average_words': total_words // len(self.documents) if self.documents else 0
-        }
-    
-    def search_documents(self, query, limit=5):
-        """Search documents by query"""
-        if not self.documents:
-            return []
+        with self._lock:
+            total_words = self._total_words
+            return {
+                'total_documents': len(self.documents),
+                'total_passages': len(self.index),
+                'total_words': total_words,
+                'average_words': total_words // len(self.documents) if self.documents else 0
+            }
+    
+    def search_documents(self, query, limit=5, snippet_chars=200, candidates=4):
+        """Documents ranked by their best matching passage, each with that passage as snippet"""
+        with self._lock:
+            if not self.documents:
+                return []
         
-        try:
-            context = self.get_relevant_context(query, max_results=limit, min_similarity=0.05)
-            if context:
-                return [{'title': doc['title'], 'snippet': context[:200]} for doc in self.documents[:limit]]
-            return []
-        except:
-            return []
+            try:
+                # Several passages can come from one document, so over-fetch before grouping
+                passages = self.get_relevant_passages(query, max_results=limit * candidates, min_similarity=0.05)
+            except Exception as e:
+                print(f"Error searching documents: {e}")
+                return []
+        
+            results = {}
+            for passage in passages:
+                if passage['doc_id'] not in results:
+                    results[passage['doc_id']] = {
+                        'id': passage['doc_id'],
+                        'title': passage['title'],
+                        'snippet': self._best_snippet(passage['content'], query, snippet_chars),
+                        'similarity': passage['similarity']
+                    }
+                    if len(results) == limit:
+                        break
+            return list(results.values())
+    
+    @staticmethod
+    def _best_snippet(text, query, snippet_chars):
+        """The ``snippet_chars`` of ``text`` starting at the run of words that covers most query terms"""
+        if len(text) <= snippet_chars:
+            return text
+        vocabulary = {}
+        term_ids, spans = tokenize(text, vocabulary)
+        query_ids, _ = tokenize(query, vocabulary)
+        if not len(term_ids):
+            return text[:snippet_chars]
+        window = int(len(term_ids) * snippet_chars / len(text))
+        start = best_window(term_ids, query_ids, window)
+        # The earliest best window can open with words before its first match
+        hits = np.isin(term_ids[start:start + window], query_ids)
+        if hits.any():
+            start += int(np.argmax(hits))
+        begin = min(spans[start, 0], len(text) - snippet_chars)
+        # Start on a word boundary when the window was pulled back from the end
+        begin = spans[np.searchsorted(spans[:, 0], begin), 0]
+        return text[begin:begin + snippet_chars]
     
     def remove_document(self, doc_id):
         """Remove a document from knowledge base"""
-        self.documents = [doc for doc in self.documents if doc['id'] != doc_id]
-        self._update_vectors()
-        self._save_documents()
+        with self._lock:
+            if doc_id not in self._positions:
+                return
+        
+            self._unindex_document(self._drop_record(doc_id))
+            if self._near_duplicates is not None:
+                self._near_duplicates.remove(doc_id)
+            self.store.append_removal(doc_id)
+        
+            # Reclaim tombstoned rows once they dominate the store
+            if self.compact_ratio is not None and self.index.dead_ratio >= self.compact_ratio:
+                self.compact()
     
     def clear_knowledge_base(self):
         """Clear all documents"""
-        self.documents = []
-        self.document_vectors = None
-        self._save_documents()
+        with self._lock:
+            self._reset_records()
+            self._near_duplicates = None
+            self.index.clear()
+            for backend in self._backends():
+                backend.clear()
+            self.store.create(self.passage_words, self.overlap_words, self.index.stop_words)
     
     def add_text_snippet(self, text, title, metadata=None):
         """Add a simple text snippet to knowledge base"""
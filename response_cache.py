@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-memory mapping that evicts the least recently used entry
+
+    ``max_entries`` bounds the number of entries; with ``ttl`` set, entries
+    older than that many seconds count as misses. Hits and misses are counted.
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseStore:
+    """On-disk tier: responses in one SQLite table with TTL and a size cap
+
+    Entries older than ``ttl`` seconds are ignored and purged; once more than
+    ``max_entries`` are stored the least recently read ones are deleted.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, accessed_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.purge_expired()
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock, self._db:
+            existed = self._db.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, model, response, now, now)
+            )
+            if not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)", (excess,)
+                )
+                self._count -= excess
+
+    def delete(self, key):
+        with self._lock, self._db:
+            self._count -= self._db.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+
+    def purge_expired(self):
+        """Delete entries past their TTL; returns how many were removed"""
+        with self._lock, self._db:
+            removed = self._db.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return removed
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+            self._count = 0
+
+    def close(self):
+        self._db.close()
+
+
+class ResponseCache:
+    """Two-tier cache of LLM generations keyed by ``(model, prompt, options)``
+
+    Lookups try the in-memory LRU first, then the optional SQLite tier at
+    ``path``; disk hits are promoted into memory. Both tiers expire entries
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries=256, path=None, ttl=7 * 24 * 3600, max_disk_entries=10000):
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = SQLiteResponseStore(path, ttl, max_disk_entries) if path else None
+
+    @staticmethod
+    def key(model, prompt, options=None):
+        payload = json.dumps([model, prompt, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def get(self, model, prompt, options=None):
+        """Cached response text, or None"""
+        key = self.key(model, prompt, options)
+        response = self.memory.get(key)
+        if response is None and self.disk is not None:
+            response = self.disk.get(key)
+            if response is not None:
+                self.memory.put(key, response)
+        return response
+
+    def put(self, model, prompt, options, response):
+        key = self.key(model, prompt, options)
+        self.memory.put(key, response)
+        if self.disk is not None:
+            self.disk.put(key, model, response)
+
+    def invalidate(self, model, prompt, options=None):
+        key = self.key(model, prompt, options)
+        self.memory.pop(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """Hit/miss counters per tier plus overall hit rate"""
+        stats = {
+            'memory_entries': len(self.memory),
+            'memory_hits': self.memory.hits,
+            'memory_misses': self.memory.misses,
+            'memory_evictions': self.memory.evictions,
+            'disk_entries': len(self.disk) if self.disk is not None else 0,
+            'disk_hits': self.disk.hits if self.disk is not None else 0,
+            'disk_misses': self.disk.misses if self.disk is not None else 0
+        }
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = stats['memory_hits'] + stats['memory_misses']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
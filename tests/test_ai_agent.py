@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+import requests
+
+from ai_agent import AIAgent
+from fake_ollama import FakeOllamaServer
+
+
+@pytest.fixture
+def agent():
+    with FakeOllamaServer(token_delay=0, tokens=8) as server:
+        yield AIAgent(base_url=server.base_url)
+
+
+def generation(*tokens, error=None):
+    def generate(prompt, options, timeout, stats, system=None):
+        yield from tokens
+        if error is not None:
+            raise error
+    return generate
+
+
+def test_mid_stream_failure_ends_without_error_text(agent):
+    agent._stream_generate = generation("Thanks ", "for ", error=requests.exceptions.ReadTimeout("timed out"))
+    stream = agent.stream_email("Write a thank-you note")
+    assert stream.text() == "Thanks for"
+    assert stream.stats['partial'] and stream.stats['error'] == "timed out"
+    assert agent.cache_stats()['memory_entries'] == 0
+
+
+def test_failure_before_first_token_yields_fallback(agent):
+    agent._stream_generate = generation(error=requests.exceptions.ReadTimeout("timed out"))
+    stream = agent.stream_email("Write a thank-you note")
+    assert stream.text() == "Request timed out. Please try again."
+    assert 'partial' not in stream.stats
+
+
+def test_empty_generation_is_not_cached(agent):
+    agent._stream_generate = generation(" ", "\n")
+    assert agent.generate_email("Write a thank-you note") == ""
+    agent._stream_generate = generation("Thanks!")
+    assert agent.generate_email("Write a thank-you note") == "Thanks!"
+    assert agent.generate_email("Write a thank-you note") == "Thanks!"
+    assert agent.cache_stats()['memory_entries'] == 1
+
+
+def test_async_empty_generation_is_not_cached(agent):
+    class Client:
+        async def generate(self, payload, timeout):
+            return {'response': ""}
+
+    agent._async_client = Client
+    assert asyncio.run(agent.agenerate_email("Write a thank-you note")) == ""
+    assert agent.cache_stats()['memory_entries'] == 0
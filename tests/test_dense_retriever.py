@@ -0,0 +1,28 @@
+from dense_retriever import DenseRetriever, HashingEmbedder
+
+
+class LazyEmbedder(HashingEmbedder):
+    """Hashing embedder that records when its model would have been loaded"""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.loaded = False
+
+    def __getattribute__(self, name):
+        if name in ('dim', 'encode'):
+            object.__setattr__(self, 'loaded', True)
+        return super().__getattribute__(name)
+
+
+def test_embedder_is_not_loaded_until_first_use(tmp_path):
+    embedder = LazyEmbedder()
+    retriever = DenseRetriever(embedder, cache_path=str(tmp_path))
+    assert len(retriever) == 0
+    assert retriever.search("refund policy") == []
+    assert not retriever.remove(('doc', 0))
+    retriever.clear()
+    assert not embedder.loaded
+
+    retriever.add_batch([(('doc', 0), "Refunds are issued within five business days.")])
+    assert embedder.loaded
+    assert retriever.search("refunds issued", top_k=1)[0][0] == ('doc', 0)
@@ -0,0 +1,48 @@
+import pytest
+
+from fake_gmail import FakeGmailService, FakeMailbox, http_error
+from gmail_fetcher import FetchError, GmailFetcher
+
+
+def failing_get(service, bad_ids, status):
+    methods = service.users().messages()._methods
+    get = methods['get']
+
+    def get_or_fail(**kwargs):
+        if kwargs['id'] in bad_ids:
+            raise http_error(status, "Backend Error")
+        return get(**kwargs)
+
+    methods['get'] = get_or_fail
+
+
+def make_fetcher(n=5):
+    mailbox = FakeMailbox.generate(n)
+    return mailbox, GmailFetcher(FakeGmailService(mailbox), batch_size=2)
+
+
+def test_failed_ids_raise_with_the_partial_result():
+    mailbox, fetcher = make_fetcher()
+    bad = {mailbox.order[1], mailbox.order[3]}
+    failing_get(fetcher.service, bad, 500)
+    with pytest.raises(FetchError) as raised:
+        fetcher.get_messages(mailbox.order)
+    assert set(raised.value.failed) == bad
+    assert set(raised.value.messages) == set(mailbox.order) - bad
+
+
+def test_deleted_messages_are_skipped():
+    mailbox, fetcher = make_fetcher()
+    gone = mailbox.order[2]
+    mailbox.delete(gone)
+    assert set(fetcher.get_messages(mailbox.order + [gone])) == set(mailbox.order) - {gone}
+
+
+def test_load_bodies_keeps_what_arrived():
+    mailbox, fetcher = make_fetcher()
+    emails = fetcher.fetch(query=None, limit=None)
+    failing_get(fetcher.service, {emails[0]['id']}, 503)
+    with pytest.raises(FetchError):
+        fetcher.load_bodies(emails)
+    assert 'body' not in emails[0]
+    assert all(email['body'] for email in emails[1:])
@@ -0,0 +1,115 @@
+import pytest
+
+from fake_gmail import FakeGmailService, FakeMailbox, http_error
+from gmail_quota import OutcomeUnknown, QuotaService
+from outbox import reply_message
+
+
+def send_body(n):
+    email = {'sender': 'someone@example.com', 'subject': f"Question {n}"}
+    return {'raw': reply_message(email, "Thanks", f"<reply-{n}@example.com>")}
+
+
+def failing_after_send(service, status):
+    """Make messages.send deliver the mail and then fail with ``status``"""
+    methods = service.users().messages()._methods
+    send = methods['send']
+
+    def send_then_fail(**kwargs):
+        send(**kwargs)
+        raise http_error(status, "Backend Error")
+
+    methods['send'] = send_then_fail
+
+
+def sent_count(mailbox):
+    return sum('SENT' in message['labelIds'] for message in mailbox.messages.values())
+
+
+def make_service(**options):
+    mailbox = FakeMailbox()
+    service = QuotaService(FakeGmailService(mailbox), base_delay=0.0, **options)
+    return mailbox, service
+
+
+def test_send_5xx_is_not_retried():
+    mailbox, service = make_service()
+    failing_after_send(service.service, 503)
+    with pytest.raises(OutcomeUnknown):
+        service.users().messages().send(userId='me', body=send_body(1)).execute()
+    assert sent_count(mailbox) == 1
+    assert service.stats()['retries'] == 0
+
+
+def test_idempotent_5xx_is_retried():
+    mailbox, service = make_service()
+    methods = service.service.users().messages()._methods
+    get, calls = methods['list'], []
+
+    def flaky_list(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise http_error(500, "Backend Error")
+        return get(**kwargs)
+
+    methods['list'] = flaky_list
+    service.users().messages().list(userId='me').execute()
+    assert len(calls) == 2
+
+
+def test_batch_send_5xx_reports_unknown_once():
+    mailbox, service = make_service()
+    failing_after_send(service.service, 500)
+    outcomes = {}
+    batch = service.new_batch_http_request(
+        callback=lambda request_id, response, exception: outcomes.setdefault(request_id, []).append(exception))
+    for n in range(3):
+        batch.add(service.users().messages().send(userId='me', body=send_body(n)), request_id=str(n))
+    batch.execute()
+    assert sent_count(mailbox) == 3
+    assert all(len(errors) == 1 and isinstance(errors[0], OutcomeUnknown) for errors in outcomes.values())
+
+
+def test_batch_transport_error_does_not_resend():
+    mailbox, service = make_service()
+    real_batch = service.service.new_batch_http_request
+
+    def lossy_batch(callback=None):
+        batch = real_batch(callback=callback)
+        execute = batch.execute
+
+        def lose_response():
+            batch.callback = None
+            execute()
+            raise ConnectionResetError("connection reset")
+
+        batch.execute = lose_response
+        return batch
+
+    service.service.new_batch_http_request = lossy_batch
+    outcomes = {}
+    batch = service.new_batch_http_request(
+        callback=lambda request_id, response, exception: outcomes.setdefault(request_id, []).append(exception))
+    for n in range(3):
+        batch.add(service.users().messages().send(userId='me', body=send_body(n)), request_id=str(n))
+    batch.execute()
+    assert sent_count(mailbox) == 3
+    assert all(len(errors) == 1 and isinstance(errors[0], OutcomeUnknown) for errors in outcomes.values())
+
+
+def test_callback_error_does_not_redeliver_other_parts():
+    mailbox, service = make_service()
+    delivered = []
+
+    def callback(request_id, response, exception):
+        delivered.append((request_id, exception))
+        if request_id == '0':
+            raise KeyError("bug in the caller")
+
+    batch = service.new_batch_http_request(callback=callback)
+    for n in range(3):
+        batch.add(service.users().messages().send(userId='me', body=send_body(n)), request_id=str(n))
+    with pytest.raises(KeyError):
+        batch.execute()
+    assert delivered == [('0', None), ('1', None), ('2', None)]
+    assert sent_count(mailbox) == 3
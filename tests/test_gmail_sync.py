@@ -0,0 +1,112 @@
+import pytest
+
+from fake_gmail import FakeGmailService, FakeMailbox
+from gmail_sync import GmailSync, MemoryMessageStore, MessageStore
+
+
+@pytest.fixture
+def mailbox():
+    mailbox = FakeMailbox.generate(30)
+    # Delivery within one millisecond gives every message the same date; space them a second apart
+    for i, message_id in enumerate(mailbox.order):
+        mailbox.messages[message_id]['internalDate'] = str(1700000000000 + i * 1000)
+    return mailbox
+
+
+def inbox(mailbox):
+    return {message_id for message_id in mailbox.order if 'INBOX' in mailbox.messages[message_id]['labelIds']}
+
+
+def test_first_sync_is_bounded_and_backfilled_a_page_at_a_time(mailbox):
+    service = FakeGmailService(mailbox)
+    syncer = GmailSync(service, MemoryMessageStore(), initial_messages=8)
+    report = syncer.sync()
+    assert report['added'] == 8 and report['backfill']
+    assert syncer.store.ids() == set(mailbox.order[-8:])
+
+    pages = 0
+    while syncer.backfill() is not None:
+        pages += 1
+    assert pages == 3
+    assert syncer.store.ids() == inbox(mailbox)
+
+
+def test_backfill_stops_at_max_messages(mailbox):
+    syncer = GmailSync(FakeGmailService(mailbox), MemoryMessageStore(), max_messages=20, initial_messages=8)
+    syncer.sync()
+    while syncer.backfill() is not None:
+        pass
+    assert syncer.store.ids() == set(mailbox.order[-20:])
+
+
+def test_resync_keeps_older_messages_until_backfill_checks_them(mailbox):
+    syncer = GmailSync(FakeGmailService(mailbox), MemoryMessageStore(), initial_messages=10)
+    syncer.sync()
+    while syncer.backfill() is not None:
+        pass
+    gone = mailbox.order[3]
+    mailbox.delete(gone)
+    mailbox.expire_history()
+
+    assert syncer.sync()['mode'] == 'full'
+    # Only the newest 10 were re-listed; the older ones are not known to be stale yet
+    assert gone in syncer.store.ids()
+    while syncer.backfill() is not None:
+        pass
+    assert syncer.store.ids() == inbox(mailbox)
+
+
+def synced(mailbox, **options):
+    service = FakeGmailService(mailbox)
+    syncer = GmailSync(service, MemoryMessageStore(), **options)
+    syncer.sync()
+    return service, syncer
+
+
+def test_history_records_are_applied(mailbox):
+    service, syncer = synced(mailbox)
+    read, archived, deleted = mailbox.order[-1], mailbox.order[-2], mailbox.order[-3]
+    mailbox.modify(read, remove=['UNREAD'], add=['STARRED'])
+    mailbox.modify(archived, remove=['INBOX'])
+    mailbox.delete(deleted)
+    added = mailbox.deliver(mailbox.messages[read]['raw'])
+
+    report = syncer.sync()
+    assert report['mode'] == 'incremental'
+    assert report['added_ids'] == [added] and report['deleted'] == 2 and report['relabelled'] == 1
+    assert syncer.store.get(read)['labels'] == ['INBOX', 'STARRED']
+    assert syncer.store.get(added)['labels'] == ['INBOX', 'UNREAD']
+    assert syncer.store.ids() == inbox(mailbox)
+
+    # Moving a message back into the label fetches it again
+    mailbox.modify(archived, add=['INBOX'])
+    assert syncer.sync()['added_ids'] == [archived]
+    assert syncer.store.ids() == inbox(mailbox)
+
+
+def test_idle_mailbox_costs_one_history_call(mailbox):
+    service, syncer = synced(mailbox)
+    service.reset_stats()
+    report = syncer.sync()
+    assert (report['added'], report['deleted'], report['relabelled']) == (0, 0, 0)
+    assert service.stats['requests'] == 1
+
+
+def test_expired_history_falls_back_to_a_full_sync(mailbox):
+    service, syncer = synced(mailbox)
+    gone = mailbox.order[-1]
+    mailbox.delete(gone)
+    added = mailbox.deliver(mailbox.messages[mailbox.order[0]]['raw'])
+    mailbox.expire_history()
+
+    report = syncer.sync()
+    assert report['mode'] == 'full'
+    assert report['added_ids'] == [added] and report['deleted'] == 1
+    assert syncer.store.ids() == inbox(mailbox)
+    assert syncer.history_id == str(mailbox.history_id)
+    assert syncer.sync()['mode'] == 'incremental'
+
+
+def test_message_store_is_abstract():
+    with pytest.raises(TypeError):
+        MessageStore()
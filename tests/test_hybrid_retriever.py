@@ -0,0 +1,37 @@
+from hybrid_retriever import BM25Retriever, HybridRetriever
+from rag_index import IncrementalTfidfIndex
+
+PASSAGES = [
+    ('refunds', "Refunds are issued to the original card within five business days of the return arriving."),
+    ('shipping', "Orders ship from the warehouse within two days; express delivery arrives the next day."),
+    ('security', "The security audit findings list every server that still accepts passwords over ssh."),
+]
+
+
+def fused_tfidf():
+    index = IncrementalTfidfIndex(compact_ratio=None)
+    for key, text in PASSAGES:
+        index.add(key, text)
+    return index, HybridRetriever([index])
+
+
+def test_min_score_applies_to_member_scores():
+    index, hybrid = fused_tfidf()
+    query = "warehouse express delivery schedule for my refunds question and other things"
+    member = dict(index.search(query))
+    # The fused score of the top hit is 1.0 whatever its match quality
+    assert max(score for _, score in hybrid.search(query)) == 1.0
+    threshold = (member['shipping'] + member['refunds']) / 2
+    assert [key for key, _ in hybrid.search(query, min_score=threshold)] == ['shipping']
+    assert hybrid.search(query, min_score=max(member.values()) + 0.01) == []
+
+
+def test_key_kept_when_any_member_reaches_min_score():
+    index, _ = fused_tfidf()
+    bm25 = BM25Retriever()
+    bm25.add_batch(PASSAGES)
+    hybrid = HybridRetriever([bm25, index])
+    query = "security audit"
+    # BM25 scores are unbounded, TF-IDF cosines are not: one member above the threshold is enough
+    assert dict(index.search(query))['security'] < 1.0 < dict(bm25.search(query))['security']
+    assert [key for key, _ in hybrid.search(query, min_score=1.0)] == ['security']
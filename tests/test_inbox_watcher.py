@@ -0,0 +1,102 @@
+import queue
+import threading
+
+from inbox_watcher import AutoReplier
+from near_duplicates import email_index
+from rag_system import RAGSystem
+
+
+class Stream:
+    def __init__(self, text):
+        self._text = text
+        self.stats = {}
+
+    def text(self):
+        return self._text
+
+
+class Agent:
+    def __init__(self):
+        self.prompts = []
+
+    def stream_reply(self, email, user_profile, context, style):
+        self.prompts.append(email['id'])
+        return Stream(f"Dear {email['sender']}, thanks for order {email['id']}")
+
+
+class Store:
+    def __init__(self, emails):
+        self.emails = {email['id']: email for email in emails}
+
+    def get(self, message_id):
+        return self.emails.get(message_id)
+
+
+class Handler:
+    def __init__(self, emails):
+        self.store = Store(emails)
+        self.sent = []
+
+    def load_body(self, email):
+        return email
+
+    def send_reply(self, email, reply):
+        self.sent.append((email['sender'], reply))
+
+
+def notifications():
+    return [{'id': str(n), 'sender': f"customer{n}@example.com", 'subject': f"Order {n} has shipped",
+             'body': f"Your order {n} left our warehouse and should arrive within {n} days."} for n in (1, 2)]
+
+
+def replier(send):
+    emails = notifications()
+    handler, agent = Handler(emails), Agent()
+    auto = AutoReplier(handler, agent, queue.Queue(), send=send, near_duplicates=email_index())
+    return auto, handler, agent, [auto.process(email['id']) for email in emails]
+
+
+def test_cluster_reply_is_reused_for_drafts():
+    _, _, agent, results = replier(send=False)
+    assert agent.prompts == ['1']
+    assert results[1]['reused_from'] == '1'
+
+
+def test_cluster_reply_is_not_sent_to_another_recipient():
+    _, handler, agent, results = replier(send=True)
+    assert agent.prompts == ['1', '2']
+    assert results[1]['reused_from'] is None
+    # Each recipient got the reply written for them
+    assert [sender for sender, _ in handler.sent] == ["customer1@example.com", "customer2@example.com"]
+    assert all(sender.split('@')[0] in reply for sender, reply in handler.sent)
+
+
+def test_retrieval_waits_for_a_removal(tmp_path):
+    rag = RAGSystem(str(tmp_path), retriever='bm25', near_duplicate_threshold=None)
+    rag.add_document("Refunds are issued within five business days.", "Refunds")
+    doc_id = rag.add_document("The warehouse reports a shipping delay of three days.", "Delay")
+    results, errors = [], []
+
+    def retrieve():
+        try:
+            results.append(rag.get_relevant_passages("warehouse shipping delay"))
+        except Exception as e:
+            errors.append(e)
+
+    unindex = rag._unindex_document
+
+    def unindex_with_reader(doc):
+        # A reader arriving between dropping the record and unindexing its passages
+        reader = threading.Thread(target=retrieve)
+        reader.start()
+        reader.join(0.2)
+        unindex(doc)
+        return reader
+
+    readers = []
+    rag._unindex_document = lambda doc: readers.append(unindex_with_reader(doc))
+    rag.remove_document(doc_id)
+    readers[0].join()
+    assert not errors
+    assert results == [[]]
+    rag.store.close()
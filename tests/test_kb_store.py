@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+import kb_store
+from kb_store import KnowledgeBaseStore
+from rag_system import RAGSystem
+
+TOPICS = ("invoice payment terms", "warehouse delivery schedule", "contract renewal notice", "refund policy",
+          "security audit findings", "quarterly budget forecast")
+
+
+def make_rag(path):
+    return RAGSystem(path, compact_ratio=None, near_duplicate_threshold=None)
+
+
+def fill(rag, n=12):
+    texts = {}
+    for i in range(n):
+        text = f"Document {i} about {TOPICS[i % len(TOPICS)]}. " + " ".join(f"word{i}x{j}" for j in range(80))
+        texts[rag.add_document(text, f"doc{i}")] = text
+    return texts
+
+
+def assert_intact(path, texts):
+    rag = make_rag(path)
+    assert {doc['id'] for doc in rag.documents} == set(texts)
+    for doc_id, text in texts.items():
+        assert rag.get_document_text(doc_id) == text
+    assert rag.verify_index(list(TOPICS))['ok']
+    hit = rag.get_relevant_passages("security audit findings", max_results=1)[0]
+    assert "security audit findings" in hit['content']
+    rag.store.close()
+
+
+def test_reload_keeps_documents(tmp_path):
+    rag = make_rag(str(tmp_path))
+    texts = fill(rag)
+    removed = next(iter(texts))
+    rag.remove_document(removed)
+    del texts[removed]
+    rag.store.close()
+    assert_intact(str(tmp_path), texts)
+
+
+def test_partial_append_is_trimmed(tmp_path, monkeypatch):
+    rag = make_rag(str(tmp_path))
+    texts = fill(rag, 6)
+    # Crash after the content and rows are written but before the log line
+    original = KnowledgeBaseStore.append_documents
+
+    def crash_before_log(self, items, new_terms):
+        log_file = self._file(kb_store.LOG_FILE)
+        size = os.path.getsize(log_file)
+        original(self, items, new_terms)
+        os.truncate(log_file, size)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(KnowledgeBaseStore, 'append_documents', crash_before_log)
+    with pytest.raises(KeyboardInterrupt):
+        rag.add_document("A refund policy document that never made it into the log " * 5, "lost")
+    rag.store.close()
+    monkeypatch.undo()
+    assert_intact(str(tmp_path), texts)
+
+
+def compact_with_crash(path, monkeypatch, crash_on):
+    rag = make_rag(path)
+    texts = fill(rag)
+    for doc_id in list(texts)[::3]:
+        rag.remove_document(doc_id)
+        del texts[doc_id]
+    real_replace, real_remove = os.replace, os.remove
+
+    def replace(src, dst):
+        if crash_on == 'switch' and dst.endswith(kb_store.MANIFEST_FILE):
+            raise KeyboardInterrupt
+        real_replace(src, dst)
+
+    def remove(name):
+        if crash_on == 'cleanup':
+            raise KeyboardInterrupt
+        real_remove(name)
+
+    monkeypatch.setattr(kb_store.os, 'replace', replace)
+    monkeypatch.setattr(kb_store.os, 'remove', remove)
+    with pytest.raises(KeyboardInterrupt):
+        rag.compact()
+    monkeypatch.undo()
+    rag.store.close()
+    return texts
+
+
+def test_crash_before_generation_switch_keeps_old_store(tmp_path, monkeypatch):
+    texts = compact_with_crash(str(tmp_path), monkeypatch, 'switch')
+    assert_intact(str(tmp_path), texts)
+    # The half-written generation is cleaned up on load
+    assert not any('.1.' in name for name in os.listdir(tmp_path))
+
+
+def test_crash_after_generation_switch_uses_new_store(tmp_path, monkeypatch):
+    texts = compact_with_crash(str(tmp_path), monkeypatch, 'cleanup')
+    assert_intact(str(tmp_path), texts)
+    names = os.listdir(tmp_path)
+    assert kb_store.CONTENT_FILE not in names and 'content.1.bin' in names
+
+
+def test_compacted_store_keeps_appending(tmp_path):
+    rag = make_rag(str(tmp_path))
+    texts = fill(rag)
+    for doc_id in list(texts)[:4]:
+        rag.remove_document(doc_id)
+        del texts[doc_id]
+    rag.compact()
+    extra = "One more refund policy note written after compaction " + " ".join(f"late{j}" for j in range(40))
+    texts[rag.add_document(extra, "late")] = extra
+    rag.store.close()
+    assert_intact(str(tmp_path), texts)
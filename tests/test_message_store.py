@@ -0,0 +1,90 @@
+import pytest
+
+from message_store import SQLiteMessageStore
+
+
+def email(message_id, subject, snippet="", thread=None, labels=('INBOX',), date=0, **fields):
+    return dict({'id': message_id, 'threadId': thread or message_id, 'sender': "alice@example.com",
+                 'subject': subject, 'snippet': snippet, 'labels': list(labels), 'internal_date': date}, **fields)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteMessageStore(str(tmp_path / 'messages.sqlite'))
+    yield store
+    store.close()
+
+
+def test_search_ranks_the_closer_match_first(store):
+    store.upsert([
+        email('1', "Weekly newsletter", "Sales, events and a note on our refund window."),
+        email('2', "Refund request", "Please refund order 1042; the refund is overdue."),
+        email('3', "Lunch on Friday", "Are you free?"),
+    ])
+    assert [found['id'] for found in store.search("refund")] == ['2', '1']
+    assert [found['id'] for found in store.search("refund overdue")] == ['2']
+    assert {found['id'] for found in store.search("refund friday", match_all=False)} == {'1', '2', '3'}
+    assert store.search("") == []
+
+
+def test_search_can_be_limited_to_a_label(store):
+    store.upsert([email('1', "Refund request", labels=['INBOX']), email('2', "Refund sent", labels=['SENT'])])
+    assert [found['id'] for found in store.search("refund", label='SENT')] == ['2']
+
+
+def test_metadata_upsert_keeps_a_downloaded_body(store):
+    store.upsert([email('1', "Invoice", "Snippet only")])
+    assert 'body' not in store.get('1')
+    store.upsert([email('1', "Invoice", "Snippet only", body="The full invoice text mentions penguins.")])
+    # A later sync writes headers and labels without the body
+    store.upsert([email('1', "Invoice", "Snippet only", labels=['INBOX', 'STARRED'])])
+    stored = store.get('1')
+    assert stored['body'] == "The full invoice text mentions penguins."
+    assert stored['labels'] == ['INBOX', 'STARRED']
+    assert [found['id'] for found in store.search("penguins")] == ['1']
+
+
+def test_list_by_label_is_newest_first(store):
+    store.upsert([email(str(i), f"Message {i}", labels=['INBOX'] + (['UNREAD'] if i % 2 else []), date=i)
+                  for i in range(6)])
+    assert [found['id'] for found in store.list(label='UNREAD')] == ['5', '3', '1']
+    assert [found['id'] for found in store.list(label='INBOX', limit=2)] == ['5', '4']
+    assert len(store.list()) == 6
+
+    store.set_labels('5', ['INBOX'])
+    store.delete(['3'])
+    assert [found['id'] for found in store.list(label='UNREAD')] == ['1']
+    assert store.ids() == {'0', '1', '2', '4', '5'}
+
+
+def test_related_passages_put_the_thread_before_subject_matches(store):
+    store.upsert([
+        email('1', "Order 1042 delayed", "Your order is delayed.", thread='t', date=1),
+        email('2', "Re: Order 1042 delayed", "Any update?", thread='t', date=2,
+              body="Any update on the delivery?"),
+        email('3', "Order 1042 delayed", "Second notice about the delay.", date=3),
+        email('4', "Lunch", "Are you free?", date=4),
+    ])
+    current = email('5', "Re: Re: Order 1042 delayed", thread='t', date=5)
+    store.upsert([current])
+
+    passages = store.related_passages(current, limit=3)
+    assert [(passage['doc_id'], passage['similarity']) for passage in passages] == \
+        [('1', 1.0), ('2', 1.0), ('3', 0.5)]
+    assert passages[1]['content'] == "Any update on the delivery?"
+    assert passages[2]['content'] == "Second notice about the delay."
+    assert len(store.related_passages(current, limit=1)) == 1
+
+
+def test_state_survives_reopening(tmp_path):
+    path = str(tmp_path / 'messages.sqlite')
+    store = SQLiteMessageStore(path)
+    store.upsert([email('1', "Kept")])
+    store.set_state('history_id', '1234')
+    store.close()
+
+    store = SQLiteMessageStore(path)
+    assert store.get_state('history_id') == '1234'
+    assert store.get_state('missing', 'default') == 'default'
+    assert store.ids() == {'1'}
+    store.close()
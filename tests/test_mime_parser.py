@@ -0,0 +1,60 @@
+import json
+import os
+import random
+from email.message import EmailMessage
+
+import pytest
+
+import mime_parser
+from fake_gmail import FakeGmailService, FakeMailbox, make_message
+from mime_parser import MimeMessage
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures', 'mime')
+
+with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as f:
+    EXPECTED = json.load(f)
+
+
+def fetched(raw):
+    """``format='full'`` message for ``raw`` and the fake service that serves its attachments"""
+    mailbox = FakeMailbox()
+    service = FakeGmailService(mailbox)
+    message_id = mailbox.deliver(raw)
+    return service.users().messages().get(userId='me', id=message_id).execute(), service
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_fixture_body_is_decoded(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        message, service = fetched(f.read())
+    assert EXPECTED[name] in MimeMessage(message, service).body()
+
+
+def test_large_body_is_fetched_by_attachment_id():
+    message, service = fetched(make_message(0, random.Random(0), body_sentences=8000, html=False))
+    # Without a service the separately stored body is treated as missing
+    assert MimeMessage(message).body() is None
+    assert "Could you send" in MimeMessage(message, service).body()
+
+
+def test_attachment_is_saved_a_chunk_at_a_time(tmp_path, monkeypatch):
+    blob = os.urandom(100003)
+    email = EmailMessage()
+    email['Subject'] = "Report"
+    email.set_content("See attached.")
+    email.add_attachment(blob, maintype='application', subtype='octet-stream', filename='report.bin')
+    message, service = fetched(email.as_bytes())
+    mime = MimeMessage(message, service)
+    part_id = mime.attachments[0]['part_id']
+
+    decoded = []
+    decode = mime_parser.b64url_decode
+    monkeypatch.setattr(mime_parser, 'CHUNK_CHARS', 4096)
+    monkeypatch.setattr(mime_parser, 'b64url_decode', lambda data: decoded.append(len(data)) or decode(data))
+    path = tmp_path / 'report.bin'
+    assert mime.save_attachment(part_id, str(path)) == len(blob)
+    assert path.read_bytes() == blob
+    assert max(decoded) == 4096 and len(decoded) > 30
+
+    with pytest.raises(ValueError):
+        MimeMessage(message).save_attachment(part_id, str(path))
@@ -0,0 +1,88 @@
+import threading
+
+from model_registry import ModelRegistry
+from ollama_client import OllamaError
+
+
+class Client:
+    """Ollama client stub whose ``/api/pull`` stream advances one line per ``step``"""
+
+    def __init__(self, installed=(), fail_with=None):
+        self.installed = list(installed)
+        self.fail_with = fail_with
+        self.tag_calls = 0
+        self.step = threading.Semaphore(0)
+        self.sent = threading.Semaphore(0)
+
+    def tags(self, timeout=None):
+        self.tag_calls += 1
+        if isinstance(self.fail_with, ConnectionError):
+            raise self.fail_with
+        return [{'name': name} for name in self.installed]
+
+    def stream(self, path, payload, timeout=None):
+        for chunk in ({'status': "pulling manifest"}, {'status': "downloading", 'total': 100, 'completed': 40},
+                      {'status': "success"}):
+            self.step.acquire()
+            if isinstance(self.fail_with, OllamaError):
+                raise self.fail_with
+            yield chunk
+            self.sent.release()
+        self.installed.append(payload['name'])
+
+
+def advance(client):
+    client.step.release()
+    assert client.sent.acquire(timeout=5)
+
+
+def test_tags_are_cached_for_ttl():
+    client = Client(installed=['mistral'])
+    registry = ModelRegistry(client, ttl=60)
+    assert registry.names() == ['mistral'] and registry.has('mistral')
+    assert client.tag_calls == 1
+    registry.invalidate()
+    registry.names()
+    assert client.tag_calls == 2
+
+
+def test_unreachable_server_is_remembered():
+    client = Client(fail_with=ConnectionError("refused"))
+    registry = ModelRegistry(client, error_ttl=60)
+    assert not registry.is_reachable() and registry.names() == []
+    assert client.tag_calls == 1
+
+
+def test_background_pull_reports_each_state():
+    client = Client()
+    registry = ModelRegistry(client)
+    job = registry.ensure('gemma:2b')
+    assert job.status in ("queued", "checking")
+    assert registry.ensure('gemma:2b') is job
+
+    advance(client)
+    assert job.status == "pulling manifest" and job.progress is None
+    advance(client)
+    assert job.status == "downloading" and job.progress == 0.4
+    advance(client)
+    assert job.wait(5) and job.succeeded
+    assert job.as_dict()['done'] and job.status == "success"
+    # The finished pull invalidated the model list
+    assert registry.has('gemma:2b')
+    assert registry.ensure('gemma:2b') is not job
+
+
+def test_installed_model_is_not_pulled():
+    registry = ModelRegistry(Client(installed=['mistral']))
+    job = registry.ensure('mistral')
+    assert job.wait(5) and job.succeeded and job.status == "installed"
+
+
+def test_failed_pull_is_recorded_on_the_job():
+    client = Client(fail_with=OllamaError(500, "pull model manifest: file does not exist"))
+    registry = ModelRegistry(client)
+    job = registry.pull_in_background('nonexistent')
+    client.step.release()
+    assert job.wait(5) and not job.succeeded
+    assert job.error == "pull model manifest: file does not exist"
+    assert registry.pull_job('nonexistent') is job
@@ -0,0 +1,71 @@
+import pytest
+
+import near_duplicates
+from near_duplicates import NearDuplicateIndex
+from rag_system import RAGSystem
+
+
+def document(i, words=200):
+    return " ".join(f"term{i}x{j % 97}y{j}" for j in range(words))
+
+
+def test_edited_copy_is_rejected(tmp_path):
+    rag = RAGSystem(str(tmp_path))
+    original = document(1)
+    rag.add_document(original, "original")
+    with pytest.raises(ValueError, match="near duplicate of 'original'"):
+        rag.add_document(original.replace("term1x0y0", "changed", 1), "copy")
+    rag.store.close()
+
+
+def test_signatures_are_loaded_not_recomputed(tmp_path, monkeypatch):
+    rag = RAGSystem(str(tmp_path))
+    rag.add_documents([{'text': document(i), 'title': f"doc{i}"} for i in range(20)])
+    removed = rag.documents[0]['id']
+    rag.remove_document(removed)
+    rag.store.close()
+
+    hashed = []
+    signature = NearDuplicateIndex.signature
+    monkeypatch.setattr(NearDuplicateIndex, 'signature',
+                        lambda self, text: hashed.append(text) or signature(self, text))
+    rag = RAGSystem(str(tmp_path))
+    with pytest.raises(ValueError):
+        rag.add_document(document(5) + " extra", "copy")
+    # Only the new document was hashed; the stored ones came from signatures.bin
+    assert len(hashed) == 1
+    assert removed not in rag.near_duplicates()
+    # A removed document no longer blocks its text
+    assert rag.add_document(document(0), "again")
+    rag.store.close()
+
+
+def test_documents_without_signatures_are_hashed_once(tmp_path):
+    rag = RAGSystem(str(tmp_path), near_duplicate_threshold=None)
+    rag.add_documents([{'text': document(i), 'title': f"doc{i}"} for i in range(5)])
+    rag.store.close()
+
+    rag = RAGSystem(str(tmp_path))
+    assert len(rag.near_duplicates()) == 5
+    rag.store.close()
+    doc_ids, signatures = rag.store.load_signatures(128)
+    assert sorted(doc_ids) == sorted(doc['id'] for doc in rag.documents)
+    assert signatures.shape == (5, 128)
+
+
+def test_compaction_drops_removed_signatures(tmp_path):
+    rag = RAGSystem(str(tmp_path), compact_ratio=None)
+    ids = rag.add_documents([{'text': document(i), 'title': f"doc{i}"} for i in range(6)])
+    for doc_id in ids[:3]:
+        rag.remove_document(doc_id)
+    rag.compact()
+    rag.store.close()
+    assert sorted(rag.store.load_signatures(128)[0]) == sorted(ids[3:])
+
+
+def test_long_documents_are_hashed_in_chunks(monkeypatch):
+    index = NearDuplicateIndex()
+    text = document(1, words=1000)
+    whole = index.signature(text)
+    monkeypatch.setattr(near_duplicates, 'SIGNATURE_CHUNK', 64)
+    assert (index.signature(text) == whole).all()
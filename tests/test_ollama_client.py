@@ -0,0 +1,57 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import ollama_agent
+from ollama_client import OllamaClient
+
+
+@pytest.fixture
+def unavailable():
+    """Server answering every request with 503, counting them per method"""
+    counts = {'GET': 0, 'POST': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _unavailable(self):
+            counts[self.command] += 1
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_GET = do_POST = _unavailable
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", counts
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_post_is_not_retried_by_default(unavailable):
+    base_url, counts = unavailable
+    client = OllamaClient(base_url, retries=2, backoff_factor=0)
+    assert client.get('/api/tags').status_code == 503
+    assert client.post('/api/generate', {}).status_code == 503
+    assert counts == {'GET': 3, 'POST': 1}
+
+
+def test_post_retries_are_opt_in(unavailable):
+    base_url, counts = unavailable
+    client = OllamaClient(base_url, retries=2, backoff_factor=0, retry_posts=True)
+    assert client.post('/api/generate', {}).status_code == 503
+    assert counts['POST'] == 3
+
+
+def test_generate_reply_reports_timeouts(monkeypatch):
+    class Client:
+        def post(self, path, payload):
+            raise requests.exceptions.ReadTimeout("read timed out after 60 s")
+
+    monkeypatch.setattr(ollama_agent, 'get_client', lambda base_url: Client())
+    assert ollama_agent.generate_reply("hello").startswith("❌ Request to Ollama failed")
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from fake_gmail import FakeGmailService, FakeMailbox, http_error
+from gmail_fetcher import message_to_email
+from outbox import Outbox
+
+
+@pytest.fixture
+def mailbox():
+    return FakeMailbox.generate(4)
+
+
+def inbox(mailbox):
+    return [message_to_email(mailbox.messages[message_id]) for message_id in mailbox.order]
+
+
+def queued(path, emails, thread=True, **options):
+    outbox = Outbox(path, **options)
+    for email in emails:
+        outbox.add(email if thread else dict(email, threadId=None), f"Thanks for your note about {email['subject']}")
+    return outbox
+
+
+def crash_mid_flush(outbox, service, send):
+    """Claim every row as flush does, send the first ``send`` of them, then die before recording anything"""
+    rows = outbox._claim(100, time.time() + 1)
+    for row in rows[:send]:
+        body = {'raw': row['raw']}
+        if row['thread_id']:
+            body['threadId'] = row['thread_id']
+        service.users().messages().send(userId='me', body=body).execute()
+    outbox.close()
+
+
+def sent_copies(mailbox):
+    return len(mailbox.matching(['SENT']))
+
+
+def test_crash_after_send_is_found_in_the_thread_while_search_lags(tmp_path, mailbox):
+    service = FakeGmailService(mailbox, search_lag=3600)
+    path = str(tmp_path / 'outbox.sqlite')
+    crash_mid_flush(queued(path, inbox(mailbox)), service, send=2)
+
+    outbox = Outbox(path, search_lag=0)
+    report = outbox.flush(service)
+    assert report['reconciled'] == 2
+    assert sent_copies(mailbox) == 4
+    assert outbox.counts()['sent'] == 4
+
+
+def test_unthreaded_row_waits_for_search_instead_of_resending(tmp_path, mailbox):
+    service = FakeGmailService(mailbox, search_lag=3600)
+    path = str(tmp_path / 'outbox.sqlite')
+    crash_mid_flush(queued(path, inbox(mailbox)[:1], thread=False), service, send=1)
+
+    outbox = Outbox(path)
+    assert outbox.reconcile(service) == {'sent': 0, 'pending': 0, 'unknown': 1}
+    assert outbox.flush(service)['sent'] == 0
+    assert sent_copies(mailbox) == 1
+
+    # Once search has indexed the send the row is settled without a second copy
+    service.search_lag = 0
+    assert outbox.reconcile(service)['sent'] == 1
+    assert sent_copies(mailbox) == 1
+
+
+def test_unsent_row_is_requeued_after_the_search_lag(tmp_path, mailbox):
+    service = FakeGmailService(mailbox)
+    path = str(tmp_path / 'outbox.sqlite')
+    crash_mid_flush(queued(path, inbox(mailbox)[:1]), service, send=0)
+
+    outbox = Outbox(path)
+    assert outbox.flush(service)['sent'] == 0
+    outbox.search_lag = 0
+    assert outbox.reconcile(service)['pending'] == 1
+    outbox.flush(service)
+    assert sent_copies(mailbox) == 1
+    assert outbox.counts()['sent'] == 1
+
+
+def test_send_that_fails_after_delivery_is_reconciled_not_resent(tmp_path, mailbox):
+    service = FakeGmailService(mailbox, search_lag=3600)
+    methods = service.users().messages()._methods
+    send = methods['send']
+
+    def send_then_fail(**kwargs):
+        send(**kwargs)
+        raise http_error(503, "Backend Error")
+
+    methods['send'] = send_then_fail
+    outbox = queued(str(tmp_path / 'outbox.sqlite'), inbox(mailbox)[:2])
+    report = outbox.flush(service)
+    assert report['unknown'] == 2 and report['sent'] == 0
+    assert outbox.counts()['sending'] == 2
+
+    methods['send'] = send
+    report = outbox.flush(service)
+    assert report['reconciled'] == 2
+    assert sent_copies(mailbox) == 2
@@ -0,0 +1,25 @@
+from prompt_budget import PromptBudget, estimate_tokens
+
+
+def test_text_context_is_not_labelled():
+    budget = PromptBudget(num_ctx=4096)
+    context = "From 'Refunds':\nRefunds are issued within five business days."
+    _, fitted = budget.fit("Where is my refund?", context, num_predict=500)
+    assert fitted == context
+
+
+def test_text_context_is_cut_to_its_share():
+    budget = PromptBudget(num_ctx=400, margin=0, body_share=0.5)
+    body = " ".join(["word"] * 300)
+    context = " ".join(["policy"] * 300)
+    fitted_body, fitted = budget.fit(body, context, num_predict=100)
+    assert "From 'Context'" not in fitted
+    assert fitted.startswith("policy policy")
+    assert estimate_tokens(fitted_body) + estimate_tokens(fitted) <= 300
+
+
+def test_passages_are_labelled_with_their_titles():
+    budget = PromptBudget(num_ctx=4096)
+    passages = [{'title': "Refunds", 'content': "Refunds take five days.", 'similarity': 0.4}]
+    _, fitted = budget.fit("Where is my refund?", passages, num_predict=500)
+    assert fitted == "From 'Refunds':\nRefunds take five days."
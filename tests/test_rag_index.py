@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from rag_index import IncrementalTfidfIndex, Retriever, compare_with_refit
+from rag_system import RAGSystem
+
+
+def test_retriever_subclasses_must_implement_the_interface():
+    class AddOnly(Retriever):
+        def add(self, key, text):
+            pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        AddOnly()
+
+
+TOPICS = ("invoice payment terms", "warehouse delivery schedule", "contract renewal notice", "refund policy",
+          "security audit findings", "quarterly budget forecast")
+
+
+def passage(i):
+    return f"{TOPICS[i % len(TOPICS)]} item{i} " + " ".join(f"{TOPICS[(i * j) % len(TOPICS)]} word{j}"
+                                                          for j in range(i % 5 + 1))
+
+
+def test_incremental_index_matches_a_refit_after_every_change():
+    rng = random.Random(0)
+    index = IncrementalTfidfIndex(compact_ratio=0.5)
+    texts = {}
+    queries = list(TOPICS) + ["item3 word2", "unknown words only"]
+    for step in range(60):
+        if texts and rng.random() < 0.4:
+            key = rng.choice(sorted(texts))
+            assert index.remove(key)
+            del texts[key]
+        else:
+            texts[step] = passage(step)
+            index.add(step, texts[step])
+        report = compare_with_refit(index, texts, queries)
+        assert report['ok'], (step, report)
+
+
+def test_rag_system_verifies_after_adds_and_removes(tmp_path):
+    rag = RAGSystem(str(tmp_path), near_duplicate_threshold=None)
+    ids = []
+    for i in range(8):
+        ids.append(rag.add_document(" ".join(passage(i * 7 + j) for j in range(20)), f"doc{i}"))
+        assert rag.verify_index(list(TOPICS))['ok']
+    for doc_id in ids[::2]:
+        rag.remove_document(doc_id)
+        assert rag.verify_index(list(TOPICS))['ok']
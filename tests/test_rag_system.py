@@ -0,0 +1,34 @@
+from rag_system import RAGSystem
+
+
+def passages(rag, query):
+    return [(passage['title'], passage['content']) for passage in rag.get_relevant_passages(query, max_results=5)]
+
+
+def test_cached_query_sees_every_knowledge_base_change(tmp_path):
+    cached = RAGSystem(str(tmp_path / 'cached'), compact_ratio=None, near_duplicate_threshold=None)
+    uncached = RAGSystem(str(tmp_path / 'uncached'), compact_ratio=None, near_duplicate_threshold=None,
+                         query_cache_size=None)
+    rags = (cached, uncached)
+    query = "refund policy for damaged parcels"
+    for rag in rags:
+        rag.add_document("Refunds are issued for damaged parcels within five days.", "Refunds")
+        rag.add_document("Our warehouse ships every weekday.", "Shipping")
+    assert passages(cached, query) == passages(uncached, query)
+
+    # A closer document is ranked first by the next identical query
+    for rag in rags:
+        doc_id = rag.add_document("Refund policy: damaged parcels get a full refund.", "Refund policy")
+    assert passages(cached, query)[0][0] == "Refund policy"
+    assert passages(cached, query) == passages(uncached, query)
+
+    for rag in rags:
+        rag.remove_document(doc_id)
+    assert "Refund policy" not in [title for title, _ in passages(cached, query)]
+    assert passages(cached, query) == passages(uncached, query)
+
+    # Compaction rewrites the store, so cached passage offsets would be stale
+    for rag in rags:
+        rag.compact()
+    assert passages(cached, query) == passages(uncached, query)
+    assert cached.query_cache_stats()['hits'] > 0
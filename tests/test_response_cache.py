@@ -0,0 +1,61 @@
+from response_cache import LRUCache, ResponseCache
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the oldest
+    cache.put('c', 3)
+    assert 'b' not in cache and cache.get('a') == 1 and cache.get('c') == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 0, 1)
+    assert cache.get('b', 'missing') == 'missing' and cache.misses == 1
+
+
+def test_lru_expires_entries_after_ttl():
+    cache = LRUCache(max_entries=2, ttl=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None and len(cache) == 0
+
+
+def test_disk_hits_are_promoted_into_memory(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    cache = ResponseCache(max_entries=1, path=path)
+    cache.put('llama3:8b', "first prompt", {'temperature': 0}, "first reply")
+    cache.put('llama3:8b', "second prompt", {'temperature': 0}, "second reply")
+    # The first entry was evicted from memory but is still on disk
+    assert cache.get('llama3:8b', "first prompt", {'temperature': 0}) == "first reply"
+    assert cache.get('llama3:8b', "first prompt", {'temperature': 0}) == "first reply"
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['memory_evictions']) == (1, 1, 2)
+    assert stats['disk_entries'] == 2
+    cache.close()
+
+    # A new process starts with an empty memory tier and the same disk tier
+    reopened = ResponseCache(path=path)
+    assert reopened.get('llama3:8b', "second prompt", {'temperature': 0}) == "second reply"
+    assert reopened.stats()['disk_hits'] == 1
+    reopened.close()
+
+
+def test_key_depends_on_model_prompt_and_options():
+    key = ResponseCache.key('llama3:8b', "prompt", {'temperature': 0, 'num_ctx': 4096})
+    assert key == ResponseCache.key('llama3:8b', "prompt", {'num_ctx': 4096, 'temperature': 0})
+    assert key != ResponseCache.key('mistral', "prompt", {'temperature': 0, 'num_ctx': 4096})
+    assert key != ResponseCache.key('llama3:8b', "prompt ", {'temperature': 0, 'num_ctx': 4096})
+    assert key != ResponseCache.key('llama3:8b', "prompt", {'temperature': 0.7, 'num_ctx': 4096})
+    assert ResponseCache.key('llama3:8b', "prompt") == ResponseCache.key('llama3:8b', "prompt", {})
+
+    cache = ResponseCache()
+    cache.put('llama3:8b', "prompt", {'temperature': 0}, "reply")
+    assert cache.get('mistral', "prompt", {'temperature': 0}) is None
+    assert cache.get('llama3:8b', "prompt", {'temperature': 0.7}) is None
+
+
+def test_invalidate_removes_both_tiers(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / 'responses.sqlite'))
+    cache.put('llama3:8b', "prompt", None, "reply")
+    cache.invalidate('llama3:8b', "prompt")
+    assert cache.get('llama3:8b', "prompt") is None
+    assert cache.stats()['disk_entries'] == 0
+    cache.close()
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from fake_gmail import FakeGmailService, FakeMailbox
+from gmail_fetcher import FetchError
+from gmail_handler import GmailHandler
+from near_duplicates import email_index
+from rag_system import RAGSystem
+from response_cache import LRUCache
+from test_gmail_fetcher import failing_get
+from triage import TriagePipeline, triage_inbox
+
+
+class Agent:
+    def __init__(self):
+        self.requests = 0
+
+    async def asuggest_action(self, email):
+        self.requests += 1
+        return "archive"
+
+    async def agenerate_summary(self, emails):
+        self.requests += 1
+        return f"summary of {emails[0]['id']}"
+
+    async def agenerate_reply(self, email, user_profile, context="", style="Professional"):
+        self.requests += 1
+        return f"reply to {email['id']}"
+
+    async def aclose(self):
+        pass
+
+
+def shipped(n):
+    return {'id': str(n), 'sender': "orders@shop.example.com", 'subject': f"Your order {n} has shipped",
+            'body': f"Your order {n} left our warehouse and should arrive within {n % 7 + 2} days."}
+
+
+def test_slow_consumer_stops_the_producer():
+    pulled = []
+
+    def emails():
+        for n in range(1000):
+            pulled.append(n)
+            yield shipped(n)
+
+    async def main():
+        pipeline = TriagePipeline(Agent(), concurrency=2, queue_size=4, tasks=('action',))
+        results = pipeline.run(emails())
+        await results.__anext__()
+        # The consumer stops reading; let the workers run as far as they can
+        for _ in range(200):
+            await asyncio.sleep(0)
+        await results.aclose()
+
+    asyncio.run(main())
+    # queue_size waiting, queue_size finished, one per worker and one in the producer's hand
+    assert len(pulled) <= 4 + 4 + 2 + 2
+
+
+def test_cluster_results_are_reused_across_batches():
+    agent, index, clusters = Agent(), email_index(), LRUCache(16)
+    first = triage_inbox(agent, [shipped(1)], near_duplicates=index, cluster_results=clusters)
+    second = triage_inbox(agent, [shipped(2)], near_duplicates=index, cluster_results=clusters)
+    assert agent.requests == 3
+    assert second[0]['reused_from'] == '1'
+    assert second[0]['reply'] == first[0]['reply']
+
+
+def test_emails_whose_body_failed_to_load_are_triaged_from_their_snippet(tmp_path):
+    mailbox = FakeMailbox.generate(16)
+    handler = GmailHandler(FakeGmailService(mailbox), units_per_second=None)
+    emails = handler.get_unread_emails(limit=10)
+    assert len(emails) > 1
+    failed = emails[0]['id']
+    failing_get(handler.service, {failed}, 503)
+    with pytest.raises(FetchError):
+        handler.load_bodies(emails)
+    assert 'body' not in emails[0] and all('body' in email for email in emails[1:])
+
+    rag = RAGSystem(str(tmp_path))
+    rag.add_document(emails[0]['snippet'], title="Notes")
+    results = triage_inbox(Agent(), emails, context_for=rag.passages_for_email)
+    assert [result['error'] for result in results] == [None] * len(emails)
+    assert all(result['reply'] for result in results)
+    assert rag.passages_for_email(emails[0])[0]['title'] == "Notes"
@@ -0,0 +1,179 @@
+import asyncio
+import time
+
+from near_duplicates import email_text
+from response_cache import LRUCache
+
+TRIAGE_TASKS = ('action', 'summary', 'reply')
+
+
+class TriagePipeline:
+    """Suggest an action, summarise and draft a reply for a batch of emails
+
+    Emails are pulled lazily into a bounded queue and handled by
+    ``concurrency`` workers, each keeping one Ollama request in flight, so
+    the server stays saturated without the whole batch being queued on it.
+    Finished results wait in a queue of the same size, so a slow consumer
+    stalls the workers, and a stalled worker pool stops the producer once
+    ``queue_size`` emails are waiting. Each email gets ``item_timeout`` seconds for all of
+    its tasks; results come back in input order whatever order they finish in.
+
+    With a ``near_duplicates`` index (see ``near_duplicates.email_index``)
+    every email is added to it, and an email in the same cluster as one
+    already triaged in this batch gets a copy of that email's results
+    instead of new Ollama requests; such results carry ``reused_from``, the
+    id of the email they were made for. Pass the same ``cluster_results``
+    cache (an ``LRUCache``) to later pipelines to reuse across batches too.
+    """
+
+    def __init__(self, agent, user_profile=None, concurrency=4, item_timeout=180, queue_size=None,
+                 tasks=TRIAGE_TASKS, style="Professional", context_for=None, near_duplicates=None,
+                 max_clusters=1024, cluster_results=None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        unknown = set(tasks) - set(TRIAGE_TASKS)
+        if unknown:
+            raise ValueError(f"Unknown triage tasks: {sorted(unknown)}")
+
+        self.agent = agent
+        self.user_profile = user_profile or {}
+        self.concurrency = concurrency
+        self.item_timeout = item_timeout
+        self.queue_size = queue_size or 2 * concurrency
+        self.tasks = tuple(tasks)
+        self.style = style
+        self.context_for = context_for
+        self.near_duplicates = near_duplicates
+        # cluster id -> (email id, task results) of the email that was triaged for the cluster
+        self._cluster_results = cluster_results if cluster_results is not None else LRUCache(max_clusters)
+        self._pending = {}
+
+    async def _run_tasks(self, email, result):
+        for task in self.tasks:
+            if task == 'action':
+                result['action'] = await self.agent.asuggest_action(email)
+            elif task == 'summary':
+                result['summary'] = await self.agent.agenerate_summary([email])
+            else:
+                context = self.context_for(email) if self.context_for else ""
+                result['reply'] = await self.agent.agenerate_reply(
+                    email, self.user_profile, context=context, style=self.style
+                )
+
+    async def _reuse_or_run(self, email, result, cluster):
+        """Copy the cluster's results, waiting for them if its first email is still running; else run"""
+        shared = self._cluster_results.get(cluster)
+        if shared is None and cluster in self._pending:
+            shared = await asyncio.shield(self._pending[cluster])
+            if shared is None:
+                # The first email failed; run this one on its own
+                return await self._run_tasks(email, result)
+        if shared is not None:
+            result['reused_from'] = shared[0]
+            result.update(shared[1])
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[cluster] = future
+        try:
+            await self._run_tasks(email, result)
+            shared = (email.get('id'), {task: result[task] for task in self.tasks})
+            self._cluster_results.put(cluster, shared)
+        finally:
+            del self._pending[cluster]
+            future.set_result(shared)
+
+    async def _triage_item(self, index, email):
+        result = {'index': index, 'email': email, 'error': None, 'reused_from': None}
+        result.update((task, None) for task in self.tasks)
+        started = time.perf_counter()
+        try:
+            cluster = None
+            if self.near_duplicates is not None:
+                cluster = self.near_duplicates.add(email.get('id', index), email_text(email))
+            if cluster is None:
+                work = self._run_tasks(email, result)
+            else:
+                work = self._reuse_or_run(email, result, cluster)
+            await asyncio.wait_for(work, self.item_timeout)
+        except asyncio.TimeoutError:
+            result['error'] = f"Timed out after {self.item_timeout}s"
+        except Exception as e:
+            result['error'] = str(e)
+        result['elapsed'] = time.perf_counter() - started
+        return result
+
+    async def run(self, emails):
+        """Async iterator over per-email results, in the order of ``emails``"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        finished = asyncio.Queue(maxsize=self.queue_size)
+
+        async def produce():
+            for index, email in enumerate(emails):
+                await queue.put((index, email))
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await finished.put(await self._triage_item(*item))
+
+        async def supervise():
+            error = None
+            try:
+                await producer
+            except asyncio.CancelledError:
+                # The consumer went away and cancels the workers too; the full queues would never drain
+                raise
+            except Exception as e:
+                error = e
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            await finished.put(None)
+            if error is not None:
+                raise error
+
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        supervisor = asyncio.create_task(supervise())
+
+        # Reorder buffer: hold results until every earlier email is done
+        buffered = {}
+        next_index = 0
+        try:
+            while True:
+                result = await finished.get()
+                if result is None:
+                    break
+                buffered[result['index']] = result
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+            await supervisor
+        finally:
+            for task in (producer, supervisor, *workers):
+                task.cancel()
+
+    async def triage(self, emails, on_result=None):
+        """Triage every email and return the results as a list"""
+        results = []
+        async for result in self.run(emails):
+            results.append(result)
+            if on_result:
+                on_result(result)
+        return results
+
+
+def triage_inbox(agent, emails, user_profile=None, concurrency=4, item_timeout=180, on_result=None, **options):
+    """Blocking wrapper around ``TriagePipeline.triage`` for synchronous callers"""
+    pipeline = TriagePipeline(agent, user_profile, concurrency, item_timeout, **options)
+
+    async def main():
+        try:
+            return await pipeline.triage(emails, on_result)
+        finally:
+            await agent.aclose()
+
+    return asyncio.run(main())